@@ -1,10 +1,16 @@
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
 from django.urls import path
 from django.shortcuts import render
 from datetime import date
-from .models import Currency, CurrencyExchangeRate, Provider
+from .models import Currency, CurrencyExchangeRate, HistoricalLoadJob, Provider
 from .forms import AdminCurrencyConverterForm
-from .services.exchange_rates import get_exchange_rate_data
+from .admin_changelist import (
+    EstimatedCountPaginator, ExchangedCurrencyListFilter, IndexedDatesQuerySet, ProviderListFilter,
+    SourceCurrencyListFilter
+)
+from .services.exchange_rates import get_exchange_rates_bulk
+from .services.job_queue import enqueue_job, retry_job
 from .admin_site import my_currency_admin_site
 
 class CurrencyAdmin(admin.ModelAdmin):
@@ -26,26 +32,33 @@ class CurrencyAdmin(admin.ModelAdmin):
 
     def converter_view(self, request):
         results = []
+        unavailable = []
         form = AdminCurrencyConverterForm(request.POST or None)
         
         if request.method == 'POST' and form.is_valid():
             source = form.cleaned_data['source_currency']
             amount = form.cleaned_data['amount']
-            targets = form.cleaned_data['target_currencies']
+            targets = list(form.cleaned_data['target_currencies'])
             
+            # Resolve every target in one pass: stored rates first, misses fetched concurrently
+            rates, missing = get_exchange_rates_bulk(
+                source.code, [target.code for target in targets], date.today()
+            )
             for target in targets:
-                rate = get_exchange_rate_data(source.code, target.code, date.today())
+                rate = rates.get(target.code)
                 if rate:
                     results.append({
                         'currency': target,
                         'rate': rate,
                         'converted': amount * rate
                     })
+            unavailable = [target for target in targets if target.code in missing]
         
         context = {
             **self.admin_site.each_context(request),
             'form': form,
             'results': results,
+            'unavailable': unavailable,
             'amount': form.cleaned_data.get('amount') if form.is_valid() else None,
             'source': form.cleaned_data.get('source_currency') if form.is_valid() else None,
             'title': 'Currency Converter'
@@ -53,21 +66,63 @@ class CurrencyAdmin(admin.ModelAdmin):
         return render(request, 'admin/currency_converter.html', context)
 
 class CurrencyExchangeRateAdmin(admin.ModelAdmin):
-    list_display = ('source_currency', 'exchanged_currency', 'valuation_date', 'rate_value', 'provider', 'created_at')
-    list_filter = ('valuation_date', 'source_currency', 'exchanged_currency', 'provider')
+    list_display = ('source_code', 'target_code', 'valuation_date', 'rate_value', 'provider', 'created_at')
+    list_filter = ('valuation_date', SourceCurrencyListFilter, ExchangedCurrencyListFilter, ProviderListFilter)
     date_hierarchy = 'valuation_date'
+    # The table can hold hundreds of millions of rows: list the denormalized
+    # codes (no join), page with estimated counts and skip the unfiltered total
+    paginator = EstimatedCountPaginator
+    show_full_result_count = getattr(settings, 'ADMIN_SHOW_FULL_RESULT_COUNT', False)
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        # Index-backed date hierarchy drill-down
+        return IndexedDatesQuerySet(model=queryset.model, query=queryset.query, using=queryset.db)
 
 class ProviderAdmin(admin.ModelAdmin):
     list_display = ('name', 'priority', 'is_active', 'updated_at')
     list_editable = ('priority', 'is_active')
     ordering = ('priority',)
 
+class HistoricalLoadJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'source_code', 'date_from', 'date_to', 'provider_name', 'status', 'progress_display',
+        'attempts', 'worker_id', 'heartbeat_at'
+    )
+    list_filter = ('status',)
+    fields = (
+        'source_code', 'target_codes', 'date_from', 'date_to', 'provider_name', 'spread', 'max_attempts',
+        'parent', 'status', 'attempts', 'worker_id', 'heartbeat_at', 'started_at', 'finished_at',
+        'total_cells', 'processed_cells', 'successful_cells', 'last_error'
+    )
+    readonly_fields = (
+        'parent', 'status', 'attempts', 'worker_id', 'heartbeat_at', 'started_at', 'finished_at',
+        'total_cells', 'processed_cells', 'successful_cells', 'last_error'
+    )
+    actions = ['retry_failed']
+
+    @admin.display(description='Progress')
+    def progress_display(self, obj):
+        return f"{obj.processed_cells}/{obj.total_cells} ({obj.progress:.0%})"
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            return super().save_model(request, obj, form, change)
+        # New jobs go through the queue (split into sub-jobs for long ranges)
+        enqueue_job(obj)
+
+    @admin.action(description='Retry failed jobs')
+    def retry_failed(self, request, queryset):
+        count = sum(retry_job(job) for job in queryset)
+        self.message_user(request, f"{count} jobs queued again.", messages.SUCCESS)
+
 from django.contrib.auth.models import User, Group
 
 # Register everything to the custom site instead of the default admin.site
 my_currency_admin_site.register(Currency, CurrencyAdmin)
 my_currency_admin_site.register(CurrencyExchangeRate, CurrencyExchangeRateAdmin)
 my_currency_admin_site.register(Provider, ProviderAdmin)
+my_currency_admin_site.register(HistoricalLoadJob, HistoricalLoadJobAdmin)
 my_currency_admin_site.register(User)
 my_currency_admin_site.register(Group)
 my_currency_admin_site.register(admin.models.LogEntry)
@@ -0,0 +1,161 @@
+"""
+Changelist helpers for browsing very large tables in the admin.
+
+- ``EstimatedCountPaginator`` pages with the planner's row estimate instead
+  of an exact ``COUNT(*)`` on PostgreSQL once the result is large.
+- ``IndexedDatesQuerySet`` answers the date hierarchy from MIN/MAX plus
+  one indexed existence probe per period instead of a DISTINCT over the
+  whole table.
+- The list filters take their choices from the in-memory registry instead
+  of ``SELECT DISTINCT`` on the rates table.
+"""
+import json
+import logging
+from datetime import date
+
+from django.conf import settings
+from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Max, Min, QuerySet
+from django.utils.functional import cached_property
+
+from .services.registry import registry
+
+logger = logging.getLogger(__name__)
+
+# Below this estimate the exact count is cheap enough
+DEFAULT_EXACT_COUNT_THRESHOLD = 10000
+# Above this number of periods the date hierarchy falls back to DISTINCT
+MAX_DATE_PROBES = 400
+
+
+def estimate_count(queryset):
+    """
+    Return PostgreSQL's estimate of the rows of ``queryset`` (``reltuples``
+    for the whole table, the EXPLAIN row estimate when filtered), or
+    ``None`` when no estimate is available.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    try:
+        with connection.cursor() as cursor:
+            if not queryset.query.where:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [connection.ops.quote_name(queryset.model._meta.db_table)]
+                )
+                row = cursor.fetchone()
+                # -1: never analyzed
+                return row[0] if row and row[0] >= 0 else None
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+    except DatabaseError as e:
+        logger.warning(f"Could not estimate the row count of {queryset.model.__name__}: {e}")
+        return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator using the planner's estimate when it exceeds
+    ADMIN_EXACT_COUNT_THRESHOLD rows; exact ``COUNT(*)`` otherwise.
+    """
+
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, QuerySet):
+            estimate = estimate_count(self.object_list)
+            threshold = getattr(settings, 'ADMIN_EXACT_COUNT_THRESHOLD', DEFAULT_EXACT_COUNT_THRESHOLD)
+            if estimate is not None and estimate > threshold:
+                return estimate
+        return super().count
+
+
+def _period_starts(first, last, kind):
+    """Yield the first day of each year/month/day period between two dates."""
+    if kind == 'year':
+        for year in range(first.year, last.year + 1):
+            yield date(year, 1, 1)
+    elif kind == 'month':
+        year, month = first.year, first.month
+        while (year, month) <= (last.year, last.month):
+            yield date(year, month, 1)
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    else:
+        for ordinal in range(first.toordinal(), last.toordinal() + 1):
+            yield date.fromordinal(ordinal)
+
+
+def _period_end(start, kind):
+    if kind == 'year':
+        return date(start.year + 1, 1, 1)
+    if kind == 'month':
+        return date(start.year + 1, 1, 1) if start.month == 12 else date(start.year, start.month + 1, 1)
+    return date.fromordinal(start.toordinal() + 1)
+
+
+class IndexedDatesQuerySet(QuerySet):
+    """
+    QuerySet whose ``dates()`` walks an indexed date column: the bounds come
+    from MIN/MAX and each candidate period is kept if an indexed range probe
+    (``EXISTS``) finds a row, instead of a DISTINCT over every row.
+    """
+
+    def dates(self, field_name, kind, order='ASC'):
+        if kind not in ('year', 'month', 'day'):
+            return super().dates(field_name, kind, order)
+        bounds = self.aggregate(first=Min(field_name), last=Max(field_name))
+        if bounds['first'] is None:
+            return []
+        periods = list(_period_starts(bounds['first'], bounds['last'], kind))
+        if len(periods) > MAX_DATE_PROBES:
+            return super().dates(field_name, kind, order)
+        found = [
+            start for start in periods
+            if self.filter(**{f'{field_name}__gte': start, f'{field_name}__lt': _period_end(start, kind)}).exists()
+        ]
+        return found if order == 'ASC' else found[::-1]
+
+
+class CurrencyListFilter(admin.SimpleListFilter):
+    """Currency choices from the registry; filters on the FK id."""
+    field_name = None
+
+    def lookups(self, request, model_admin):
+        return [(str(currency.pk), currency.code) for currency in registry.all_currencies()]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{f'{self.field_name}_id': self.value()})
+        return queryset
+
+
+class SourceCurrencyListFilter(CurrencyListFilter):
+    title = 'source currency'
+    parameter_name = 'source_currency'
+    field_name = 'source_currency'
+
+
+class ExchangedCurrencyListFilter(CurrencyListFilter):
+    title = 'exchanged currency'
+    parameter_name = 'exchanged_currency'
+    field_name = 'exchanged_currency'
+
+
+class ProviderListFilter(admin.SimpleListFilter):
+    """Provider choices from the registry instead of SELECT DISTINCT provider."""
+    title = 'provider'
+    parameter_name = 'provider'
+
+    def lookups(self, request, model_admin):
+        return [(provider.name, provider.name) for provider in registry.all_providers()]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(provider=self.value())
+        return queryset
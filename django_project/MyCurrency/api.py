@@ -1,9 +1,57 @@
-from datetime import datetime
+import math
+from datetime import datetime, time, timedelta
+from asgiref.sync import sync_to_async
 from rest_framework import viewsets, views, status, response
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import BigIntegerField, F
+from django.db.models.functions import Cast, Round
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from .models import Currency, CurrencyExchangeRate
-from .serializers import CurrencySerializer, CurrencyExchangeRateSerializer, ConvertAmountSerializer
-from .services.exchange_rates import get_exchange_rate_data
+from django.utils import timezone
+from .models import Currency, CurrencyExchangeRate, HistoricalLoadJob
+from .serializers import (
+    CurrencySerializer, CurrencyExchangeRateSerializer, ConvertAmountSerializer, RateAggregateSerializer,
+    AsOfRequestSerializer, AsOfResultSerializer, FilledExchangeRateSerializer, HistoricalLoadJobRequestSerializer,
+    HistoricalLoadJobSerializer, RateChangeSerializer
+)
+from .services.aggregations import BUCKETS, aggregate_rates
+from .services.as_of import AsOfRate, fill_gaps, fill_window_start, resolve_as_of
+from .services.change_feed import InvalidCursor, get_changes
+from .services.cross_rates import base_rate_vector, cross_rate_matrix
+from .services.exchange_rates import get_exchange_rate_data, schedule_rate_refresh
+from .services.job_queue import submit_historical_load
+from .services.rate_snapshot import get_rate_snapshot
+from .services.resolution import best_rates, provider_ranking_key
+from .caching import (
+    instance_validators, patch_currency_cache_control, patch_rate_range_cache_control, queryset_validators,
+    rate_range_cache
+)
+from .db_router import ReplicaReadMixin, replica_reads
+from .renderers import (
+    COLUMNAR_RENDERERS, DEFAULT_ARROW_BATCH_SIZE, RATE_SCALE, ColumnarRenderer, MsgPackRateRenderer, RateColumns,
+    StreamingColumnarRenderer
+)
+
+
+def _parse_date_range(request):
+    """
+    Parse ``date_from``/``date_to`` query params.
+
+    Returns (date_from, date_to, error_response); error_response is None when valid.
+    """
+    try:
+        date_from = datetime.strptime(request.query_params['date_from'], '%Y-%m-%d').date()
+        date_to = datetime.strptime(request.query_params['date_to'], '%Y-%m-%d').date()
+    except ValueError:
+        return None, None, response.Response(
+            {"error": "Invalid date format. Use YYYY-MM-DD."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return date_from, date_to, None
+
 
 class CurrencyViewSet(viewsets.ModelViewSet):
     """
@@ -12,10 +60,61 @@ class CurrencyViewSet(viewsets.ModelViewSet):
     queryset = Currency.objects.all().order_by('code')
     serializer_class = CurrencySerializer
 
-class ExchangeRateListView(views.APIView):
+    def list(self, request, *args, **kwargs):
+        with replica_reads():
+            return self._list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        with replica_reads():
+            return self._retrieve(request, *args, **kwargs)
+
+    def _list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        validators = queryset_validators(queryset, 'currencies', request.get_full_path())
+        not_modified = validators.not_modified_response(request)
+        if not_modified is not None:
+            return patch_currency_cache_control(validators.apply(not_modified))
+
+        list_response = super().list(request, *args, **kwargs)
+        return patch_currency_cache_control(validators.apply(list_response))
+
+    def _retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        validators = instance_validators(instance)
+        not_modified = validators.not_modified_response(request)
+        if not_modified is not None:
+            return patch_currency_cache_control(validators.apply(not_modified))
+
+        serializer = self.get_serializer(instance)
+        return patch_currency_cache_control(validators.apply(response.Response(serializer.data)))
+
+async def _async_chunks(chunks):
+    # Every step runs in the request's sync thread, where its database connection lives
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
+
+
+class ExchangeRateListView(ReplicaReadMixin, views.APIView):
     """
     API endpoint to retrieve a list of currency rates for a specific time period.
+
+    Besides JSON, bulk pulls can negotiate compact columnar formats
+    (Arrow IPC stream, Parquet, msgpack) through ``Accept`` or ``?format=``.
+    With ``fill_gaps=true`` (JSON only) days without a stored rate are filled
+    with the last known rate, flagged with ``is_filled``. ``resolution=best``
+    returns only the highest-priority provider's rate per (date, target)
+    instead of one row per provider.
     """
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, *COLUMNAR_RENDERERS]
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Errors are always reported as JSON, whatever format was negotiated
+        if response.status_code >= 400 and isinstance(getattr(request, 'accepted_renderer', None), ColumnarRenderer):
+            request.accepted_renderer = JSONRenderer()
+            request.accepted_media_type = JSONRenderer.media_type
+        return super().finalize_response(request, response, *args, **kwargs)
+
     def get(self, request):
         source_code = request.query_params.get('source_currency')
         date_from_str = request.query_params.get('date_from')
@@ -27,29 +126,276 @@ class ExchangeRateListView(views.APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        try:
-            date_from = datetime.strptime(date_from_str, '%Y-%m-%d').date()
-            date_to = datetime.strptime(date_to_str, '%Y-%m-%d').date()
-        except ValueError:
+        date_from, date_to, error = _parse_date_range(request)
+        if error:
+            return error
+
+        resolution = request.query_params.get('resolution', 'all')
+        if resolution not in ('all', 'best'):
             return response.Response(
-                {"error": "Invalid date format. Use YYYY-MM-DD."},
+                {"error": "Invalid resolution. Use 'all' or 'best'."},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        source_currency = get_object_or_404(Currency, code=source_code)
+        if request.query_params.get('fill_gaps', '').lower() in ('1', 'true', 'yes'):
+            return self._get_filled(request, source_code, date_from, date_to, resolution)
+
+        # The best rows depend on the provider priorities as well as on the rates
+        variant = f':best:{provider_ranking_key()}' if resolution == 'best' else ''
+
+        # Serve repeated windows from the server-side cache (JSON and columnar
+        # formats only, the browsable API is rendered per request)
+        renderer = request.accepted_renderer
+        cache_key = None
+        if isinstance(renderer, (JSONRenderer, ColumnarRenderer)):
+            cache_key = rate_range_cache.make_key(source_code, date_from, date_to, f'{renderer.format}{variant}')
+            cached = rate_range_cache.get_response(request, cache_key, date_to)
+            if cached is not None:
+                return cached
+
+        get_object_or_404(Currency, code=source_code)
         
-        # Pre-fetch could be optimized here, but standard filtering is sufficient for now
+        # Single-table query: the codes are denormalized onto the rates
         rates = CurrencyExchangeRate.objects.filter(
-            source_currency=source_currency,
+            source_code=source_code,
             valuation_date__range=[date_from, date_to]
-        ).select_related('exchanged_currency').order_by('valuation_date', 'exchanged_currency__code')
+        ).order_by('valuation_date', 'target_code')
+
+        # Answer conditional requests from a single aggregate, before any row is serialized
+        validators = queryset_validators(rates, f'rates{variant}', source_code, date_from, date_to)
+        not_modified = validators.not_modified_response(request)
+        if not_modified is not None:
+            return patch_rate_range_cache_control(validators.apply(not_modified), date_to)
+
+        if resolution == 'best':
+            rates = best_rates(rates)
         
-        serializer = CurrencyExchangeRateSerializer(rates, many=True)
-        return response.Response(serializer.data)
+        if isinstance(renderer, ColumnarRenderer):
+            # Scale rates to integers in SQL: no Decimal is built per row
+            rows = rates.annotate(
+                scaled_rate=Cast(Round(F('rate_value') * 10 ** RATE_SCALE), BigIntegerField())
+            ).values_list('valuation_date', 'target_code', 'scaled_rate', 'provider')
+            if isinstance(renderer, StreamingColumnarRenderer):
+                return self._stream_columnar(request, renderer, rows, cache_key, date_to, validators)
+            data = RateColumns(rows)
+        else:
+            data = CurrencyExchangeRateSerializer(rates, many=True).data
+        if cache_key is None:
+            return patch_rate_range_cache_control(validators.apply(response.Response(data)), date_to)
+
+        body = renderer.render(data, request.accepted_media_type, self.get_renderer_context())
+        rate_range_cache.set(cache_key, date_to, body, renderer.media_type, validators)
+        rendered = HttpResponse(body, content_type=renderer.media_type)
+        return patch_rate_range_cache_control(validators.apply(rendered), date_to)
+
+    def _stream_columnar(self, request, renderer, rows, cache_key, date_to, validators):
+        # Encoded batch by batch while the rows are read: memory stays bounded
+        # by one batch. The rows are read after the view returns, so pin the
+        # database picked now (the replica routing is scoped to the view)
+        batch_size = getattr(settings, 'RATES_COLUMNAR_BATCH_SIZE', DEFAULT_ARROW_BATCH_SIZE)
+        rows = rows.using(rows.db).iterator(chunk_size=batch_size)
+        chunks = rate_range_cache.set_streamed(
+            cache_key, date_to, renderer.stream(rows, batch_size), renderer.media_type, validators
+        )
+        if isinstance(request._request, ASGIRequest):
+            # Django would drain a sync iterator whole before sending it under ASGI
+            chunks = _async_chunks(chunks)
+        streamed = StreamingHttpResponse(chunks, content_type=renderer.media_type)
+        return patch_rate_range_cache_control(validators.apply(streamed), date_to)
+
+    def _get_filled(self, request, source_code, date_from, date_to, resolution):
+        if isinstance(request.accepted_renderer, ColumnarRenderer):
+            return response.Response(
+                {"error": "fill_gaps is only available for JSON output."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # Carried rates are picked by provider priority, whatever the resolution
+        variant = f'filled:{resolution}:{provider_ranking_key()}'
+        # Rates stored within the lookback window before date_from are carried
+        # into the range: writes there must change the validators and evict the entry
+        window_start = fill_window_start(date_from)
+        cache_key = rate_range_cache.make_key(source_code, date_from, date_to, variant, covers_from=window_start)
+        cached = rate_range_cache.get_response(request, cache_key, date_to)
+        if cached is not None:
+            return cached
+
+        get_object_or_404(Currency, code=source_code)
+        rows = FilledExchangeRateSerializer(
+            fill_gaps(source_code, date_from, date_to, best_only=resolution == 'best'), many=True
+        ).data
+        validators = queryset_validators(
+            CurrencyExchangeRate.objects.filter(source_code=source_code, valuation_date__range=[window_start, date_to]),
+            f'rates-{variant}', source_code, date_from, date_to
+        )
+        renderer = JSONRenderer()
+        body = renderer.render(rows, renderer.media_type)
+        rate_range_cache.set(cache_key, date_to, body, renderer.media_type, validators)
+        return patch_rate_range_cache_control(
+            validators.apply(HttpResponse(body, content_type=renderer.media_type)), date_to
+        )
+
+class ExchangeRateAsOfView(ReplicaReadMixin, views.APIView):
+    """
+    API endpoint resolving the last known rate on or before each requested
+    date, for many (source, target, date) lookups in one database query.
+    """
+    def post(self, request):
+        serializer = AsOfRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return response.Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        lookups = [
+            (item['source_currency'], item['exchanged_currency'], item['date'])
+            for item in serializer.validated_data['lookups']
+        ]
+        resolved = resolve_as_of(lookups, max_lookback_days=serializer.validated_data.get('max_lookback_days'))
+
+        results = []
+        for source_code, target_code, requested_date in lookups:
+            rate = resolved.get((source_code, target_code, requested_date))
+            results.append({
+                'source_currency': source_code,
+                'exchanged_currency': target_code,
+                'date': requested_date,
+                'rate': rate.rate_value if rate else None,
+                'valuation_date': rate.valuation_date if rate else None,
+                'provider': rate.provider if rate else None,
+            })
+        return response.Response(AsOfResultSerializer(results, many=True).data)
+
+class ExchangeRateChangesView(views.APIView):
+    """
+    API endpoint streaming rate inserts, updates and soft deletes
+    (tombstones) in commit order for downstream replicas. Pass back
+    ``next_cursor`` as ``cursor`` until ``has_more`` is false.
+    Read from the primary: replica lag would hide rows behind the cursor.
+    """
+    def get(self, request):
+        cursor = request.query_params.get('cursor')
+        since = None
+        try:
+            limit = int(request.query_params['limit']) if 'limit' in request.query_params else None
+            if limit is not None and limit < 1:
+                raise ValueError
+        except ValueError:
+            return response.Response(
+                {"error": "limit must be a positive integer."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not cursor and 'since' in request.query_params:
+            try:
+                since = datetime.fromisoformat(request.query_params['since'])
+            except ValueError:
+                return response.Response(
+                    {"error": "Invalid since format. Use an ISO 8601 datetime."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        try:
+            changes, next_cursor, has_more = get_changes(cursor=cursor, since=since, limit=limit)
+        except InvalidCursor as e:
+            return response.Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return response.Response({
+            'results': RateChangeSerializer(changes, many=True).data,
+            'next_cursor': next_cursor,
+            'has_more': has_more,
+        })
+
+class CrossRateMatrixView(ReplicaReadMixin, views.APIView):
+    """
+    API endpoint returning the N x N conversion matrix for a date, derived
+    from the base currency's rates with one query and a vectorized outer
+    division. ``rows``/``columns`` optionally restrict the currencies.
+    """
+    renderer_classes = [
+        *api_settings.DEFAULT_RENDERER_CLASSES,
+        *[r for r in COLUMNAR_RENDERERS if r is MsgPackRateRenderer],
+    ]
+
+    def get(self, request):
+        base_code = request.query_params.get('base')
+        date_str = request.query_params.get('date')
+
+        if not all([base_code, date_str]):
+            return response.Response(
+                {"error": "Missing parameters: base and date are required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            valuation_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+        except ValueError:
+            return response.Response(
+                {"error": "Invalid date format. Use YYYY-MM-DD."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        get_object_or_404(Currency, code=base_code)
+        vector = base_rate_vector(base_code, valuation_date)
+        available = sorted(vector)
+
+        def requested(param):
+            value = request.query_params.get(param)
+            return [c.strip() for c in value.split(',') if c.strip()] if value else available
+
+        row_codes = requested('rows')
+        column_codes = requested('columns')
+        missing = sorted({c for c in row_codes + column_codes if c not in vector})
+        row_codes = [c for c in row_codes if c in vector]
+        column_codes = [c for c in column_codes if c in vector]
+
+        return patch_rate_range_cache_control(response.Response({
+            "base": base_code,
+            "valuation_date": valuation_date.isoformat(),
+            "rows": row_codes,
+            "columns": column_codes,
+            "matrix": cross_rate_matrix(vector, row_codes, column_codes),
+            "missing": missing,
+        }), valuation_date)
+
+class ExchangeRateAggregateView(ReplicaReadMixin, views.APIView):
+    """
+    API endpoint returning open/high/low/close, mean and count of the rates per
+    period (day, week, month or year), computed by the database.
+    """
+    def get(self, request):
+        source_code = request.query_params.get('source_currency')
+        bucket = request.query_params.get('bucket', 'day')
+        targets_str = request.query_params.get('targets')
+
+        if not all([source_code, request.query_params.get('date_from'), request.query_params.get('date_to')]):
+            return response.Response(
+                {"error": "Missing parameters: source_currency, date_from, and date_to are required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if bucket not in BUCKETS:
+            return response.Response(
+                {"error": f"Invalid bucket. Use one of: {', '.join(BUCKETS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        date_from, date_to, error = _parse_date_range(request)
+        if error:
+            return error
+
+        get_object_or_404(Currency, code=source_code)
+        target_codes = [t.strip() for t in targets_str.split(',') if t.strip()] if targets_str else None
+
+        aggregates = aggregate_rates(source_code, date_from, date_to, bucket, target_codes)
+        serializer = RateAggregateSerializer(aggregates, many=True)
+        return patch_rate_range_cache_control(response.Response(serializer.data), date_to)
 
 class ConvertAmountView(views.APIView):
     """
     API endpoint that calculates the amount in a currency exchanged into a different currency.
+
+    If today's rate is not stored yet, the most recent rate within
+    RATES_STALE_MAX_AGE_HOURS is served immediately (``is_stale`` and its real
+    ``valuation_date`` in the response) while the providers are queried in
+    the background. Only pairs with no recent rate block on the providers.
     """
     def post(self, request):
         serializer = ConvertAmountSerializer(data=request.data)
@@ -60,16 +406,34 @@ class ConvertAmountView(views.APIView):
         target_code = serializer.validated_data['exchanged_currency']
         amount = serializer.validated_data['amount']
 
-        today = datetime.now().date()
+        now = datetime.now()
+        today = now.date()
+        max_stale_hours = getattr(settings, 'RATES_STALE_MAX_AGE_HOURS', 0)
         
-        rate_obj = CurrencyExchangeRate.objects.filter(
-            source_currency__code=source_code,
-            exchanged_currency__code=target_code,
-            valuation_date=today
-        ).first()
+        # Array lookup in the shared snapshot first (unless rates were written
+        # since it was built), then one query: today's rate or the latest one
+        # within the staleness window
+        lookup = (source_code, target_code, today)
+        snapshot = get_rate_snapshot()
+        snapshot_rate = snapshot.get_rate(*lookup) if snapshot else None
+        if snapshot_rate is not None:
+            rate_obj = AsOfRate(snapshot_rate, today, None)
+        else:
+            rate_obj = resolve_as_of([lookup], max_lookback_days=math.ceil(max_stale_hours / 24)).get(lookup)
+            if rate_obj and rate_obj.valuation_date < today:
+                # A rate ages from the end of its valuation date, when it stopped being current
+                age = now - datetime.combine(rate_obj.valuation_date + timedelta(days=1), time.min)
+                if age > timedelta(hours=max_stale_hours):
+                    rate_obj = None
 
+        valuation_date = today
+        is_stale = False
         if rate_obj:
             rate_value = rate_obj.rate_value
+            valuation_date = rate_obj.valuation_date
+            if valuation_date < today:
+                is_stale = True
+                schedule_rate_refresh(source_code, target_code, today)
         else:
             # Not in DB, fetch from resilient providers
             rate_value = get_exchange_rate_data(source_code, target_code, today)
@@ -88,5 +452,38 @@ class ConvertAmountView(views.APIView):
             "amount": float(amount),
             "rate": float(rate_value),
             "converted_amount": float(converted_amount),
-            "valuation_date": today.isoformat()
+            "valuation_date": valuation_date.isoformat(),
+            "is_stale": is_stale
         })
+
+
+class HistoricalLoadJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Queue historical loads and follow their progress.
+
+    POST submits a load (split into sub-jobs for long ranges) that
+    `run_job_worker` processes pick up; GET lists the submitted jobs, or
+    one job with its progress, throughput, errors and sub-jobs.
+    """
+    queryset = HistoricalLoadJob.objects.prefetch_related('subjobs').order_by('-created_at')
+    serializer_class = HistoricalLoadJobSerializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = queryset.filter(parent__isnull=True)
+            if self.request.query_params.get('status'):
+                queryset = queryset.filter(status=self.request.query_params['status'])
+        return queryset
+
+    def create(self, request):
+        serializer = HistoricalLoadJobRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return response.Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        job = submit_historical_load(
+            data['source_currency'], data['target_currencies'], data['date_from'], data['date_to'],
+            provider_name=data.get('provider', ''), spread=data['spread']
+        )
+        return response.Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED)
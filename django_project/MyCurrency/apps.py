@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class MycurrencyConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'MyCurrency'
+
+    def ready(self):
+        # Connect the cache invalidation receivers. The registry itself is
+        # loaded on first use: querying the database from ready() is
+        # discouraged by Django and breaks management commands run before
+        # the tables exist (migrate, makemigrations).
+        from . import signals  # noqa: F401
+        from . import tracing
+        tracing.install()
@@ -0,0 +1,248 @@
+"""
+HTTP caching helpers for the read endpoints.
+
+Validators are computed with a single aggregate query (latest ``updated_at``
+plus row count), so a client holding a fresh copy gets a 304 without the
+rows ever being loaded or serialized.
+
+Rate range responses are also kept server-side, as serialized bytes, in the
+cache framework (see ``RateRangeCache``).
+"""
+import hashlib
+import random
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+# Default max-age (seconds) for ranges that are entirely in the past
+DEFAULT_CLOSED_RANGE_MAX_AGE = 60 * 60 * 24
+# Default max-age (seconds) for ranges that include today (rates may still arrive)
+DEFAULT_OPEN_RANGE_MAX_AGE = 60
+DEFAULT_CURRENCY_MAX_AGE = 60 * 5
+# Default server-side lifetime (seconds) of cached closed ranges
+DEFAULT_CLOSED_RANGE_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+# Default size (bytes) above which a streamed response is not kept server-side
+DEFAULT_MAX_STREAMED_BODY = 8 * 1024 * 1024
+
+
+class Validators:
+    """
+    ETag / Last-Modified pair describing a set of rows.
+    """
+
+    def __init__(self, etag, last_modified):
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def last_modified_timestamp(self):
+        if self.last_modified is None:
+            return None
+        return int(self.last_modified.timestamp())
+
+    def not_modified_response(self, request):
+        """Return a 304/412 response if the client's copy is current, else ``None``."""
+        return get_conditional_response(
+            request, etag=self.etag, last_modified=self.last_modified_timestamp
+        )
+
+    def apply(self, response):
+        response['ETag'] = self.etag
+        if self.last_modified is not None:
+            response['Last-Modified'] = http_date(self.last_modified_timestamp)
+        return response
+
+
+def make_etag(*parts):
+    digest = hashlib.md5('|'.join(str(p) for p in parts).encode(), usedforsecurity=False).hexdigest()
+    return f'"{digest}"'
+
+
+def queryset_validators(queryset, *key_parts):
+    """
+    Build validators for ``queryset`` from its latest ``updated_at`` and row count.
+    """
+    stats = queryset.order_by().aggregate(last_modified=Max('updated_at'), count=Count('id'))
+    last_modified = stats['last_modified']
+    etag = make_etag(*key_parts, last_modified.isoformat() if last_modified else '', stats['count'])
+    return Validators(etag, last_modified)
+
+
+def instance_validators(instance):
+    """
+    Build validators for a single model instance.
+    """
+    etag = make_etag(instance._meta.label, instance.pk, instance.updated_at.isoformat())
+    return Validators(etag, instance.updated_at)
+
+
+def rate_range_max_age(date_to, today=None):
+    """
+    Return the max-age for a rate range: long for closed historical ranges,
+    short for ranges that include today (or the future).
+    """
+    today = today or date.today()
+    if date_to < today:
+        return getattr(settings, 'RATES_CLOSED_RANGE_MAX_AGE', DEFAULT_CLOSED_RANGE_MAX_AGE)
+    return getattr(settings, 'RATES_OPEN_RANGE_MAX_AGE', DEFAULT_OPEN_RANGE_MAX_AGE)
+
+
+def patch_rate_range_cache_control(response, date_to):
+    if date_to < date.today():
+        patch_cache_control(response, public=True, max_age=rate_range_max_age(date_to))
+    else:
+        patch_cache_control(response, public=True, max_age=rate_range_max_age(date_to), must_revalidate=True)
+    return response
+
+
+def patch_currency_cache_control(response):
+    max_age = getattr(settings, 'CURRENCIES_MAX_AGE', DEFAULT_CURRENCY_MAX_AGE)
+    patch_cache_control(response, public=True, max_age=max_age, must_revalidate=True)
+    return response
+
+
+class RateRangeCache:
+    """
+    Server-side cache of serialized rate range responses.
+
+    Entries are keyed by the normalized query (source, date range and any
+    output variant) and hold the rendered bytes together with their
+    validators. Targeted invalidation uses generation counters instead of
+    an index. Each source has one counter per calendar month, and an entry's
+    key embeds the counters of the months its range covers. Writing a rate
+    increments (``cache.incr``, atomic on shared backends) the counter of its
+    month, so the entries covering that date are no longer looked up. Those
+    entries then expire on their own, because every entry has a finite timeout.
+    Counters start at a random value, so a counter evicted from the cache
+    never comes back with a value an old entry was stored under.
+
+    Invalidation is per month, not per day: a write also drops the cached
+    ranges that cover other days of the same month, even when they do not
+    include the written date. This is deliberate. Building a key reads one
+    counter per month covered (a year-long range needs 12 instead of 366),
+    and rates are mostly written for today, which open ranges already
+    revalidate often. The cost is a few extra misses on ranges that share a
+    month with a fresh write.
+    """
+    KEY_PREFIX = 'mycurrency:rates'
+
+    @property
+    def _cache(self):
+        return caches[getattr(settings, 'RATES_CACHE_ALIAS', 'default')]
+
+    @property
+    def is_process_local(self):
+        """True when every process has its own copy (local memory), so other processes' writes must be pushed."""
+        return isinstance(self._cache, LocMemCache)
+
+    @staticmethod
+    def _months(first, last):
+        return range(first.year * 12 + first.month - 1, last.year * 12 + last.month)
+
+    def _generation_key(self, source_code=None, month=None):
+        if source_code is None:
+            return f"{self.KEY_PREFIX}:generation"
+        return f"{self.KEY_PREFIX}:generation:{source_code}:{month}"
+
+    def _generations(self, keys):
+        generations = self._cache.get_many(keys)
+        for key in keys:
+            if key not in generations:
+                # Random start: never reuses a value from before an eviction
+                self._cache.add(key, random.getrandbits(62), timeout=None)
+                generations[key] = self._cache.get(key)
+        return [generations[key] for key in keys]
+
+    def _bump(self, keys):
+        for key in keys:
+            try:
+                self._cache.incr(key)
+            except ValueError:
+                self._cache.add(key, random.getrandbits(62), timeout=None)
+
+    def make_key(self, source_code, date_from, date_to, variant='', covers_from=None):
+        """
+        Key of a cached range. ``covers_from`` extends the dates whose writes
+        must invalidate the entry before ``date_from`` (e.g. carried rates).
+        """
+        keys = [self._generation_key()] + [
+            self._generation_key(source_code, month) for month in self._months(covers_from or date_from, date_to)
+        ]
+        stamp = hashlib.md5(
+            ':'.join(str(g) for g in self._generations(keys)).encode(), usedforsecurity=False
+        ).hexdigest()[:16]
+        return f"{self.KEY_PREFIX}:{source_code}:{date_from.isoformat()}:{date_to.isoformat()}:{variant}:{stamp}"
+
+    def _timeout(self, date_to):
+        if date_to < date.today():
+            return getattr(settings, 'RATES_CACHE_CLOSED_RANGE_TIMEOUT', DEFAULT_CLOSED_RANGE_CACHE_TIMEOUT)
+        return getattr(settings, 'RATES_CACHE_OPEN_RANGE_TIMEOUT', DEFAULT_OPEN_RANGE_MAX_AGE)
+
+    def get_response(self, request, key, date_to):
+        """
+        Return a response built from the cached entry (a 304 when the client's
+        copy is current), or ``None`` on a miss.
+        """
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        validators = Validators(entry['etag'], entry['last_modified'])
+        cached_response = validators.not_modified_response(request)
+        if cached_response is None:
+            cached_response = HttpResponse(entry['body'], content_type=entry['content_type'])
+        return patch_rate_range_cache_control(validators.apply(cached_response), date_to)
+
+    def set(self, key, date_to, body, content_type, validators):
+        self._cache.set(key, {
+            'body': body,
+            'content_type': content_type,
+            'etag': validators.etag,
+            'last_modified': validators.last_modified,
+        }, timeout=self._timeout(date_to))
+
+    def set_streamed(self, key, date_to, chunks, content_type, validators):
+        """
+        Yield ``chunks`` and cache their concatenation once the stream is
+        exhausted, unless it grew beyond RATES_CACHE_MAX_STREAMED_BODY bytes
+        (those are only streamed, never held whole).
+        """
+        max_size = getattr(settings, 'RATES_CACHE_MAX_STREAMED_BODY', DEFAULT_MAX_STREAMED_BODY)
+        kept = []
+        size = 0
+        for chunk in chunks:
+            if kept is not None:
+                size += len(chunk)
+                if size <= max_size:
+                    kept.append(chunk)
+                else:
+                    kept = None
+            yield chunk
+        if kept is not None:
+            self.set(key, date_to, b''.join(kept), content_type, validators)
+
+    def invalidate(self, source_code, dates):
+        """
+        Invalidate the cached ranges of ``source_code`` that cover any of ``dates``.
+        """
+        months = {d.year * 12 + d.month - 1 for d in dates}
+        self._bump([self._generation_key(source_code, month) for month in sorted(months)])
+        return len(months)
+
+    def invalidate_between(self, source_code, first, last):
+        """Invalidate the cached ranges of ``source_code`` that overlap ``first``..``last``."""
+        months = self._months(first, last)
+        self._bump([self._generation_key(source_code, month) for month in months])
+        return len(months)
+
+    def clear(self):
+        """Invalidate every cached range."""
+        self._bump([self._generation_key()])
+
+
+rate_range_cache = RateRangeCache()
@@ -0,0 +1,122 @@
+"""
+Database router sending read-only endpoint traffic to read replicas.
+
+Reads go to a replica only inside ``replica_reads()`` (entered by the
+read-only API views); everything else, and any read that follows a write in
+the same context, stays on the primary. Replicas lagging more than
+REPLICA_MAX_LAG_SECONDS behind the primary are skipped.
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# Default seconds between replication lag checks of a replica
+DEFAULT_LAG_CHECK_INTERVAL = 5.0
+DEFAULT_MAX_LAG_SECONDS = 10.0
+
+_use_replicas = contextvars.ContextVar('use_replicas', default=False)
+_pinned_to_primary = contextvars.ContextVar('pinned_to_primary', default=False)
+
+_lag_lock = threading.Lock()
+_lag_cache = {}
+
+
+@contextmanager
+def replica_reads():
+    """Allow reads issued in this context to be served by a replica."""
+    use_token = _use_replicas.set(True)
+    pin_token = _pinned_to_primary.set(False)
+    try:
+        yield
+    finally:
+        _pinned_to_primary.reset(pin_token)
+        _use_replicas.reset(use_token)
+
+
+def pin_to_primary():
+    """Send the remaining reads of the current context to the primary (read-after-write)."""
+    _pinned_to_primary.set(True)
+
+
+def replica_lag(alias):
+    """
+    Return the replication lag of ``alias`` in seconds (0 for non-PostgreSQL
+    backends), or ``None`` if it cannot be determined. Cached per process.
+    """
+    interval = getattr(settings, 'REPLICA_LAG_CHECK_INTERVAL', DEFAULT_LAG_CHECK_INTERVAL)
+    now = time.monotonic()
+    with _lag_lock:
+        cached = _lag_cache.get(alias)
+        if cached and now - cached[0] < interval:
+            return cached[1]
+
+    connection = connections[alias]
+    lag = 0.0
+    if connection.vendor == 'postgresql':
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+                )
+                lag = float(cursor.fetchone()[0])
+        except DatabaseError as e:
+            logger.warning(f"Could not read replication lag of {alias}: {e}")
+            lag = None
+
+    with _lag_lock:
+        _lag_cache[alias] = (now, lag)
+    return lag
+
+
+def healthy_replicas():
+    max_lag = getattr(settings, 'REPLICA_MAX_LAG_SECONDS', DEFAULT_MAX_LAG_SECONDS)
+    replicas = []
+    for alias in getattr(settings, 'REPLICA_DATABASES', []):
+        lag = replica_lag(alias)
+        if lag is not None and lag <= max_lag:
+            replicas.append(alias)
+    return replicas
+
+
+class ReadReplicaRouter:
+    """
+    Route reads to a healthy replica inside ``replica_reads()``; writes, and
+    the reads that follow them, go to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _use_replicas.get() or _pinned_to_primary.get():
+            return DEFAULT_DB_ALIAS
+        replicas = healthy_replicas()
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+class ReplicaReadMixin:
+    """
+    View mixin serving the whole request from replicas (read-only endpoints).
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads():
+            return super().dispatch(request, *args, **kwargs)
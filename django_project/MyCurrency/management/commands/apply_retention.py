@@ -0,0 +1,61 @@
+"""
+Comando de Django para aplicar las políticas de retención del histórico de tasas.
+
+Uso:
+    python manage.py apply_retention
+    python manage.py apply_retention --max-seconds 300 --batch-size 2000
+    python manage.py apply_retention --restart
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from MyCurrency.services.retention import get_policies, run_retention
+
+
+class Command(BaseCommand):
+    help = 'Compacta y archiva las tasas antiguas según RATE_RETENTION_POLICIES, por lotes reanudables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Número aproximado de filas por lote (por defecto, RATE_RETENTION_BATCH_SIZE)'
+        )
+        parser.add_argument(
+            '--max-seconds',
+            type=float,
+            help='Tiempo máximo de ejecución; el trabajo pendiente continúa en la siguiente ejecución'
+        )
+        parser.add_argument(
+            '--archive-dir',
+            type=str,
+            help='Directorio de los ficheros archivados (por defecto, RATE_RETENTION_ARCHIVE_DIR)'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Compacta desde la tasa más antigua, ignorando el progreso guardado (tras cargar histórico antiguo)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            policies = get_policies()
+            results = run_retention(
+                policies=policies,
+                batch_size=options['batch_size'],
+                max_seconds=options['max_seconds'],
+                restart=options['restart'],
+                archive_dir=options['archive_dir'],
+            )
+        except (ImproperlyConfigured, OSError, RuntimeError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS('\n✓ Retención aplicada'))
+        for stats in results:
+            status = 'completa' if stats['complete'] else 'pendiente (continúa en la siguiente ejecución)'
+            self.stdout.write(
+                f"  - {stats['action']} antes de {stats['before']}: {stats['rows_deleted']} filas eliminadas "
+                f"en {stats['batches']} lotes, {status}"
+            )
+            for path in stats.get('archives', []):
+                self.stdout.write(f"      {path}")
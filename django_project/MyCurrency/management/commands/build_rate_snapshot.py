@@ -0,0 +1,56 @@
+"""
+Comando de Django para generar el snapshot mmap de la matriz de tasas.
+
+Uso:
+    python manage.py build_rate_snapshot --from 2024-01-01 --to 2024-12-31
+"""
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from MyCurrency.services.rate_snapshot import build_rate_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Genera el snapshot en memoria compartida (mmap) de las tasas almacenadas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from',
+            dest='date_from',
+            type=str,
+            help='Fecha de inicio en formato YYYY-MM-DD (por defecto, la primera tasa)'
+        )
+        parser.add_argument(
+            '--to',
+            dest='date_to',
+            type=str,
+            help='Fecha de fin en formato YYYY-MM-DD (por defecto, la última tasa)'
+        )
+        parser.add_argument(
+            '--path',
+            type=str,
+            default=getattr(settings, 'RATE_SNAPSHOT_PATH', None),
+            help='Ruta del fichero snapshot (por defecto, RATE_SNAPSHOT_PATH)'
+        )
+
+    def handle(self, *args, **options):
+        if not options['path']:
+            raise CommandError('Indique --path o configure RATE_SNAPSHOT_PATH')
+
+        try:
+            date_from = datetime.strptime(options['date_from'], '%Y-%m-%d').date() if options['date_from'] else None
+            date_to = datetime.strptime(options['date_to'], '%Y-%m-%d').date() if options['date_to'] else None
+        except ValueError:
+            raise CommandError('Las fechas deben estar en formato YYYY-MM-DD')
+
+        if date_from and date_to and date_from > date_to:
+            raise CommandError('La fecha de inicio debe ser anterior a la de fin')
+
+        snapshot = build_rate_snapshot(options['path'], date_from, date_to)
+
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Snapshot generado en {snapshot.path}'))
+        self.stdout.write(f"  - Versión: {snapshot.version}")
+        self.stdout.write(f"  - Monedas: {len(snapshot.codes)}")
+        self.stdout.write(f"  - Período: {snapshot.date_from} a {snapshot.date_to}")
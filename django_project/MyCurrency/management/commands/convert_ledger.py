@@ -0,0 +1,104 @@
+"""
+Comando de Django para convertir un libro de transacciones (CSV o Parquet) a una moneda.
+
+Uso:
+    python manage.py convert_ledger ledger.csv ledger_eur.csv --to EUR
+    python manage.py convert_ledger ledger.parquet ledger_eur.parquet --to EUR --workers 4
+"""
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from MyCurrency.services.ledger import DEFAULT_CHUNK_SIZE, DEFAULT_DECIMALS, LedgerError, convert_ledger
+
+
+class Command(BaseCommand):
+    help = (
+        'Convierte los importes de un libro de transacciones a una moneda con la tasa de su fecha '
+        '(o la última conocida), por bloques y con aritmética de punto fijo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', type=str, help='Fichero de entrada (.csv o .parquet)')
+        parser.add_argument('output', type=str, help='Fichero de salida (.csv o .parquet)')
+        parser.add_argument(
+            '--to',
+            dest='target',
+            type=str,
+            required=True,
+            help='Código de la moneda destino (ej: EUR)'
+        )
+        parser.add_argument(
+            '--currency-column',
+            type=str,
+            default='currency',
+            help='Columna con el código de la moneda de cada importe'
+        )
+        parser.add_argument(
+            '--date-column',
+            type=str,
+            default='date',
+            help='Columna con la fecha (YYYY-MM-DD) de cada transacción'
+        )
+        parser.add_argument(
+            '--amount-column',
+            type=str,
+            default='amount',
+            help='Columna con el importe'
+        )
+        parser.add_argument(
+            '--decimals',
+            type=int,
+            default=DEFAULT_DECIMALS,
+            help='Decimales de los importes convertidos (redondeo half-even)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help='Filas por bloque'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Procesos que convierten bloques en paralelo'
+        )
+        parser.add_argument(
+            '--max-lookback-days',
+            type=int,
+            help='Días máximos que se arrastra la última tasa conocida'
+        )
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['input']):
+            raise CommandError(f'No existe el fichero {options["input"]}')
+        if options['chunk_size'] < 1 or options['workers'] < 1 or options['decimals'] < 0:
+            raise CommandError('--chunk-size y --workers deben ser positivos y --decimals no negativo')
+
+        self.stdout.write(self.style.NOTICE(
+            f'Convirtiendo {options["input"]} a {options["target"].upper()} '
+            f'({options["workers"]} procesos, bloques de {options["chunk_size"]} filas)...'
+        ))
+        try:
+            stats = convert_ledger(
+                options['input'],
+                options['output'],
+                options['target'],
+                currency_column=options['currency_column'],
+                date_column=options['date_column'],
+                amount_column=options['amount_column'],
+                decimals=options['decimals'],
+                chunk_size=options['chunk_size'],
+                workers=options['workers'],
+                max_lookback_days=options['max_lookback_days']
+            )
+        except LedgerError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Conversión completada: {options["output"]}'))
+        self.stdout.write(f"  - Filas: {stats['rows']} ({stats['chunks']} bloques)")
+        self.stdout.write(f"  - Convertidas: {stats['converted']}")
+        self.stdout.write(f"  - Sin tasa: {stats['missing_rate']}")
+        self.stdout.write(f"  - Inválidas: {stats['invalid']}")
+        self.stdout.write(f"  - Rendimiento: {stats['rows_per_second']:.0f} filas/s")
@@ -0,0 +1,55 @@
+"""
+Comando de Django para exportar el histórico de tasas a un fichero binario comprimido.
+
+Uso:
+    python manage.py export_rates --output rates.mcra --from 2024-01-01 --to 2024-12-31
+"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from MyCurrency.services.rate_archive import DEFAULT_CHUNK_ROWS, export_rates
+
+
+class Command(BaseCommand):
+    help = 'Exporta las tasas (y los registros de monedas y proveedores) a un fichero comprimido por bloques.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            type=str,
+            required=True,
+            help='Ruta del fichero de salida'
+        )
+        parser.add_argument(
+            '--from',
+            dest='date_from',
+            type=str,
+            help='Fecha de inicio en formato YYYY-MM-DD (opcional)'
+        )
+        parser.add_argument(
+            '--to',
+            dest='date_to',
+            type=str,
+            help='Fecha de fin en formato YYYY-MM-DD (opcional)'
+        )
+        parser.add_argument(
+            '--chunk-rows',
+            type=int,
+            default=DEFAULT_CHUNK_ROWS,
+            help='Número máximo de filas por bloque comprimido'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            date_from = datetime.strptime(options['date_from'], '%Y-%m-%d').date() if options['date_from'] else None
+            date_to = datetime.strptime(options['date_to'], '%Y-%m-%d').date() if options['date_to'] else None
+        except ValueError:
+            raise CommandError('Las fechas deben estar en formato YYYY-MM-DD')
+
+        chunks = export_rates(options['output'], date_from, date_to, chunk_rows=options['chunk_rows'])
+
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Exportación completada: {options["output"]}'))
+        self.stdout.write(f"  - Filas: {sum(c['rows'] for c in chunks)}")
+        self.stdout.write(f"  - Bloques: {len(chunks)}")
+        self.stdout.write(f"  - Particiones: {len({c['partition'] for c in chunks})}")
@@ -0,0 +1,56 @@
+"""
+Comando de Django para importar un fichero generado por export_rates.
+
+Uso:
+    python manage.py import_rates --input rates.mcra --workers 4
+    python manage.py import_rates --input rates.mcra --partitions 2024-01,2024-02
+    python manage.py import_rates --input rates.mcra --verify-only
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from MyCurrency.services.rate_archive import ArchiveError, RateArchiveReader, import_rates
+
+
+class Command(BaseCommand):
+    help = 'Importa tasas desde un fichero de export_rates (COPY en PostgreSQL, inserciones por lotes en otros).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--input',
+            type=str,
+            required=True,
+            help='Ruta del fichero a importar'
+        )
+        parser.add_argument(
+            '--partitions',
+            type=str,
+            help='Meses a importar separados por coma (ej: 2024-01,2024-02)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Número de bloques importados en paralelo'
+        )
+        parser.add_argument(
+            '--verify-only',
+            action='store_true',
+            help='Solo verifica los checksums, sin importar'
+        )
+
+    def handle(self, *args, **options):
+        partitions = [p.strip() for p in options['partitions'].split(',')] if options['partitions'] else None
+
+        try:
+            if options['verify_only']:
+                rows = RateArchiveReader(options['input']).verify()
+                self.stdout.write(self.style.SUCCESS(f'\n✓ Fichero verificado: {rows} filas'))
+                return
+            stats = import_rates(options['input'], partitions=partitions, workers=options['workers'])
+        except (ArchiveError, OSError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS('\n✓ Importación completada!'))
+        self.stdout.write(f"  - Filas: {stats['rows']}")
+        self.stdout.write(f"  - Bloques: {stats['chunks']}")
+        self.stdout.write(f"  - Particiones: {', '.join(stats['partitions'])}")
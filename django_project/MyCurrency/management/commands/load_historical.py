@@ -3,6 +3,8 @@ Comando de Django para cargar datos históricos de tasas de cambio de forma así
 
 Uso:
     python manage.py load_historical --source EUR --targets USD,GBP,CHF --from 2024-01-01 --to 2024-01-31
+    python manage.py load_historical --source EUR --targets USD --from 2024-01-01 --to 2024-01-31 --offline
+    python manage.py load_historical --source EUR --targets USD,GBP --from 2020-01-01 --to 2024-12-31 --spread
 """
 import asyncio
 from datetime import datetime
@@ -42,6 +44,21 @@ class Command(BaseCommand):
             required=True,
             help='Fecha de fin en formato YYYY-MM-DD'
         )
+        parser.add_argument(
+            '--provider',
+            type=str,
+            help='Usa solo este proveedor (por defecto, todos los activos por prioridad)'
+        )
+        parser.add_argument(
+            '--spread',
+            action='store_true',
+            help='Reparte los días entre los proveedores activos para usar sus cuotas en paralelo'
+        )
+        parser.add_argument(
+            '--offline',
+            action='store_true',
+            help='Usa solo las respuestas guardadas en la caché de proveedores (sin llamadas a la API)'
+        )
 
     def handle(self, *args, **options):
         source_code = options['source'].upper()
@@ -68,7 +85,10 @@ class Command(BaseCommand):
             source_code=source_code,
             target_codes=target_codes,
             date_from=date_from,
-            date_to=date_to
+            date_to=date_to,
+            provider_name=options['provider'],
+            offline=options['offline'],
+            spread=options['spread']
         ))
         
         self.stdout.write(self.style.SUCCESS(
@@ -77,6 +97,8 @@ class Command(BaseCommand):
         self.stdout.write(f"  - Peticiones totales: {stats['total_requests']}")
         self.stdout.write(f"  - Exitosas: {stats['successful']}")
         self.stdout.write(f"  - Fallidas: {stats['failed']}")
+        for provider, count in stats['by_provider'].items():
+            self.stdout.write(f"  - {provider}: {count}")
         
         if stats.get('note'):
             self.stdout.write(self.style.WARNING(f"  - Nota: {stats['note']}"))
@@ -0,0 +1,84 @@
+"""
+Comando de Django que procesa la cola de cargas históricas.
+
+Se pueden lanzar tantos procesos como se quiera: cada uno reclama trabajos con
+SELECT ... FOR UPDATE SKIP LOCKED, sin broker externo.
+
+Uso:
+    python manage.py run_job_worker
+    python manage.py run_job_worker --once
+"""
+import os
+import signal
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from MyCurrency.services.job_queue import claim_job, requeue_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = 'Procesa trabajos de carga histórica de la cola en base de datos (ejecutar N procesos en paralelo).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--worker-id',
+            type=str,
+            default=f'{socket.gethostname()}:{os.getpid()}',
+            help='Identificador del worker (por defecto, host:pid)'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5.0,
+            help='Segundos de espera cuando la cola está vacía'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Termina cuando no quedan trabajos pendientes'
+        )
+        parser.add_argument(
+            '--max-jobs',
+            type=int,
+            help='Número máximo de trabajos a procesar antes de terminar'
+        )
+
+    def handle(self, *args, **options):
+        worker_id = options['worker_id']
+        stopping = []
+
+        def stop(signum, frame):
+            # Terminate after the current job; an interrupted job would be retried anyway
+            self.stdout.write(self.style.WARNING('Parada solicitada, terminando el trabajo en curso...'))
+            stopping.append(signum)
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write(self.style.NOTICE(f'Worker {worker_id} iniciado'))
+        processed = 0
+        while not stopping:
+            close_old_connections()
+            requeue_stale_jobs()
+            job = claim_job(worker_id)
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f'  - Trabajo {job.pk}: {job}')
+            run_job(job)
+            job.refresh_from_db()
+            self.stdout.write(
+                f'    {job.status}: {job.successful_cells}/{job.total_cells} celdas'
+                + (f' ({job.last_error})' if job.last_error else '')
+            )
+            processed += 1
+            if options['max_jobs'] and processed >= options['max_jobs']:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Worker {worker_id} detenido: {processed} trabajos procesados'))
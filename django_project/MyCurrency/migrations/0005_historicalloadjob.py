@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MyCurrency', '0004_delete_currencyconverterproxy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoricalLoadJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('source_code', models.CharField(max_length=3)),
+                ('target_codes', models.JSONField(help_text='List of target currency codes.')),
+                ('date_from', models.DateField()),
+                ('date_to', models.DateField()),
+                ('provider_name', models.CharField(blank=True, default='', help_text='Empty: all active providers by priority.', max_length=50)),
+                ('spread', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('split', 'Split into sub-jobs'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField(default=3)),
+                ('run_after', models.DateTimeField(blank=True, help_text='Not claimed before this time (retry backoff).', null=True)),
+                ('worker_id', models.CharField(blank=True, default='', max_length=100)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('total_cells', models.PositiveIntegerField(default=0)),
+                ('processed_cells', models.PositiveIntegerField(default=0)),
+                ('successful_cells', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='subjobs', to='MyCurrency.historicalloadjob')),
+            ],
+            options={
+                'ordering': ['created_at', 'id'],
+                'indexes': [models.Index(fields=['status', 'run_after'], name='job_claim_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MyCurrency', '0005_historicalloadjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='currencyexchangerate',
+            index=models.Index(fields=['updated_at', 'id'], name='rate_changes_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+import MyCurrency.models
+
+# Rows updated per statement (and transaction) by the backfill
+BACKFILL_BATCH_SIZE = 50000
+
+
+def backfill_codes(apps, schema_editor):
+    Currency = apps.get_model('MyCurrency', 'Currency')
+    CurrencyExchangeRate = apps.get_model('MyCurrency', 'CurrencyExchangeRate')
+    rates = CurrencyExchangeRate.objects.using(schema_editor.connection.alias)
+    last_id = rates.aggregate(last=Max('id'))['last'] or 0
+    for start in range(0, last_id + 1, BACKFILL_BATCH_SIZE):
+        rates.filter(id__gte=start, id__lt=start + BACKFILL_BATCH_SIZE).update(
+            source_code=Subquery(Currency.objects.filter(pk=OuterRef('source_currency_id')).values('code')[:1]),
+            target_code=Subquery(Currency.objects.filter(pk=OuterRef('exchanged_currency_id')).values('code')[:1]),
+        )
+
+
+class Migration(migrations.Migration):
+    # Each backfill batch commits on its own
+    atomic = False
+
+    dependencies = [
+        ('MyCurrency', '0006_currencyexchangerate_changes_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='currencyexchangerate',
+            name='source_code',
+            field=MyCurrency.models.CurrencyCodeField(currency_field='source_currency', default=''),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='currencyexchangerate',
+            name='target_code',
+            field=MyCurrency.models.CurrencyCodeField(currency_field='exchanged_currency', default=''),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_codes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='currencyexchangerate',
+            index=models.Index(
+                fields=['source_code', 'target_code', 'valuation_date'], name='rate_pair_date_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='currencyexchangerate',
+            index=models.Index(fields=['source_code', 'valuation_date'], name='rate_source_date_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MyCurrency', '0007_currencyexchangerate_currency_codes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceState',
+            fields=[
+                ('key', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('value', models.JSONField(null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
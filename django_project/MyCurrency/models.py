@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 class ProtectedModel(models.Model):
@@ -14,6 +15,41 @@ class ProtectedModel(models.Model):
         abstract = True
 
 
+class CurrencyCodeField(models.CharField):
+    """
+    Copy of the code of the currency behind ``currency_field`` (a foreign
+    key), so hot queries filter, order and serialize rates without joining
+    ``Currency``. Filled in by ``pre_save``, which ``bulk_create`` also
+    calls; currency codes are immutable ISO codes, so the copy never goes
+    stale.
+    """
+
+    def __init__(self, *args, currency_field=None, **kwargs):
+        self.currency_field = currency_field
+        kwargs.setdefault('max_length', 3)
+        kwargs.setdefault('editable', False)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['currency_field'] = self.currency_field
+        if kwargs.get('max_length') == 3:
+            del kwargs['max_length']
+        if kwargs.get('editable') is False:
+            del kwargs['editable']
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        foreign_key = model_instance._meta.get_field(self.currency_field)
+        code = getattr(model_instance, self.attname)
+        # A loaded currency always wins; otherwise keep a code set by the
+        # writer and only fetch the currency when there is none
+        if foreign_key.is_cached(model_instance) or (not code and getattr(model_instance, foreign_key.attname)):
+            code = getattr(model_instance, self.currency_field).code
+            setattr(model_instance, self.attname, code)
+        return code
+
+
 class Currency(ProtectedModel):
     """
     Currency model representing available currencies in the system.
@@ -49,12 +85,21 @@ class CurrencyExchangeRate(ProtectedModel):
         max_digits=18
     )
     provider = models.CharField(max_length=50, db_index=True, default='unknown')
+    # Denormalized currency codes (see CurrencyCodeField)
+    source_code = CurrencyCodeField(currency_field='source_currency')
+    target_code = CurrencyCodeField(currency_field='exchanged_currency')
 
     class Meta:
         unique_together = ['source_currency', 'exchanged_currency', 'valuation_date', 'provider']
+        indexes = [
+            # Change feed cursor (services.change_feed)
+            models.Index(fields=['updated_at', 'id'], name='rate_changes_idx'),
+            models.Index(fields=['source_code', 'target_code', 'valuation_date'], name='rate_pair_date_idx'),
+            models.Index(fields=['source_code', 'valuation_date'], name='rate_source_date_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.source_currency.code} -> {self.exchanged_currency.code}: {self.rate_value} ({self.valuation_date}) via {self.provider}"
+        return f"{self.source_code} -> {self.target_code}: {self.rate_value} ({self.valuation_date}) via {self.provider}"
 
 
 class Provider(ProtectedModel):
@@ -70,3 +115,98 @@ class Provider(ProtectedModel):
     def __str__(self):
         status = "Active" if self.is_active else "Inactive"
         return f"{self.name} (Priority: {self.priority}, {status})"
+
+
+class HistoricalLoadJob(ProtectedModel):
+    """
+    Queued historical load, claimed by `run_job_worker` processes.
+    Large ranges are split into sub-jobs (``parent``) that run in parallel.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SPLIT = 'split'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SPLIT, 'Split into sub-jobs'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    parent = models.ForeignKey(
+        'self',
+        related_name='subjobs',
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE
+    )
+    source_code = models.CharField(max_length=3)
+    target_codes = models.JSONField(help_text="List of target currency codes.")
+    date_from = models.DateField()
+    date_to = models.DateField()
+    provider_name = models.CharField(max_length=50, blank=True, default='', help_text="Empty: all active providers by priority.")
+    spread = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(null=True, blank=True, help_text="Not claimed before this time (retry backoff).")
+    worker_id = models.CharField(max_length=100, blank=True, default='')
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    total_cells = models.PositiveIntegerField(default=0)
+    processed_cells = models.PositiveIntegerField(default=0)
+    successful_cells = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.source_code} -> {','.join(self.target_codes)} {self.date_from}..{self.date_to} ({self.status})"
+
+    @property
+    def progress(self):
+        """Fraction of cells processed (0..1)."""
+        return self.processed_cells / self.total_cells if self.total_cells else 0.0
+
+    @property
+    def throughput(self):
+        """Cells processed per second while running, or ``None`` before it starts."""
+        if not self.started_at:
+            return None
+        elapsed = ((self.finished_at or timezone.now()) - self.started_at).total_seconds()
+        return round(self.processed_cells / elapsed, 2) if elapsed > 0 else None
+
+
+class ServiceState(models.Model):
+    """
+    Small named values shared by every process: the registry version stamp,
+    cursors of resumable jobs.
+    """
+    key = models.CharField(max_length=100, primary_key=True)
+    value = models.JSONField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key} = {self.value}"
+
+    @classmethod
+    def get_value(cls, key, default=None):
+        value = cls.objects.filter(key=key).values_list('value', flat=True).first()
+        return default if value is None else value
+
+    @classmethod
+    def set_value(cls, key, value):
+        """Upsert ``key`` in a single statement."""
+        cls.objects.bulk_create(
+            [cls(key=key, value=value, updated_at=timezone.now())],
+            update_conflicts=True,
+            unique_fields=['key'],
+            update_fields=['value', 'updated_at']
+        )
@@ -0,0 +1,231 @@
+"""
+Compact columnar renderers for bulk rate pulls.
+
+Rates are delivered as dense columns instead of one JSON object per row:
+
+* ``valuation_date``: days since 1970-01-01 (Arrow ``date32``)
+* ``exchanged_currency_code`` / ``provider``: dictionary encoded
+* ``rate_value``: int64 scaled by ``10 ** RATE_SCALE`` (exact, the column has 6 decimals)
+
+Arrow and Parquet are encoded batch by batch from a row iterator, so a
+response is streamed with memory bounded by one batch whatever the range.
+msgpack is a single map and is built whole (``RateColumns``).
+
+The encoders are optional: each renderer is only offered when its library
+(``pyarrow`` / ``msgpack``) is installed.
+"""
+from datetime import date
+from itertools import islice
+
+from rest_framework.renderers import BaseRenderer
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - optional dependency
+    pyarrow = None
+
+# Number of decimals of CurrencyExchangeRate.rate_value
+RATE_SCALE = 6
+EPOCH = date(1970, 1, 1)
+DEFAULT_ARROW_BATCH_SIZE = 64 * 1024
+
+
+class RateColumns:
+    """
+    Column-oriented view of a rate listing, built from
+    (valuation_date, exchanged_currency_code, scaled_rate, provider) tuples.
+    """
+
+    def __init__(self, rows):
+        self.days = []
+        self.target_index = []
+        self.rates = []
+        self.provider_index = []
+        self.targets = []
+        self.providers = []
+        targets = {}
+        providers = {}
+        for valuation_date, target_code, scaled_rate, provider in rows:
+            self.days.append((valuation_date - EPOCH).days)
+            self.target_index.append(targets.setdefault(target_code, len(targets)))
+            self.rates.append(scaled_rate)
+            self.provider_index.append(providers.setdefault(provider, len(providers)))
+        self.targets = list(targets)
+        self.providers = list(providers)
+
+    def __len__(self):
+        return len(self.days)
+
+
+class ColumnarRenderer(BaseRenderer):
+    """
+    Base class for renderers of rate listings (a ``RateColumns`` instance, or
+    the row iterator of a ``StreamingColumnarRenderer``).
+    """
+    charset = None
+    render_style = 'binary'
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+
+class MsgPackRateRenderer(ColumnarRenderer):
+    media_type = 'application/x-msgpack'
+    format = 'msgpack'
+
+    @classmethod
+    def is_available(cls):
+        return msgpack is not None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, RateColumns):
+            return msgpack.packb(data, default=str)
+        return msgpack.packb({
+            'rate_scale': RATE_SCALE,
+            'epoch': EPOCH.isoformat(),
+            'valuation_date': data.days,
+            'exchanged_currency_code': {'dictionary': data.targets, 'indices': data.target_index},
+            'provider': {'dictionary': data.providers, 'indices': data.provider_index},
+            'rate_value': data.rates,
+        })
+
+
+class _Drain:
+    """Write-only file object handing over what the writers produced so far."""
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _arrow_batches(rows, batch_size):
+    """
+    Yield ``pyarrow.RecordBatch`` objects of at most ``batch_size`` rows read
+    from ``rows`` as they come. The code and provider dictionaries grow
+    across batches (each batch carries the dictionary so far, a delta for
+    the IPC writer), so only one batch is held in memory.
+    """
+    targets = {}
+    providers = {}
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            return
+        days, target_index, rates, provider_index = [], [], [], []
+        for valuation_date, target_code, scaled_rate, provider in chunk:
+            days.append((valuation_date - EPOCH).days)
+            target_index.append(targets.setdefault(target_code, len(targets)))
+            rates.append(scaled_rate)
+            provider_index.append(providers.setdefault(provider, len(providers)))
+        yield pyarrow.record_batch([
+            pyarrow.array(days, type=pyarrow.int32()).cast(pyarrow.date32()),
+            pyarrow.DictionaryArray.from_arrays(
+                pyarrow.array(target_index, type=pyarrow.int32()), pyarrow.array(list(targets), type=pyarrow.string())
+            ),
+            pyarrow.array(rates, type=pyarrow.int64()),
+            pyarrow.DictionaryArray.from_arrays(
+                pyarrow.array(provider_index, type=pyarrow.int32()), pyarrow.array(list(providers), type=pyarrow.string())
+            ),
+        ], schema=_arrow_schema())
+
+
+def _arrow_schema():
+    return pyarrow.schema([
+        ('valuation_date', pyarrow.date32()),
+        ('exchanged_currency_code', pyarrow.dictionary(pyarrow.int32(), pyarrow.string())),
+        ('rate_value', pyarrow.int64()),
+        ('provider', pyarrow.dictionary(pyarrow.int32(), pyarrow.string())),
+    ], metadata={'rate_scale': str(RATE_SCALE)})
+
+
+class StreamingColumnarRenderer(ColumnarRenderer):
+    """
+    Columnar renderer encoding (valuation_date, exchanged_currency_code,
+    scaled_rate, provider) rows batch by batch: ``stream()`` yields the
+    encoded bytes of each batch as soon as it is written.
+    """
+
+    def stream(self, rows, batch_size=DEFAULT_ARROW_BATCH_SIZE):
+        raise NotImplementedError
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        batch_size = (renderer_context or {}).get('batch_size', DEFAULT_ARROW_BATCH_SIZE)
+        return b''.join(self.stream(data, batch_size))
+
+
+class ArrowStreamRateRenderer(StreamingColumnarRenderer):
+    """
+    Arrow IPC stream: a schema message followed by record batches, so
+    clients can start decoding before the whole payload has arrived.
+    """
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+
+    @classmethod
+    def is_available(cls):
+        return pyarrow is not None
+
+    def stream(self, rows, batch_size=DEFAULT_ARROW_BATCH_SIZE):
+        drain = _Drain()
+        options = pyarrow.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+        with pyarrow.ipc.new_stream(pyarrow.PythonFile(drain, mode='w'), _arrow_schema(), options=options) as writer:
+            for batch in _arrow_batches(rows, batch_size):
+                writer.write_batch(batch)
+                yield drain.take()
+        yield drain.take()
+
+
+class ParquetRateRenderer(StreamingColumnarRenderer):
+    """
+    Parquet with one row group per batch. Row groups are sent as they are
+    written; the footer (the file's metadata) comes last.
+    """
+    media_type = 'application/vnd.apache.parquet'
+    format = 'parquet'
+
+    @classmethod
+    def is_available(cls):
+        return pyarrow is not None
+
+    def stream(self, rows, batch_size=DEFAULT_ARROW_BATCH_SIZE):
+        drain = _Drain()
+        with pyarrow.parquet.ParquetWriter(pyarrow.PythonFile(drain, mode='w'), _arrow_schema()) as writer:
+            for batch in _arrow_batches(rows, batch_size):
+                writer.write_batch(batch, row_group_size=batch_size)
+                yield drain.take()
+        yield drain.take()
+
+
+COLUMNAR_RENDERERS = [
+    renderer for renderer in (ArrowStreamRateRenderer, ParquetRateRenderer, MsgPackRateRenderer)
+    if renderer.is_available()
+]
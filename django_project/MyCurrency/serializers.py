@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from .models import Currency, CurrencyExchangeRate
+from .models import Currency, CurrencyExchangeRate, HistoricalLoadJob
+from .services.adapters import PROVIDERS
+from .services.registry import registry
 
 class CurrencySerializer(serializers.ModelSerializer):
     class Meta:
@@ -7,8 +9,8 @@ class CurrencySerializer(serializers.ModelSerializer):
         fields = ['id', 'code', 'name', 'symbol', 'is_active', 'created_at', 'updated_at']
 
 class CurrencyExchangeRateSerializer(serializers.ModelSerializer):
-    source_currency_code = serializers.ReadOnlyField(source='source_currency.code')
-    exchanged_currency_code = serializers.ReadOnlyField(source='exchanged_currency.code')
+    source_currency_code = serializers.ReadOnlyField(source='source_code')
+    exchanged_currency_code = serializers.ReadOnlyField(source='target_code')
 
     class Meta:
         model = CurrencyExchangeRate
@@ -17,7 +19,94 @@ class CurrencyExchangeRateSerializer(serializers.ModelSerializer):
             'valuation_date', 'rate_value', 'provider', 'created_at'
         ]
 
+class FilledExchangeRateSerializer(CurrencyExchangeRateSerializer):
+    is_filled = serializers.BooleanField(read_only=True)
+    filled_from = serializers.DateField(read_only=True)
+
+    class Meta(CurrencyExchangeRateSerializer.Meta):
+        fields = CurrencyExchangeRateSerializer.Meta.fields + ['is_filled', 'filled_from']
+
 class ConvertAmountSerializer(serializers.Serializer):
     source_currency = serializers.CharField(max_length=3)
     exchanged_currency = serializers.CharField(max_length=3)
     amount = serializers.DecimalField(max_digits=18, decimal_places=6)
+
+class RateAggregateSerializer(serializers.Serializer):
+    exchanged_currency_code = serializers.CharField(source='target_code')
+    period_start = serializers.DateField(source='bucket')
+    open = serializers.DecimalField(max_digits=18, decimal_places=6)
+    high = serializers.DecimalField(max_digits=18, decimal_places=6)
+    low = serializers.DecimalField(max_digits=18, decimal_places=6)
+    close = serializers.DecimalField(max_digits=18, decimal_places=6)
+    mean = serializers.DecimalField(max_digits=18, decimal_places=6)
+    count = serializers.IntegerField()
+
+class AsOfLookupSerializer(serializers.Serializer):
+    source_currency = serializers.CharField(max_length=3)
+    exchanged_currency = serializers.CharField(max_length=3)
+    date = serializers.DateField()
+
+class AsOfRequestSerializer(serializers.Serializer):
+    lookups = AsOfLookupSerializer(many=True, allow_empty=False, max_length=10000)
+    max_lookback_days = serializers.IntegerField(required=False, min_value=1)
+
+class AsOfResultSerializer(serializers.Serializer):
+    source_currency = serializers.CharField()
+    exchanged_currency = serializers.CharField()
+    date = serializers.DateField()
+    rate = serializers.DecimalField(max_digits=18, decimal_places=6, allow_null=True)
+    valuation_date = serializers.DateField(allow_null=True)
+    provider = serializers.CharField(allow_null=True)
+
+class RateChangeSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['upsert', 'delete'])
+    id = serializers.IntegerField()
+    source_currency = serializers.CharField()
+    exchanged_currency = serializers.CharField()
+    valuation_date = serializers.DateField()
+    provider = serializers.CharField()
+    rate_value = serializers.DecimalField(max_digits=18, decimal_places=6, allow_null=True)
+    updated_at = serializers.DateTimeField()
+
+class HistoricalLoadJobRequestSerializer(serializers.Serializer):
+    source_currency = serializers.CharField(max_length=3)
+    target_currencies = serializers.ListField(child=serializers.CharField(max_length=3), allow_empty=False)
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    provider = serializers.CharField(max_length=50, required=False, allow_blank=True)
+    spread = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, data):
+        if data['date_from'] > data['date_to']:
+            raise serializers.ValidationError("date_from must be before date_to.")
+        codes = [data['source_currency'], *data['target_currencies']]
+        unknown = sorted(set(codes) - set(registry.get_currencies(codes)))
+        if unknown:
+            raise serializers.ValidationError(f"Unknown currencies: {', '.join(unknown)}.")
+        if data.get('provider') and data['provider'] not in PROVIDERS:
+            raise serializers.ValidationError(f"Unknown provider: {data['provider']}.")
+        return data
+
+class HistoricalLoadSubJobSerializer(serializers.ModelSerializer):
+    progress = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = HistoricalLoadJob
+        fields = [
+            'id', 'date_from', 'date_to', 'status', 'attempts', 'worker_id', 'heartbeat_at',
+            'total_cells', 'processed_cells', 'successful_cells', 'progress', 'last_error'
+        ]
+
+class HistoricalLoadJobSerializer(serializers.ModelSerializer):
+    progress = serializers.FloatField(read_only=True)
+    throughput = serializers.FloatField(read_only=True, allow_null=True, help_text="Cells per second.")
+    subjobs = HistoricalLoadSubJobSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = HistoricalLoadJob
+        fields = [
+            'id', 'source_code', 'target_codes', 'date_from', 'date_to', 'provider_name', 'spread',
+            'status', 'attempts', 'max_attempts', 'worker_id', 'heartbeat_at', 'started_at', 'finished_at',
+            'total_cells', 'processed_cells', 'successful_cells', 'progress', 'throughput', 'last_error',
+            'created_at', 'subjobs'
+        ]
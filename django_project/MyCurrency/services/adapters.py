@@ -1,34 +1,86 @@
+import asyncio
+import json
+import logging
 import random
+import aiohttp
 import requests
 from abc import ABC, abstractmethod
+from datetime import date
 from decimal import Decimal
 from django.conf import settings
+from ..tracing import inject_headers, span
+from .provider_cache import OfflineCacheMiss, aread_through, is_offline, read_through
+
+logger = logging.getLogger(__name__)
 
 class BaseCurrencyProvider(ABC):
     """
     Abstract base class for all currency exchange rate providers.
+
+    ``get_rate`` serves the request path. Bulk loaders use ``aget_rates``,
+    which by default runs ``get_rate`` per target in threads; providers with
+    a native async or multi-symbol API override it. ``max_concurrency`` and
+    ``requests_per_second`` are the defaults for bulk loads, overridable per
+    provider with settings.PROVIDER_LOADER_LIMITS.
     """
+    max_concurrency = 4
+    requests_per_second = None
+
     @abstractmethod
     def get_rate(self, source_currency, exchanged_currency, valuation_date):
         pass
 
+    def is_available(self, offline=False):
+        """Whether the provider can serve requests (e.g. its credentials are configured)."""
+        return True
+
+    async def aget_rates(self, session, source_currency, exchanged_currencies, valuation_date, throttle, offline=False):
+        """
+        Return {target code: Decimal} for the targets the provider knows on
+        ``valuation_date``. ``throttle()`` is an async context manager to
+        wrap every call that reaches the provider. ``get_rate`` has no
+        response cache, so in offline mode nothing can be served:
+        ``OfflineCacheMiss`` is raised instead of calling it.
+        """
+        if offline or is_offline():
+            raise OfflineCacheMiss(
+                f"{type(self).__name__} has no cached responses for {source_currency} on {valuation_date}"
+            )
+
+        async def fetch(target):
+            async with throttle():
+                return target, await asyncio.to_thread(self.get_rate, source_currency, target, valuation_date)
+
+        results = await asyncio.gather(*(fetch(target) for target in exchanged_currencies))
+        return {target: rate for target, rate in results if rate is not None}
+
 class MockProvider(BaseCurrencyProvider):
     """
     A mock provider that returns random exchange rates for testing.
     """
+    max_concurrency = 100
+
     def get_rate(self, source_currency, exchanged_currency, valuation_date):
         # Generate a random rate between 0.5 and 2.0
         return Decimal(str(round(random.uniform(0.5, 2.0), 6)))
 
+    async def aget_rates(self, session, source_currency, exchanged_currencies, valuation_date, throttle, offline=False):
+        return {target: self.get_rate(source_currency, target, valuation_date) for target in exchanged_currencies}
+
 class CurrencyBeaconProvider(BaseCurrencyProvider):
     """
     Provider that integrates with the CurrencyBeacon API.
     """
     BASE_URL = "https://api.currencybeacon.com/v1/historical"
+    max_concurrency = 10
+    requests_per_second = 10
+
+    def is_available(self, offline=False):
+        return offline or bool(getattr(settings, 'CURRENCY_BEACON_API_KEY', None))
 
     def get_rate(self, source_currency, exchanged_currency, valuation_date):
         api_key = getattr(settings, 'CURRENCY_BEACON_API_KEY', None)
-        if not api_key:
+        if not api_key and not is_offline():
             return None
 
         params = {
@@ -38,21 +90,64 @@ class CurrencyBeaconProvider(BaseCurrencyProvider):
             'date': valuation_date.strftime('%Y-%m-%d')
         }
 
+        def fetch():
+            with span('http.get', kind='client', **{'http.url': self.BASE_URL}) as request_span:
+                response = requests.get(self.BASE_URL, params=params, headers=inject_headers(), timeout=10)
+                request_span.set_attribute('http.status_code', response.status_code)
+                response.raise_for_status()
+                return response.content
+
         try:
-            response = requests.get(self.BASE_URL, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            # CurrencyBeacon structure: data['response']['rates'][symbol]
-            response_data = data.get('response', {})
-            rate = response_data.get('rates', {}).get(exchanged_currency)
-            if rate is not None:
-                return Decimal(str(rate))
+            # Past days do not change: replay the raw response from the cache
+            body = read_through(self.BASE_URL, params, fetch, store=valuation_date < date.today())
+            return self.parse_rate(body, exchanged_currency)
+        except OfflineCacheMiss as e:
+            logger.warning(f"Offline mode: {e}")
         except (requests.RequestException, ValueError, KeyError):
             pass
         
         return None
 
+    async def aget_rates(self, session, source_currency, exchanged_currencies, valuation_date, throttle, offline=False):
+        """One request for all the targets of a day (``symbols`` takes a list)."""
+        params = {
+            'api_key': getattr(settings, 'CURRENCY_BEACON_API_KEY', ''),
+            'base': source_currency,
+            'symbols': ','.join(sorted(exchanged_currencies)),
+            'date': valuation_date.strftime('%Y-%m-%d')
+        }
+
+        async def fetch():
+            async with throttle():
+                with span('http.get', kind='client', **{'http.url': self.BASE_URL}) as request_span:
+                    async with session.get(
+                        self.BASE_URL, params=params, headers=inject_headers(), timeout=aiohttp.ClientTimeout(total=15)
+                    ) as response:
+                        request_span.set_attribute('http.status_code', response.status)
+                        if response.status != 200:
+                            logger.warning(f"API returned status {response.status} for {source_currency} on {valuation_date}")
+                            return None
+                        return await response.read()
+
+        body = await aread_through(self.BASE_URL, params, fetch, store=valuation_date < date.today(), offline=offline)
+        if body is None:
+            return {}
+        return self.parse_rates(body, exchanged_currencies)
+
+    @staticmethod
+    def parse_rates(body, exchanged_currencies):
+        """Extract {symbol: Decimal} from a raw API response body (absent symbols are left out)."""
+        data = json.loads(body)
+        # CurrencyBeacon structure: data['response']['rates'][symbol]
+        response_data = data.get('response', {})
+        rates = response_data.get('rates', {})
+        return {code: Decimal(str(rates[code])) for code in exchanged_currencies if rates.get(code) is not None}
+
+    @classmethod
+    def parse_rate(cls, body, exchanged_currency):
+        """Extract the rate from a raw API response body (``None`` if absent)."""
+        return cls.parse_rates(body, [exchanged_currency]).get(exchanged_currency)
+
 PROVIDERS = {
     'mock': MockProvider,
     'currency_beacon': CurrencyBeaconProvider,
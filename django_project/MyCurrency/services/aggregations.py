@@ -0,0 +1,63 @@
+"""
+Database-side aggregation of exchange rates per period.
+"""
+from django.db import connections
+from django.db.models import Avg, Count, DateField, F, Func, Max, Min, OuterRef, Subquery
+from django.db.models.functions import Trunc
+
+from ..models import CurrencyExchangeRate
+from .resolution import best_rates
+
+BUCKETS = ('day', 'week', 'month', 'year')
+
+
+def _first(expression, order_by):
+    """PostgreSQL ordered aggregate: the first ``expression`` of the group in ``order_by`` order."""
+    from django.contrib.postgres.aggregates import ArrayAgg
+    return Func(
+        ArrayAgg(expression, order_by=order_by), template='(%(expressions)s)[1]',
+        output_field=CurrencyExchangeRate._meta.get_field('rate_value')
+    )
+
+
+def aggregate_rates(source_code, date_from, date_to, bucket, target_codes=None):
+    """
+    Compute open/high/low/close, mean and count per (target currency, bucket).
+
+    Only the best provider's rate of each day counts (``best_rates``), so
+    providers are not mixed within a bucket. Everything is done by the
+    database in a single query: rows are bucketed with ``Trunc``
+    (``date_trunc`` on PostgreSQL, Django's SQL function on SQLite) and
+    grouped by (target, bucket). ``open``/``close`` are the first/last rate
+    of the bucket: an ordered ``array_agg`` on PostgreSQL, a correlated
+    subquery elsewhere. Weeks start on Monday.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"Invalid bucket '{bucket}'. Use one of: {', '.join(BUCKETS)}")
+
+    rates = CurrencyExchangeRate.objects.filter(
+        source_code=source_code,
+        valuation_date__range=[date_from, date_to]
+    )
+    if target_codes:
+        rates = rates.filter(target_code__in=target_codes)
+
+    best = CurrencyExchangeRate.objects.filter(pk__in=best_rates(rates).values('pk')).annotate(
+        bucket=Trunc('valuation_date', bucket, output_field=DateField()),
+    )
+    if connections[best.db].vendor == 'postgresql':
+        open_rate = _first('rate_value', F('valuation_date').asc())
+        close_rate = _first('rate_value', F('valuation_date').desc())
+    else:
+        same_bucket = best.filter(target_code=OuterRef('target_code'), bucket=OuterRef('bucket'))
+        open_rate = Subquery(same_bucket.order_by('valuation_date').values('rate_value')[:1])
+        close_rate = Subquery(same_bucket.order_by('-valuation_date').values('rate_value')[:1])
+
+    return best.values('target_code', 'bucket').annotate(
+        open=open_rate,
+        close=close_rate,
+        high=Max('rate_value'),
+        low=Min('rate_value'),
+        mean=Avg('rate_value'),
+        count=Count('id'),
+    ).order_by('target_code', 'bucket')
@@ -0,0 +1,198 @@
+"""
+As-of resolution over the rate time series.
+
+Weekends and holidays have no stored rows, so "the rate on D" means the last
+known rate on or before D. Both helpers below answer many of those lookups
+with a single query instead of one query per day.
+"""
+import logging
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router
+
+from ..models import CurrencyExchangeRate, Provider
+from .registry import registry
+from .resolution import best_rates
+
+logger = logging.getLogger(__name__)
+
+# How far back (days) a lookup may carry a rate forward
+DEFAULT_MAX_LOOKBACK_DAYS = 31
+
+AsOfRate = namedtuple('AsOfRate', ['rate_value', 'valuation_date', 'provider'])
+
+
+def _max_lookback(max_lookback_days):
+    if max_lookback_days is None:
+        max_lookback_days = getattr(settings, 'RATES_AS_OF_MAX_LOOKBACK_DAYS', DEFAULT_MAX_LOOKBACK_DAYS)
+    return max_lookback_days
+
+
+def fill_window_start(date_from, max_lookback_days=None):
+    """First date whose stored rates can show up in ``fill_gaps`` from ``date_from``."""
+    return date_from - timedelta(days=_max_lookback(max_lookback_days))
+
+
+def _provider_rank():
+    """Return a function giving the priority rank of a provider name (unknown providers last)."""
+    ranks = {p.name: i for i, p in enumerate(registry.active_providers())}
+    return lambda name: ranks.get(name, len(ranks))
+
+
+def resolve_as_of(lookups, max_lookback_days=None):
+    """
+    Resolve the last known rate on or before each requested date.
+
+    ``lookups`` is an iterable of (source_code, target_code, date). Returns a
+    dict mapping each resolvable lookup to an ``AsOfRate``; lookups with no
+    rate within ``max_lookback_days`` are left out. When several providers
+    stored a rate for the same day, the highest-priority one wins.
+    """
+    lookups = list(dict.fromkeys(lookups))
+    if not lookups:
+        return {}
+    max_lookback_days = _max_lookback(max_lookback_days)
+
+    connection = connections[router.db_for_read(CurrencyExchangeRate)]
+    if connection.vendor == 'postgresql':
+        return _resolve_as_of_lateral(connection, lookups, max_lookback_days)
+    return _resolve_as_of_portable(lookups, max_lookback_days)
+
+
+def _resolve_as_of_lateral(connection, lookups, max_lookback_days):
+    """
+    PostgreSQL: unnest the lookups and pick each one's row with an indexed
+    LATERAL ``ORDER BY valuation_date DESC LIMIT 1`` on the rate codes.
+    """
+    quote = connection.ops.quote_name
+    sql = f'''
+        SELECT l.idx, r.rate_value, r.valuation_date, r.provider
+        FROM unnest(%s::varchar[], %s::varchar[], %s::date[]) WITH ORDINALITY AS l(source_code, target_code, as_of, idx)
+        CROSS JOIN LATERAL (
+            SELECT r.rate_value, r.valuation_date, r.provider
+            FROM {quote(CurrencyExchangeRate._meta.db_table)} r
+            LEFT JOIN {quote(Provider._meta.db_table)} p ON p.name = r.provider AND p.is_active
+            WHERE r.source_code = l.source_code
+              AND r.target_code = l.target_code
+              AND r.valuation_date <= l.as_of
+              AND r.valuation_date >= l.as_of - %s
+            ORDER BY r.valuation_date DESC, p.priority ASC NULLS LAST, r.id ASC
+            LIMIT 1
+        ) r
+    '''
+    params = [
+        [source for source, _target, _date in lookups],
+        [target for _source, target, _date in lookups],
+        [as_of for _source, _target, as_of in lookups],
+        max_lookback_days,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return {
+        lookups[idx - 1]: AsOfRate(rate_value, valuation_date, provider)
+        for idx, rate_value, valuation_date, provider in rows
+    }
+
+
+def _resolve_as_of_portable(lookups, max_lookback_days):
+    """
+    Any backend: load the best row per day of all requested pairs in one
+    range query, then resolve each lookup with a binary search.
+    """
+    sources = {source for source, _target, _date in lookups}
+    targets = {target for _source, target, _date in lookups}
+    pairs = {(source, target) for source, target, _date in lookups}
+    lowest = min(as_of for _source, _target, as_of in lookups) - timedelta(days=max_lookback_days)
+    highest = max(as_of for _source, _target, as_of in lookups)
+
+    rows = best_rates(CurrencyExchangeRate.objects.filter(
+        source_code__in=sources,
+        target_code__in=targets,
+        valuation_date__range=[lowest, highest]
+    )).values_list(
+        'source_code', 'target_code', 'valuation_date', 'rate_value', 'provider'
+    )
+
+    best = {
+        (source, target, valuation_date): AsOfRate(rate_value, valuation_date, provider)
+        for source, target, valuation_date, rate_value, provider in rows
+        if (source, target) in pairs
+    }
+
+    series = {}
+    for (source, target, valuation_date), rate in sorted(best.items()):
+        dates, rates = series.setdefault((source, target), ([], []))
+        dates.append(valuation_date)
+        rates.append(rate)
+
+    resolved = {}
+    for source, target, as_of in lookups:
+        dates, rates = series.get((source, target), ((), ()))
+        position = bisect_right(dates, as_of)
+        if position and (as_of - dates[position - 1]).days <= max_lookback_days:
+            resolved[(source, target, as_of)] = rates[position - 1]
+    return resolved
+
+
+def fill_gaps(source_code, date_from, date_to, target_codes=None, max_lookback_days=None, best_only=False):
+    """
+    List the stored rates of ``source_code`` in the range and add, for every
+    target and day without a row, the last known rate carried forward. With
+    ``best_only`` a stored day lists only its highest-priority provider's rate.
+
+    Returns ``CurrencyExchangeRate`` instances ordered by (valuation_date,
+    target code), each with ``is_filled`` and ``filled_from`` (the date the
+    carried rate was stored for) attributes. Filled rows are not saved and
+    have no ``id``. Everything comes from one query.
+    """
+    max_lookback_days = _max_lookback(max_lookback_days)
+    rates = CurrencyExchangeRate.objects.filter(
+        source_code=source_code,
+        valuation_date__range=[fill_window_start(date_from, max_lookback_days), date_to]
+    ).order_by('valuation_date', 'id')
+    if target_codes:
+        rates = rates.filter(target_code__in=target_codes)
+
+    rank = _provider_rank()
+    by_day = {}
+    for rate in rates:
+        by_day.setdefault((rate.target_code, rate.valuation_date), []).append(rate)
+    target_codes = sorted({code for code, _day in by_day})
+
+    output = []
+    last_known = {}
+    day = min(date_from, *(d for _code, d in by_day)) if by_day else date_from
+    while day <= date_to:
+        for code in target_codes:
+            stored = by_day.get((code, day))
+            if stored:
+                stored.sort(key=lambda r: rank(r.provider))
+                last_known[code] = stored[0]
+                if day >= date_from:
+                    for rate in stored[:1] if best_only else stored:
+                        rate.is_filled = False
+                        rate.filled_from = None
+                        output.append(rate)
+                continue
+            carried = last_known.get(code)
+            if day < date_from or carried is None or (day - carried.valuation_date).days > max_lookback_days:
+                continue
+            filled = CurrencyExchangeRate(
+                source_currency_id=carried.source_currency_id,
+                exchanged_currency_id=carried.exchanged_currency_id,
+                source_code=carried.source_code,
+                target_code=carried.target_code,
+                valuation_date=day,
+                rate_value=carried.rate_value,
+                provider=carried.provider,
+                created_at=carried.created_at,
+            )
+            filled.is_filled = True
+            filled.filled_from = carried.valuation_date
+            output.append(filled)
+        day += timedelta(days=1)
+    return output
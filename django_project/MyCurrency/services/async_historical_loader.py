@@ -3,117 +3,199 @@ ASYNC HISTORICAL DATA LOADER
 ============================
 Module for asynchronous historical exchange rate data loading.
 Uses asyncio and aiohttp for concurrent fetching.
+
+Any adapter in PROVIDERS can be driven through its ``aget_rates`` batch
+interface. Providers are tried in ``Provider`` priority order for every
+(day, target) cell, falling back to the next one for the cells a provider
+could not serve. Each provider has its own concurrency and request-rate
+limits; in spread mode the days are distributed round-robin across the
+providers so a big backfill uses several quotas in parallel.
 """
 import asyncio
 import logging
+import time
+from contextlib import asynccontextmanager
 from datetime import date, timedelta
-from decimal import Decimal
 from typing import List, Optional
 
 import aiohttp
 from asgiref.sync import sync_to_async
 from django.conf import settings
 
-from ..models import Currency, CurrencyExchangeRate, Provider
+from ..models import CurrencyExchangeRate
+from ..signals import notify_rates_written
+from ..tracing import span, traced
+from .adapters import PROVIDERS as ADAPTER_CLASSES
+from .provider_cache import OfflineCacheMiss
+from .registry import registry
 
 logger = logging.getLogger(__name__)
 
-# Límite de peticiones concurrentes (evita saturar la API)
-MAX_CONCURRENT_REQUESTS = 10
 
+class ProviderThrottle:
+    """
+    Concurrency and request-rate limits of one provider during a load.
+    """
+
+    def __init__(self, max_concurrency, requests_per_second=None):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._lock = asyncio.Lock()
+        self._next_slot = 0.0
+
+    @asynccontextmanager
+    async def __call__(self):
+        async with self._semaphore:
+            if self._interval:
+                async with self._lock:
+                    now = time.monotonic()
+                    wait = self._next_slot - now
+                    self._next_slot = max(now, self._next_slot) + self._interval
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            yield
 
-async def fetch_rate_from_api(
-    session: aiohttp.ClientSession,
-    semaphore: asyncio.Semaphore,
-    source_code: str,
-    target_code: str,
-    valuation_date: date,
-    api_key: str,
-    provider_name: str
-) -> Optional[dict]:
+
+def _provider_limits(name, adapter):
+    limits = getattr(settings, 'PROVIDER_LOADER_LIMITS', {}).get(name, {})
+    return (
+        limits.get('max_concurrency', adapter.max_concurrency),
+        limits.get('requests_per_second', adapter.requests_per_second),
+    )
+
+
+@sync_to_async
+def _get_loader_providers(provider_name, offline):
+    """Return [(name, adapter)] of the active, usable providers in priority order."""
+    providers = []
+    for provider in registry.active_providers(provider_name):
+        adapter_class = ADAPTER_CLASSES.get(provider.name)
+        if not adapter_class:
+            logger.error(f"Adapter class not found for provider: {provider.name}")
+            continue
+        adapter = adapter_class()
+        if not adapter.is_available(offline=offline):
+            logger.warning(f"Provider {provider.name} is not available, skipping it.")
+            continue
+        providers.append((provider.name, adapter))
+    return providers
+
+
+async def _load_day(session, providers, throttles, source_code, target_codes, valuation_date, offline):
     """
-    Perform async HTTP request to fetch exchange rate.
+    Resolve the targets of one day, trying the providers in order; returns
+    the result dicts.
     """
-    async with semaphore:
-        url = "https://api.currencybeacon.com/v1/historical"
-        params = {
-            'api_key': api_key,
-            'base': source_code,
-            'symbols': target_code,
-            'date': valuation_date.strftime('%Y-%m-%d')
-        }
-        
+    remaining = list(target_codes)
+    results = []
+    for name, adapter in providers:
+        if not remaining:
+            break
         try:
-            async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=15)) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    # CurrencyBeacon structure: data['response']['rates'][symbol]
-                    response_data = data.get('response', {})
-                    rate = response_data.get('rates', {}).get(target_code)
-                    if rate is not None:
-                        return {
-                            'source_code': source_code,
-                            'target_code': target_code,
-                            'valuation_date': valuation_date,
-                            'rate_value': Decimal(str(rate)),
-                            'provider': provider_name
-                        }
-                else:
-                    logger.warning(f"API returned status {response.status} for {source_code}->{target_code} on {valuation_date}")
+            with span('loader.fetch', provider=name, source=source_code,
+                      valuation_date=valuation_date.isoformat(), targets=len(remaining)):
+                rates = await adapter.aget_rates(
+                    session, source_code, remaining, valuation_date, throttles[name], offline=offline
+                )
+        except OfflineCacheMiss:
+            logger.info(f"Not cached (offline): {name} {source_code} on {valuation_date}")
+            continue
         except asyncio.TimeoutError:
-            logger.error(f"Timeout fetching {source_code}->{target_code} on {valuation_date}")
+            logger.error(f"Timeout fetching {source_code} from {name} on {valuation_date}")
+            continue
         except Exception as e:
-            logger.exception(f"Error fetching rate: {e}")
-        
-        return None
+            logger.exception(f"Error fetching rates from {name}: {e}")
+            continue
+        for target in remaining:
+            if rates.get(target) is not None:
+                results.append({
+                    'source_code': source_code,
+                    'target_code': target,
+                    'valuation_date': valuation_date,
+                    'rate_value': rates[target],
+                    'provider': name
+                })
+        remaining = [target for target in remaining if rates.get(target) is None]
+    return results
 
 
+@traced('load_historical_rates')
 async def load_historical_rates(
     source_code: str,
     target_codes: List[str],
     date_from: date,
     date_to: date,
-    provider_name: str = 'currency_beacon'
+    provider_name: Optional[str] = None,
+    offline: bool = False,
+    spread: bool = False,
+    on_progress=None
 ) -> dict:
     """
     Asynchronously load historical exchange rates.
+
+    ``provider_name`` restricts the load to one provider; otherwise every
+    active provider is used by priority with per-cell fallback. ``spread``
+    gives each day a different first provider (round-robin). With
+    ``offline`` only cached provider responses are used (no API calls).
+    ``on_progress(processed_cells, successful_cells)`` is awaited after
+    each day is resolved.
     """
-    api_key = getattr(settings, 'CURRENCY_BEACON_API_KEY', None)
-    if not api_key:
-        logger.error("CURRENCY_BEACON_API_KEY not configured. Using mock data.")
-        # Fallback a mock si no hay API key
-        return await _load_mock_historical(source_code, target_codes, date_from, date_to)
-    
     dates = []
     current = date_from
     while current <= date_to:
         dates.append(current)
         current += timedelta(days=1)
-    
-    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    total = len(dates) * len(target_codes)
+
+    providers = await _get_loader_providers(provider_name, offline)
+    if not providers:
+        logger.error("No active provider available for the historical load.")
+        return {
+            'total_requests': total,
+            'successful': 0,
+            'failed': total,
+            'by_provider': {},
+            'date_range': f"{date_from} to {date_to}",
+            'currencies': target_codes,
+            'note': 'No active provider available'
+        }
+
+    throttles = {name: ProviderThrottle(*_provider_limits(name, adapter)) for name, adapter in providers}
     tasks = []
-    
+    progress = {'processed': 0, 'successful': 0}
+
+    async def load_day(*args):
+        results = await _load_day(*args)
+        progress['processed'] += len(target_codes)
+        progress['successful'] += len(results)
+        if on_progress is not None:
+            await on_progress(progress['processed'], progress['successful'])
+        return results
+
     async with aiohttp.ClientSession() as session:
-        for d in dates:
-            for target in target_codes:
-                task = fetch_rate_from_api(
-                    session, semaphore, source_code, target, d, api_key, provider_name
-                )
-                tasks.append(task)
-        
+        for index, d in enumerate(dates):
+            order = providers
+            if spread:
+                shift = index % len(providers)
+                order = providers[shift:] + providers[:shift]
+            tasks.append(load_day(session, order, throttles, source_code, target_codes, d, offline))
+
         # Ejecutar todas las tareas concurrentemente
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-    
-    # Filtrar resultados válidos
-    valid_results = [r for r in results if isinstance(r, dict)]
-    
+        day_results = await asyncio.gather(*tasks)
+
+    valid_results = [r for results in day_results for r in results]
+
     # Guardar en base de datos usando bulk_create para eficiencia
     await _save_rates_to_db(source_code, valid_results)
-    
+
+    by_provider = {}
+    for r in valid_results:
+        by_provider[r['provider']] = by_provider.get(r['provider'], 0) + 1
     stats = {
-        'total_requests': len(tasks),
+        'total_requests': total,
         'successful': len(valid_results),
-        'failed': len(tasks) - len(valid_results),
+        'failed': total - len(valid_results),
+        'by_provider': by_provider,
         'date_range': f"{date_from} to {date_to}",
         'currencies': target_codes
     }
@@ -121,73 +203,43 @@ async def load_historical_rates(
     return stats
 
 
-async def _load_mock_historical(
-    source_code: str,
-    target_codes: List[str],
-    date_from: date,
-    date_to: date
-) -> dict:
-    """Fallback: genera datos mock si no hay API key configurada."""
-    import random
-    
-    dates = []
-    current = date_from
-    while current <= date_to:
-        dates.append(current)
-        current += timedelta(days=1)
-    
-    results = []
-    for d in dates:
-        for target in target_codes:
-            results.append({
-                'source_code': source_code,
-                'target_code': target,
-                'valuation_date': d,
-                'rate_value': Decimal(str(round(random.uniform(0.5, 2.0), 6))),
-                'provider': 'mock'
-            })
-    
-    await _save_rates_to_db(source_code, results)
-    
-    return {
-        'total_requests': len(results),
-        'successful': len(results),
-        'failed': 0,
-        'date_range': f"{date_from} to {date_to}",
-        'currencies': target_codes,
-        'note': 'Using MOCK data (no API key configured)'
-    }
-
-
 @sync_to_async
+@traced('loader.save_rates')
 def _save_rates_to_db(source_code: str, results: List[dict]) -> int:
     """
     Save results to database using bulk_create.
     """
     if not results:
         return 0
-    
-    source_currency = Currency.objects.get(code=source_code)
-    
+
+    currencies = registry.get_currencies([source_code, *{r['target_code'] for r in results}])
+    source_currency = currencies.get(source_code)
+    if source_currency is None:
+        logger.warning(f"Currency {source_code} not found in DB, skipping.")
+        return 0
+
     # Preparar objetos para bulk_create
     rate_objects = []
     for r in results:
-        try:
-            target_currency = Currency.objects.get(code=r['target_code'])
-            rate_objects.append(CurrencyExchangeRate(
-                source_currency=source_currency,
-                exchanged_currency=target_currency,
-                valuation_date=r['valuation_date'],
-                rate_value=r['rate_value'],
-                provider=r['provider']
-            ))
-        except Currency.DoesNotExist:
+        target_currency = currencies.get(r['target_code'])
+        if target_currency is None:
             logger.warning(f"Currency {r['target_code']} not found in DB, skipping.")
-    
+            continue
+        rate_objects.append(CurrencyExchangeRate(
+            source_currency=source_currency,
+            exchanged_currency=target_currency,
+            valuation_date=r['valuation_date'],
+            rate_value=r['rate_value'],
+            provider=r['provider']
+        ))
+
     created = CurrencyExchangeRate.objects.bulk_create(
         rate_objects,
         ignore_conflicts=True
     )
-    
+    notify_rates_written(CurrencyExchangeRate, [
+        (source_code, r.exchanged_currency.code, r.valuation_date) for r in rate_objects
+    ])
+
     logger.info(f"Saved {len(created)} new exchange rates to database.")
     return len(created)
@@ -0,0 +1,84 @@
+"""
+Incremental change feed over ``CurrencyExchangeRate``.
+
+Rows are read in (updated_at, id) order from an index on those columns,
+starting after an opaque cursor, so a consumer only transfers what changed
+since its last call. Soft-deleted rows (``is_active=False``) are returned
+as tombstones. ``updated_at`` is set by the application before commit, so
+rows newer than CHANGE_FEED_SAFETY_LAG seconds are held back: a slow
+transaction committing an older timestamp cannot land behind a cursor that
+was already handed out. Hard deletes (retention) are not part of the feed.
+"""
+import base64
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import CurrencyExchangeRate
+
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_MAX_PAGE_SIZE = 10000
+DEFAULT_SAFETY_LAG_SECONDS = 5
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor cannot be decoded."""
+
+
+def encode_cursor(updated_at, pk):
+    return base64.urlsafe_b64encode(f"{updated_at.isoformat()}|{pk}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return (updated_at, id) from a cursor produced by ``encode_cursor``."""
+    try:
+        updated_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(updated_at), int(pk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+
+def get_changes(cursor=None, since=None, limit=None):
+    """
+    Return (changes, next_cursor, has_more).
+
+    ``changes`` are dicts in (updated_at, id) order with ``op`` = 'upsert'
+    or 'delete' (tombstone). Start after ``cursor``, or at ``since`` (an
+    aware datetime), or at the beginning of the table. ``next_cursor`` is
+    the position to resume from (the given cursor when nothing changed).
+    """
+    max_page = getattr(settings, 'CHANGE_FEED_MAX_PAGE_SIZE', DEFAULT_MAX_PAGE_SIZE)
+    limit = min(limit or DEFAULT_PAGE_SIZE, max_page)
+    lag = getattr(settings, 'CHANGE_FEED_SAFETY_LAG_SECONDS', DEFAULT_SAFETY_LAG_SECONDS)
+
+    rates = CurrencyExchangeRate.objects.filter(updated_at__lte=timezone.now() - timedelta(seconds=lag))
+    if cursor:
+        updated_at, pk = decode_cursor(cursor)
+        rates = rates.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=pk))
+    elif since:
+        rates = rates.filter(updated_at__gte=since)
+
+    rows = list(rates.order_by('updated_at', 'id').values(
+        'id', 'source_code', 'target_code', 'valuation_date', 'provider',
+        'rate_value', 'is_active', 'updated_at'
+    )[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    changes = [
+        {
+            'op': 'upsert' if row['is_active'] else 'delete',
+            'id': row['id'],
+            'source_currency': row['source_code'],
+            'exchanged_currency': row['target_code'],
+            'valuation_date': row['valuation_date'],
+            'provider': row['provider'],
+            'rate_value': row['rate_value'] if row['is_active'] else None,
+            'updated_at': row['updated_at'],
+        }
+        for row in rows
+    ]
+    next_cursor = encode_cursor(rows[-1]['updated_at'], rows[-1]['id']) if rows else cursor
+    return changes, next_cursor, has_more
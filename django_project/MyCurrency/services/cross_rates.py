@@ -0,0 +1,56 @@
+"""
+All-pairs cross-rate matrix computed from a single base-currency vector.
+"""
+from decimal import Decimal
+
+from ..models import CurrencyExchangeRate
+from .resolution import best_rates
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - optional dependency
+    numpy = None
+
+# Decimals kept in the matrix values
+MATRIX_DECIMALS = 8
+
+
+def base_rate_vector(base_code, valuation_date):
+    """
+    Return {code: Decimal} with the rate from ``base_code`` into every
+    currency stored for ``valuation_date`` (one query, best provider per
+    target). The base itself maps to 1.
+    """
+    rows = best_rates(CurrencyExchangeRate.objects.filter(
+        source_code=base_code,
+        valuation_date=valuation_date
+    )).values_list('target_code', 'rate_value')
+
+    vector = dict(rows)
+    vector[base_code] = Decimal(1)
+    return vector
+
+
+def cross_rate_matrix(vector, row_codes, column_codes):
+    """
+    Compute matrix[i][j], the rate from ``row_codes[i]`` into
+    ``column_codes[j]``, as ``base->column / base->row`` (vectorized outer
+    division with NumPy when available). Cells involving a stored rate that
+    is zero or negative have no meaningful cross rate and are None.
+    """
+    rows = [float(vector[code]) for code in row_codes]
+    columns = [float(vector[code]) for code in column_codes]
+    if numpy is not None:
+        row_array = numpy.array(rows, dtype=numpy.float64)
+        column_array = numpy.array(columns, dtype=numpy.float64)
+        valid = numpy.outer(row_array > 0, column_array > 0)
+        matrix = numpy.outer(1.0 / numpy.where(row_array > 0, row_array, 1.0), column_array)
+        matrix = numpy.round(matrix, MATRIX_DECIMALS).tolist()
+        return [
+            [value if ok else None for value, ok in zip(matrix_row, valid_row)]
+            for matrix_row, valid_row in zip(matrix, valid.tolist())
+        ]
+    return [
+        [round(column / row, MATRIX_DECIMALS) if row > 0 and column > 0 else None for column in columns]
+        for row in rows
+    ]
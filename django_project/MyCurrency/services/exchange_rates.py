@@ -1,41 +1,45 @@
+import contextvars
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import date
 from decimal import Decimal
-from django.db import transaction
-from ..models import Currency, CurrencyExchangeRate, Provider
+from django.conf import settings
+from django.db import connection
+from ..models import CurrencyExchangeRate
+from ..tracing import span, traced
 from .adapters import PROVIDERS as ADAPTER_CLASSES
+from .registry import registry
+from .resolution import best_rates
+from .write_behind import save_rate, upsert_rates, write_behind
 
 logger = logging.getLogger(__name__)
 
-def get_exchange_rate_data(source_currency_code, exchanged_currency_code, valuation_date, provider_name=None):
+# Default time budget (seconds) for resolving a batch of targets against the providers
+DEFAULT_BULK_TIME_BUDGET = 8.0
+DEFAULT_BULK_MAX_WORKERS = 16
+DEFAULT_REFRESH_MAX_WORKERS = 4
+
+_refresh_executor = None
+_refresh_lock = threading.Lock()
+_refresh_in_flight = set()
+
+
+def _get_active_providers(provider_name=None):
     """
-    Retrieves exchange rate data with resilience and priority.
-    
-    1. If a specific provider is requested, use only that one.
-    2. Otherwise, fetch all active providers from DB, ordered by priority.
-    3. Try each provider until one succeeds.
-    4. Save the successful rate to the database (caching).
+    Return the active providers to try, ordered by priority (served from the registry).
     """
-    
-    # Validation of currencies (optional but good practice)
-    try:
-        source_currency = Currency.objects.get(code=source_currency_code)
-        exchanged_currency = Currency.objects.get(code=exchanged_currency_code)
-    except Currency.DoesNotExist:
-        logger.error(f"Currency not found: {source_currency_code} or {exchanged_currency_code}")
-        return None
+    return registry.active_providers(provider_name)
 
-    # Determine which providers to try
-    if provider_name:
-        providers = Provider.objects.filter(name=provider_name, is_active=True)
-    else:
-        providers = Provider.objects.filter(is_active=True).order_by('priority')
 
-    if not providers.exists():
-        logger.warning("No active providers configured.")
-        return None
+def _fetch_from_providers(providers, source_currency_code, exchanged_currency_code, valuation_date):
+    """
+    Try each provider in order until one returns a rate.
 
-    # Try each provider in order
+    Returns a tuple (rate_value, provider_name) or (None, None). This function
+    only talks to the adapters, it never touches the database, so it is safe
+    to run from worker threads.
+    """
     for provider_model in providers:
         adapter_class = ADAPTER_CLASSES.get(provider_model.name)
         if not adapter_class:
@@ -43,23 +47,180 @@ def get_exchange_rate_data(source_currency_code, exchanged_currency_code, valuat
             continue
 
         try:
-            adapter = adapter_class()
-            rate_value = adapter.get_rate(source_currency_code, exchanged_currency_code, valuation_date)
-            
+            with span('provider.get_rate', provider=provider_model.name,
+                      pair=f'{source_currency_code}/{exchanged_currency_code}') as provider_span:
+                adapter = adapter_class()
+                rate_value = adapter.get_rate(source_currency_code, exchanged_currency_code, valuation_date)
+                provider_span.set_attribute('found', rate_value is not None)
             if rate_value is not None:
-                # Success! Save to database for future use (cache)
-                # using update_or_create to avoid duplicate records for the same day/provider
-                with transaction.atomic():
-                    rate_obj, created = CurrencyExchangeRate.objects.update_or_create(
-                        source_currency=source_currency,
-                        exchanged_currency=exchanged_currency,
-                        valuation_date=valuation_date,
-                        provider=provider_model.name,
-                        defaults={'rate_value': rate_value}
-                    )
-                return rate_value
+                return rate_value, provider_model.name
         except Exception as e:
             logger.exception(f"Error fetching rate from {provider_model.name}: {str(e)}")
             continue # Try the next one
 
-    return None
+    return None, None
+
+
+@traced('get_exchange_rate_data')
+def get_exchange_rate_data(source_currency_code, exchanged_currency_code, valuation_date, provider_name=None):
+    """
+    Retrieves exchange rate data with resilience and priority.
+
+    1. If a specific provider is requested, use only that one.
+    2. Otherwise, take all active providers from the registry, ordered by priority.
+    3. Try each provider until one succeeds.
+    4. Queue the successful rate for saving (write-behind) and return it.
+    """
+
+    # Validation of currencies (optional but good practice)
+    source_currency = registry.get_currency(source_currency_code)
+    exchanged_currency = registry.get_currency(exchanged_currency_code)
+    if source_currency is None or exchanged_currency is None:
+        logger.error(f"Currency not found: {source_currency_code} or {exchanged_currency_code}")
+        return None
+
+    # Determine which providers to try
+    providers = _get_active_providers(provider_name)
+    if not providers:
+        logger.warning("No active providers configured.")
+        return None
+
+    # Fetched moments ago and not flushed yet
+    pending = write_behind.get_pending(
+        source_currency_code, exchanged_currency_code, valuation_date, [p.name for p in providers]
+    )
+    if pending is not None:
+        return pending
+
+    rate_value, used_provider = _fetch_from_providers(
+        providers, source_currency_code, exchanged_currency_code, valuation_date
+    )
+    if rate_value is None:
+        return None
+
+    # Success! Save to database for future use (cache). The write happens
+    # off the request path, batched with other fetched rates.
+    save_rate(source_currency, exchanged_currency, valuation_date, used_provider, rate_value)
+    return rate_value
+
+
+def get_exchange_rates_bulk(source_currency_code, exchanged_currency_codes, valuation_date,
+                            provider_name=None, time_budget=None):
+    """
+    Resolve the rates from one source currency into many targets at once.
+
+    1. Load the best stored rate of each requested target in a single query.
+    2. Fetch the misses from the providers concurrently, bounded by a time budget.
+    3. Persist the fetched rates in one bulk upsert.
+
+    Returns a tuple (rates, missing) where ``rates`` maps target code to
+    ``Decimal`` and ``missing`` lists the targets that could not be resolved
+    (no provider answered or the time budget ran out).
+    """
+    target_codes = list(dict.fromkeys(exchanged_currency_codes))
+    if not target_codes:
+        return {}, []
+
+    if time_budget is None:
+        time_budget = getattr(settings, 'EXCHANGE_RATE_BULK_TIME_BUDGET', DEFAULT_BULK_TIME_BUDGET)
+
+    rates = {}
+    stored = best_rates(CurrencyExchangeRate.objects.filter(
+        source_code=source_currency_code,
+        target_code__in=target_codes,
+        valuation_date=valuation_date
+    )).values_list('target_code', 'rate_value')
+    rates.update(stored)
+
+    misses = [code for code in target_codes if code not in rates]
+    if not misses:
+        return rates, []
+
+    currencies = registry.get_currencies([source_currency_code, *misses])
+    source_currency = currencies.get(source_currency_code)
+    if source_currency is None:
+        logger.error(f"Currency not found: {source_currency_code}")
+        return rates, misses
+
+    providers = _get_active_providers(provider_name)
+    if not providers:
+        logger.warning("No active providers configured.")
+        return rates, misses
+
+    fetchable = [code for code in misses if code in currencies]
+    max_workers = getattr(settings, 'EXCHANGE_RATE_BULK_MAX_WORKERS', DEFAULT_BULK_MAX_WORKERS)
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(fetchable) or 1)))
+    # Each worker runs in a copy of the caller's context, so its spans join the trace
+    futures = {
+        executor.submit(
+            contextvars.copy_context().run,
+            _fetch_from_providers, providers, source_currency_code, code, valuation_date
+        ): code
+        for code in fetchable
+    }
+    done, not_done = wait(futures, timeout=time_budget)
+    # Do not block the caller on stragglers; their results are discarded
+    executor.shutdown(wait=False, cancel_futures=True)
+    if not_done:
+        logger.warning(
+            f"Time budget of {time_budget}s exhausted, {len(not_done)} targets left unresolved "
+            f"for {source_currency_code} on {valuation_date}"
+        )
+
+    fetched = []
+    for future in done:
+        code = futures[future]
+        rate_value, used_provider = future.result()
+        if rate_value is not None:
+            rates[code] = rate_value
+            fetched.append(CurrencyExchangeRate(
+                source_currency=source_currency,
+                exchanged_currency=currencies[code],
+                valuation_date=valuation_date,
+                rate_value=rate_value,
+                provider=used_provider
+            ))
+
+    upsert_rates(fetched)
+
+    missing = [code for code in target_codes if code not in rates]
+    return rates, missing
+
+
+def _get_refresh_executor():
+    global _refresh_executor
+    with _refresh_lock:
+        if _refresh_executor is None:
+            _refresh_executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'RATE_REFRESH_MAX_WORKERS', DEFAULT_REFRESH_MAX_WORKERS),
+                thread_name_prefix='rate-refresh'
+            )
+        return _refresh_executor
+
+
+def _refresh_rate(key):
+    try:
+        get_exchange_rate_data(*key)
+    except Exception as e:
+        logger.exception(f"Background refresh failed for {key}: {str(e)}")
+    finally:
+        with _refresh_lock:
+            _refresh_in_flight.discard(key)
+        # Worker threads own their connection; do not leak it
+        connection.close()
+
+
+def schedule_rate_refresh(source_currency_code, exchanged_currency_code, valuation_date):
+    """
+    Fetch a rate from the providers in the background (stale-while-revalidate).
+
+    Concurrent requests for the same pair and date share one refresh.
+    Returns False if a refresh for that key is already running.
+    """
+    key = (source_currency_code, exchanged_currency_code, valuation_date)
+    with _refresh_lock:
+        if key in _refresh_in_flight:
+            return False
+        _refresh_in_flight.add(key)
+    _get_refresh_executor().submit(_refresh_rate, key)
+    return True
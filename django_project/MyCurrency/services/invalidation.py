@@ -0,0 +1,210 @@
+"""
+Cross-process cache invalidation bus.
+
+Every write to ``CurrencyExchangeRate``, ``Currency`` or ``Provider``
+already evicts the caches of the process that made it (``signals``). Once the
+write commits, the bus also publishes a compact notification, and every other
+process evicts the same entries from its own caches: the cached rate ranges
+covering the written dates (when the cache backend is process-local), and
+the in-memory registry.
+
+On PostgreSQL the notifications go through ``NOTIFY`` on
+INVALIDATION_BUS_CHANNEL. Each web process starts a listener thread on its
+first request, which holds a dedicated connection in ``LISTEN``. While that
+listener is connected, the registry stops polling the shared version stamp.
+When the listener connects or reconnects, notifications may have been
+missed, so every local cache is dropped. Other databases use an in-process
+stand-in (``LocalBackend``).
+"""
+import json
+import logging
+import os
+import select
+import threading
+import time
+from datetime import date
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from ..caching import rate_range_cache
+from .registry import registry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHANNEL = 'mycurrency_invalidation'
+# Above this many dates of one source a notification carries their range instead
+MAX_DATES_PER_MESSAGE = 200
+POLL_SECONDS = 5.0
+MAX_RECONNECT_DELAY = 30.0
+
+RATES = 'rates'
+REGISTRY = 'registry'
+
+
+def encode_rates(origin, rates):
+    """
+    Payloads for written (source, target, date) keys: one per source
+    currency, with the dates as ordinals, or their [first, last] range when
+    there are more than MAX_DATES_PER_MESSAGE. Well below the 8000 byte limit of
+    ``NOTIFY``.
+    """
+    dates_by_source = {}
+    for source_code, _target_code, valuation_date in rates:
+        dates_by_source.setdefault(source_code, set()).add(valuation_date.toordinal())
+    payloads = []
+    for source_code, ordinals in sorted(dates_by_source.items()):
+        message = {'o': origin, 't': RATES, 's': source_code}
+        if len(ordinals) > MAX_DATES_PER_MESSAGE:
+            message['r'] = [min(ordinals), max(ordinals)]
+        else:
+            message['d'] = sorted(ordinals)
+        payloads.append(json.dumps(message, separators=(',', ':')))
+    return payloads
+
+
+def encode_registry(origin):
+    return json.dumps({'o': origin, 't': REGISTRY}, separators=(',', ':'))
+
+
+class LocalBackend:
+    """In-process stand-in for NOTIFY: delivers payloads to the handlers listening in this process."""
+    connected = False
+
+    def __init__(self):
+        self._handlers = []
+
+    def listen(self, handler, on_state_change):
+        self._handlers.append(handler)
+
+    def publish(self, payloads):
+        for handler in list(self._handlers):
+            for payload in payloads:
+                handler(payload)
+
+
+class PostgresBackend:
+    """``NOTIFY`` / ``LISTEN`` on ``channel`` of the ``alias`` database."""
+
+    def __init__(self, alias, channel):
+        self.alias = alias
+        self.channel = channel
+        self.connected = False
+
+    def publish(self, payloads):
+        # One round trip for every payload; delivered when the surrounding transaction commits
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload',
+                [self.channel, list(payloads)]
+            )
+
+    def listen(self, handler, on_state_change):
+        threading.Thread(
+            target=self._listen, args=(handler, on_state_change), name='invalidation-listener', daemon=True
+        ).start()
+
+    def _connect(self):
+        wrapper = connections[self.alias]
+        conn = wrapper.get_new_connection(wrapper.get_connection_params())
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+        return conn
+
+    def _listen(self, handler, on_state_change):
+        delay = 1.0
+        while True:
+            conn = None
+            try:
+                conn = self._connect()
+                self.connected = True
+                delay = 1.0
+                on_state_change()
+                while True:
+                    if select.select([conn], [], [], POLL_SECONDS) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        handler(conn.notifies.pop(0).payload)
+            except Exception as e:
+                logger.warning(f"Invalidation listener disconnected, retrying in {delay:.0f}s: {e}")
+            finally:
+                self.connected = False
+                on_state_change()
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+
+class InvalidationBus:
+    """Publishes this process's writes and applies the other processes' notifications."""
+
+    def __init__(self, backend, origin=None):
+        self.backend = backend
+        self.origin = origin or f'{os.getpid()}-{os.urandom(4).hex()}'
+        self._lock = threading.Lock()
+        self._listening = False
+
+    def publish_rates(self, rates):
+        payloads = encode_rates(self.origin, rates)
+        if payloads:
+            self.backend.publish(payloads)
+
+    def publish_registry(self):
+        self.backend.publish([encode_registry(self.origin)])
+
+    def start(self):
+        """Start listening (once per process)."""
+        if self._listening:
+            return
+        with self._lock:
+            if self._listening:
+                return
+            self._listening = True
+        self.backend.listen(self.receive, self._reset)
+
+    def _reset(self):
+        # Listener connected or lost: notifications may have been missed, start over
+        registry.push_invalidated = self.backend.connected
+        registry.clear()
+        if rate_range_cache.is_process_local:
+            rate_range_cache.clear()
+
+    def receive(self, payload):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Ignoring malformed invalidation payload ({len(payload)} bytes)")
+            return
+        if message.get('o') == self.origin:
+            # Already evicted locally when the write was made
+            return
+        if message.get('t') == REGISTRY:
+            registry.clear()
+        elif message.get('t') == RATES and rate_range_cache.is_process_local:
+            # A shared cache was already invalidated by the writer
+            if 'r' in message:
+                first, last = message['r']
+                rate_range_cache.invalidate_between(message['s'], date.fromordinal(first), date.fromordinal(last))
+            else:
+                rate_range_cache.invalidate(message['s'], [date.fromordinal(d) for d in message['d']])
+
+
+_bus = None
+
+
+def get_bus():
+    """The process's bus: PostgreSQL NOTIFY on a PostgreSQL default database, in-process otherwise."""
+    global _bus
+    if _bus is None:
+        if connections[DEFAULT_DB_ALIAS].vendor == 'postgresql':
+            channel = getattr(settings, 'INVALIDATION_BUS_CHANNEL', DEFAULT_CHANNEL)
+            _bus = InvalidationBus(PostgresBackend(DEFAULT_DB_ALIAS, channel))
+        else:
+            _bus = InvalidationBus(LocalBackend())
+    return _bus
@@ -0,0 +1,280 @@
+"""
+Database-backed queue of historical loads.
+
+Jobs are ``HistoricalLoadJob`` rows. Workers (``run_job_worker``) claim them
+with ``SELECT ... FOR UPDATE SKIP LOCKED``, so any number of processes can
+poll the same table without a broker and without claiming a job twice.
+Ranges longer than JOB_MAX_DAYS_PER_SUBJOB are split into sub-jobs that
+run in parallel; the parent aggregates their progress.
+
+Running jobs send a heartbeat (with their progress) every
+JOB_HEARTBEAT_INTERVAL seconds. ``requeue_stale_jobs`` hands the jobs of a
+crashed worker back to the queue, or fails them after ``max_attempts``.
+Loads keep existing rates, so running a job again is safe.
+"""
+import asyncio
+import logging
+import time
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min, Q, Sum
+from django.utils import timezone
+
+from ..models import HistoricalLoadJob
+from .async_historical_loader import load_historical_rates
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_DAYS_PER_SUBJOB = 31
+DEFAULT_HEARTBEAT_INTERVAL = 10
+DEFAULT_HEARTBEAT_TIMEOUT = 60
+# Seconds before a failed job is retried, multiplied by its attempts
+DEFAULT_RETRY_BACKOFF = 30
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue_job(job, max_days=None):
+    """
+    Save a new job, splitting it into sub-jobs of at most ``max_days`` days
+    (JOB_MAX_DAYS_PER_SUBJOB) when its range is longer.
+    """
+    max_days = max_days or _setting('JOB_MAX_DAYS_PER_SUBJOB', DEFAULT_MAX_DAYS_PER_SUBJOB)
+    n_days = (job.date_to - job.date_from).days + 1
+    job.total_cells = n_days * len(job.target_codes)
+
+    with transaction.atomic():
+        if n_days <= max_days:
+            job.status = HistoricalLoadJob.PENDING
+            job.save()
+            return job
+
+        job.status = HistoricalLoadJob.SPLIT
+        job.save()
+        subjobs = []
+        start = job.date_from
+        while start <= job.date_to:
+            end = min(start + timedelta(days=max_days - 1), job.date_to)
+            subjobs.append(HistoricalLoadJob(
+                parent=job,
+                source_code=job.source_code,
+                target_codes=job.target_codes,
+                date_from=start,
+                date_to=end,
+                provider_name=job.provider_name,
+                spread=job.spread,
+                max_attempts=job.max_attempts,
+                total_cells=((end - start).days + 1) * len(job.target_codes),
+            ))
+            start = end + timedelta(days=1)
+        HistoricalLoadJob.objects.bulk_create(subjobs)
+    logger.info(f"Job {job.pk} split into {len(subjobs)} sub-jobs")
+    return job
+
+
+def submit_historical_load(source_code, target_codes, date_from, date_to, provider_name='', spread=False):
+    """Queue a historical load; returns the (parent) job."""
+    return enqueue_job(HistoricalLoadJob(
+        source_code=source_code,
+        target_codes=list(target_codes),
+        date_from=date_from,
+        date_to=date_to,
+        provider_name=provider_name or '',
+        spread=spread,
+    ))
+
+
+def claim_job(worker_id):
+    """
+    Atomically take the oldest runnable job for ``worker_id``, skipping the
+    rows other workers have locked. Returns the job or ``None``.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        job = HistoricalLoadJob.objects.select_for_update(skip_locked=True).filter(
+            Q(run_after__isnull=True) | Q(run_after__lte=now),
+            status=HistoricalLoadJob.PENDING
+        ).order_by('created_at', 'id').first()
+        if job is None:
+            return None
+        job.status = HistoricalLoadJob.RUNNING
+        job.worker_id = worker_id
+        job.attempts += 1
+        job.heartbeat_at = now
+        job.started_at = now
+        job.finished_at = None
+        job.processed_cells = 0
+        job.successful_cells = 0
+        job.save(update_fields=[
+            'status', 'worker_id', 'attempts', 'heartbeat_at', 'started_at', 'finished_at',
+            'processed_cells', 'successful_cells', 'updated_at'
+        ])
+    return job
+
+
+def _owned(job):
+    """Queryset of ``job`` while it is still running on its worker."""
+    return HistoricalLoadJob.objects.filter(pk=job.pk, status=HistoricalLoadJob.RUNNING, worker_id=job.worker_id)
+
+
+def heartbeat(job, processed_cells, successful_cells):
+    """Record liveness and progress; returns False if the job was taken away from this worker."""
+    return bool(_owned(job).update(
+        heartbeat_at=timezone.now(),
+        processed_cells=processed_cells,
+        successful_cells=successful_cells,
+        updated_at=timezone.now()
+    ))
+
+
+def _update_parent(parent_id):
+    """Roll the sub-jobs' progress and outcome up to their parent."""
+    if parent_id is None:
+        return
+    with transaction.atomic():
+        # Serializes concurrent sub-job completions
+        parent = HistoricalLoadJob.objects.select_for_update().get(pk=parent_id)
+        totals = parent.subjobs.aggregate(
+            processed=Sum('processed_cells'),
+            successful=Sum('successful_cells'),
+            started=Min('started_at'),
+            open=Count('id', filter=Q(status__in=[HistoricalLoadJob.PENDING, HistoricalLoadJob.RUNNING])),
+            failed=Count('id', filter=Q(status=HistoricalLoadJob.FAILED)),
+        )
+        parent.processed_cells = totals['processed'] or 0
+        parent.successful_cells = totals['successful'] or 0
+        parent.started_at = totals['started']
+        if not totals['open']:
+            parent.status = HistoricalLoadJob.FAILED if totals['failed'] else HistoricalLoadJob.DONE
+            parent.finished_at = timezone.now()
+            if totals['failed']:
+                parent.last_error = f"{totals['failed']} sub-jobs failed"
+        else:
+            parent.status = HistoricalLoadJob.SPLIT
+        parent.save()
+
+
+def _finish(job, stats):
+    done = _owned(job).update(
+        status=HistoricalLoadJob.DONE,
+        finished_at=timezone.now(),
+        processed_cells=stats['total_requests'],
+        successful_cells=stats['successful'],
+        last_error='',
+        updated_at=timezone.now()
+    )
+    if not done:
+        logger.warning(f"Job {job.pk} finished on {job.worker_id} after it was re-queued")
+    _update_parent(job.parent_id)
+
+
+def _fail(job, error):
+    now = timezone.now()
+    retry = job.attempts < job.max_attempts
+    _owned(job).update(
+        status=HistoricalLoadJob.PENDING if retry else HistoricalLoadJob.FAILED,
+        run_after=now + timedelta(seconds=_setting('JOB_RETRY_BACKOFF', DEFAULT_RETRY_BACKOFF) * job.attempts) if retry else None,
+        finished_at=None if retry else now,
+        worker_id='' if retry else job.worker_id,
+        last_error=error,
+        updated_at=now
+    )
+    logger.error(f"Job {job.pk} failed (attempt {job.attempts}/{job.max_attempts}): {error}")
+    _update_parent(job.parent_id)
+
+
+def run_job(job):
+    """
+    Run a claimed job, sending heartbeats with its progress, and record the
+    outcome (done, re-queued for retry or failed).
+    """
+    interval = _setting('JOB_HEARTBEAT_INTERVAL', DEFAULT_HEARTBEAT_INTERVAL)
+    progress = {'processed': 0, 'successful': 0}
+
+    async def on_progress(processed, successful):
+        progress['processed'] = processed
+        progress['successful'] = successful
+
+    async def send_heartbeats():
+        while True:
+            await asyncio.sleep(interval)
+            if not await sync_to_async(heartbeat)(job, progress['processed'], progress['successful']):
+                logger.warning(f"Job {job.pk} was re-queued while running on {job.worker_id}")
+
+    async def run():
+        heartbeats = asyncio.create_task(send_heartbeats())
+        try:
+            return await load_historical_rates(
+                source_code=job.source_code,
+                target_codes=job.target_codes,
+                date_from=job.date_from,
+                date_to=job.date_to,
+                provider_name=job.provider_name or None,
+                spread=job.spread,
+                on_progress=on_progress
+            )
+        finally:
+            heartbeats.cancel()
+
+    started = time.monotonic()
+    try:
+        stats = async_to_sync(run)()
+    except Exception as e:
+        logger.exception(f"Job {job.pk} raised: {e}")
+        _fail(job, f"{type(e).__name__}: {e}")
+        return job
+    if stats.get('note'):
+        _fail(job, stats['note'])
+        return job
+
+    _finish(job, stats)
+    logger.info(
+        f"Job {job.pk} done: {stats['successful']}/{stats['total_requests']} cells "
+        f"in {time.monotonic() - started:.1f}s"
+    )
+    return job
+
+
+def requeue_stale_jobs():
+    """
+    Re-queue running jobs whose heartbeat is older than
+    JOB_HEARTBEAT_TIMEOUT (crashed worker); jobs out of attempts fail.
+    Returns (requeued, failed).
+    """
+    now = timezone.now()
+    stale = HistoricalLoadJob.objects.filter(
+        status=HistoricalLoadJob.RUNNING,
+        heartbeat_at__lt=now - timedelta(seconds=_setting('JOB_HEARTBEAT_TIMEOUT', DEFAULT_HEARTBEAT_TIMEOUT))
+    )
+    error = 'Worker lost (heartbeat timeout)'
+    requeued = stale.filter(attempts__lt=F('max_attempts')).update(
+        status=HistoricalLoadJob.PENDING, worker_id='', run_after=now, last_error=error, updated_at=now
+    )
+    exhausted = stale.filter(attempts__gte=F('max_attempts'))
+    parent_ids = set(exhausted.exclude(parent=None).values_list('parent_id', flat=True))
+    failed = exhausted.update(status=HistoricalLoadJob.FAILED, finished_at=now, last_error=error, updated_at=now)
+    for parent_id in parent_ids:
+        _update_parent(parent_id)
+    if requeued or failed:
+        logger.warning(f"Stale jobs: {requeued} re-queued, {failed} failed")
+    return requeued, failed
+
+
+def retry_job(job):
+    """Put a failed job (or the failed sub-jobs of a parent) back in the queue."""
+    now = timezone.now()
+    has_subjobs = job.subjobs.exists()
+    jobs = job.subjobs.all() if has_subjobs else HistoricalLoadJob.objects.filter(pk=job.pk)
+    count = jobs.filter(status=HistoricalLoadJob.FAILED).update(
+        status=HistoricalLoadJob.PENDING, attempts=0, run_after=None, finished_at=None, worker_id='', updated_at=now
+    )
+    if has_subjobs and count:
+        HistoricalLoadJob.objects.filter(pk=job.pk).update(
+            status=HistoricalLoadJob.SPLIT, finished_at=None, last_error='', updated_at=now
+        )
+    return count
@@ -0,0 +1,321 @@
+"""
+Bulk conversion of transaction ledgers (``convert_ledger``).
+
+The input (CSV, or Parquet with ``pyarrow``) is read in chunks. The distinct
+(currency, date) lookups of a chunk are resolved against the stored rates
+with one as-of query (``resolve_as_of``), so weekends use the last known
+rate. Amounts are converted in integer fixed point: each chunk's amounts are
+scaled to its largest number of decimals, rates to ``10 ** RATE_SCALE``, and
+the products are rounded half-even to the output decimals, without a
+Decimal or float per row. With NumPy installed, chunks whose products fit
+in int64 are computed vectorized; others use Python integers.
+
+Chunks can be converted by a process pool. Results are written in input
+order as they complete, so memory is bounded by the chunks in flight.
+"""
+import csv
+import logging
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from functools import partial
+from itertools import islice
+
+from django.db import connections
+
+from ..renderers import RATE_SCALE
+from .as_of import resolve_as_of
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - optional dependency
+    numpy = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - optional dependency
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 100000
+DEFAULT_DECIMALS = 2
+# Columns added to every output row
+RATE_COLUMN = 'rate'
+RATE_DATE_COLUMN = 'rate_date'
+CONVERTED_COLUMN = 'converted_amount'
+
+AMOUNT_RE = re.compile(r'^([+-]?)(\d*)(?:\.(\d*))?$')
+INT64_MAX = 2 ** 63 - 1
+
+
+class LedgerError(Exception):
+    """Raised when a ledger cannot be read or written."""
+
+
+def _parse_amounts(values):
+    """
+    Return (amounts, scale): each amount as an integer at ``scale`` (the
+    largest number of decimals among them), or None where it is not a
+    plain decimal number.
+    """
+    parsed = []
+    scale = 0
+    for value in values:
+        match = AMOUNT_RE.match(str(value).strip()) if value is not None else None
+        if match is None or not (match.group(2) or match.group(3)):
+            parsed.append(None)
+            continue
+        fraction = match.group(3) or ''
+        parsed.append((match.group(1) == '-', match.group(2), fraction))
+        scale = max(scale, len(fraction))
+    amounts = [
+        None if p is None else (-1 if p[0] else 1) * int(p[1] + p[2].ljust(scale, '0'))
+        for p in parsed
+    ]
+    return amounts, scale
+
+
+def _parse_dates(values):
+    """
+    Dates of ``values`` (ISO strings, dates, or datetimes such as Parquet
+    timestamps), parsing each distinct string once; None where invalid.
+    """
+    cache = {}
+    dates = []
+    for value in values:
+        if isinstance(value, datetime):
+            dates.append(value.date())
+            continue
+        if isinstance(value, date):
+            dates.append(value)
+            continue
+        if value not in cache:
+            try:
+                cache[value] = date.fromisoformat(str(value).strip()[:10])
+            except ValueError:
+                cache[value] = None
+        dates.append(cache[value])
+    return dates
+
+
+def _multiply_round(amounts, rates, shift):
+    """
+    ``amount * rate / 10 ** shift`` for each pair, rounded half-even (a
+    negative ``shift`` scales up). Vectorized in int64 when NumPy is
+    available and no product can overflow.
+    """
+    if not amounts:
+        return []
+    divisor = 10 ** shift if shift > 0 else 1
+    factor = 10 ** -shift if shift < 0 else 1
+    bound = max(abs(a) for a in amounts) * max(rates) * factor
+    if numpy is not None and bound <= INT64_MAX and 2 * divisor <= INT64_MAX:
+        products = numpy.array(amounts, dtype=numpy.int64) * numpy.array(rates, dtype=numpy.int64) * factor
+        if divisor > 1:
+            quotients, remainders = numpy.divmod(products, divisor)
+            quotients += (2 * remainders > divisor) | ((2 * remainders == divisor) & (quotients % 2 == 1))
+            products = quotients
+        return products.tolist()
+
+    results = []
+    for amount, rate in zip(amounts, rates):
+        quotient, remainder = divmod(amount * rate * factor, divisor)
+        if 2 * remainder > divisor or (2 * remainder == divisor and quotient % 2):
+            quotient += 1
+        results.append(quotient)
+    return results
+
+
+def _format_fixed(value, decimals):
+    """Render an integer holding ``decimals`` implied decimals."""
+    if not decimals:
+        return str(value)
+    digits = str(abs(value)).rjust(decimals + 1, '0')
+    return f"{'-' if value < 0 else ''}{digits[:-decimals]}.{digits[-decimals:]}"
+
+
+def convert_chunk(columns, currency_column, date_column, amount_column, target_code,
+                  decimals=DEFAULT_DECIMALS, max_lookback_days=None):
+    """
+    Convert one columnar chunk (``{column: [values]}``) into ``target_code``.
+    Adds the rate, rate date and converted amount columns (empty where the
+    row is invalid or has no rate) and returns (columns, stats).
+    """
+    currencies = [str(code).strip().upper() if code else '' for code in columns[currency_column]]
+    dates = _parse_dates(columns[date_column])
+    amounts, scale = _parse_amounts(columns[amount_column])
+
+    keys = {(code, day) for code, day in zip(currencies, dates) if code and day is not None}
+    resolved = resolve_as_of(
+        [(code, target_code, day) for code, day in keys if code != target_code],
+        max_lookback_days=max_lookback_days
+    )
+    one = 10 ** RATE_SCALE
+    rates = {
+        (code, day): (int(rate.rate_value.scaleb(RATE_SCALE)), str(rate.rate_value), rate.valuation_date.isoformat())
+        for (code, _target, day), rate in resolved.items()
+    }
+    rates.update({(code, day): (one, '1', day.isoformat()) for code, day in keys if code == target_code})
+
+    row_rates = [rates.get(key) for key in zip(currencies, dates)]
+    valid = [i for i, (amount, rate) in enumerate(zip(amounts, row_rates)) if amount is not None and rate is not None]
+    products = _multiply_round(
+        [amounts[i] for i in valid], [row_rates[i][0] for i in valid], scale + RATE_SCALE - decimals
+    )
+    converted = [''] * len(amounts)
+    for i, value in zip(valid, products):
+        converted[i] = _format_fixed(value, decimals)
+
+    columns[RATE_COLUMN] = [rate[1] if rate else '' for rate in row_rates]
+    columns[RATE_DATE_COLUMN] = [rate[2] if rate else '' for rate in row_rates]
+    columns[CONVERTED_COLUMN] = converted
+
+    invalid = sum(
+        1 for code, day, amount in zip(currencies, dates, amounts) if not code or day is None or amount is None
+    )
+    return columns, {
+        'rows': len(amounts),
+        'converted': len(valid),
+        'invalid': invalid,
+        'missing_rate': len(amounts) - len(valid) - invalid,
+    }
+
+
+def _is_parquet(path):
+    return str(path).lower().endswith('.parquet')
+
+
+def _require_pyarrow():
+    if pyarrow is None:
+        raise LedgerError("Parquet ledgers need pyarrow (pip install pyarrow)")
+
+
+def _read_csv(path, chunk_size):
+    handle = open(path, newline='', encoding='utf-8')
+    reader = csv.reader(handle)
+    header = next(reader, None)
+    if header is None:
+        handle.close()
+        raise LedgerError(f"{path} is empty")
+
+    def chunks():
+        with handle:
+            width = len(header)
+            while True:
+                rows = list(islice(reader, chunk_size))
+                if not rows:
+                    return
+                if any(len(row) != width for row in rows):
+                    rows = [(row + [''] * width)[:width] for row in rows]
+                yield {name: list(values) for name, values in zip(header, zip(*rows))}
+
+    return header, chunks()
+
+
+def _read_parquet(path, chunk_size):
+    _require_pyarrow()
+    parquet_file = pyarrow.parquet.ParquetFile(path)
+    header = parquet_file.schema_arrow.names
+    return header, (batch.to_pydict() for batch in parquet_file.iter_batches(batch_size=chunk_size))
+
+
+class _CsvWriter:
+    def __init__(self, path, header):
+        self._handle = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._handle)
+        self._header = header
+        self._writer.writerow(header)
+
+    def write(self, columns):
+        self._writer.writerows(zip(*(columns[name] for name in self._header)))
+
+    def close(self):
+        self._handle.close()
+
+
+class _ParquetWriter:
+    def __init__(self, path, header):
+        _require_pyarrow()
+        self._path = path
+        self._header = header
+        self._writer = None
+
+    def write(self, columns):
+        table = pyarrow.table({name: columns[name] for name in self._header})
+        if self._writer is None:
+            self._writer = pyarrow.parquet.ParquetWriter(self._path, table.schema)
+        self._writer.write_table(table.cast(self._writer.schema))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def _init_worker():
+    # Forked workers must not share the parent's database connections
+    connections.close_all()
+
+
+def _convert_in_pool(chunks, convert, workers):
+    """Yield the converted chunks in input order, keeping at most 2 * ``workers`` in flight."""
+    connections.close_all()
+    with ProcessPoolExecutor(workers, initializer=_init_worker) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(convert, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def convert_ledger(input_path, output_path, target_code, currency_column='currency', date_column='date',
+                   amount_column='amount', decimals=DEFAULT_DECIMALS, chunk_size=DEFAULT_CHUNK_SIZE,
+                   workers=1, max_lookback_days=None):
+    """
+    Convert every amount of the ledger at ``input_path`` into
+    ``target_code`` with the rate on (or last known before) its date, and
+    write the rows with the rate, rate date and converted amount to
+    ``output_path``. The format of each file follows its extension
+    (``.parquet`` or CSV). Returns the stats.
+    """
+    started = time.monotonic()
+    reader = _read_parquet if _is_parquet(input_path) else _read_csv
+    header, chunks = reader(input_path, chunk_size)
+    missing = [name for name in (currency_column, date_column, amount_column) if name not in header]
+    if missing:
+        raise LedgerError(f"Missing columns in {input_path}: {', '.join(missing)}")
+
+    output_header = [name for name in header if name not in (RATE_COLUMN, RATE_DATE_COLUMN, CONVERTED_COLUMN)]
+    output_header += [RATE_COLUMN, RATE_DATE_COLUMN, CONVERTED_COLUMN]
+    writer = (_ParquetWriter if _is_parquet(output_path) else _CsvWriter)(output_path, output_header)
+
+    convert = partial(
+        convert_chunk,
+        currency_column=currency_column,
+        date_column=date_column,
+        amount_column=amount_column,
+        target_code=target_code.upper(),
+        decimals=decimals,
+        max_lookback_days=max_lookback_days
+    )
+    results = _convert_in_pool(chunks, convert, workers) if workers > 1 else map(convert, chunks)
+
+    stats = {'rows': 0, 'converted': 0, 'invalid': 0, 'missing_rate': 0, 'chunks': 0}
+    try:
+        for columns, chunk_stats in results:
+            writer.write(columns)
+            stats['chunks'] += 1
+            for key, value in chunk_stats.items():
+                stats[key] += value
+    finally:
+        writer.close()
+
+    stats['seconds'] = time.monotonic() - started
+    stats['rows_per_second'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+    logger.info(f"Ledger {input_path} converted to {target_code}: {stats}")
+    return stats
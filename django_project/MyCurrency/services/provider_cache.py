@@ -0,0 +1,184 @@
+"""
+On-disk cache of raw provider responses.
+
+Responses are stored zlib-compressed under the SHA-256 of the endpoint and
+its normalized query parameters (sorted, credentials removed), so re-running
+a historical load, or re-parsing data after a parser change, replays the
+downloaded bodies instead of paying the provider again. The cache is bounded
+by PROVIDER_RESPONSE_CACHE_MAX_BYTES: the least recently used files are
+evicted first. In offline mode (PROVIDER_RESPONSE_CACHE_OFFLINE or
+``load_historical --offline``) a miss raises ``OfflineCacheMiss`` instead of
+calling the provider.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import zlib
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Query parameters that identify the caller, not the data
+SECRET_PARAMS = frozenset({'api_key', 'apikey', 'access_key', 'app_id', 'token'})
+# Eviction trims the cache down to this fraction of the limit
+EVICTION_TARGET = 0.9
+
+
+class OfflineCacheMiss(Exception):
+    """Raised in offline mode when a response is not cached."""
+
+
+def make_key(endpoint, params):
+    """Return the cache key of a request: SHA-256 of endpoint + normalized params."""
+    normalized = sorted(
+        (str(name), str(value)) for name, value in (params or {}).items() if name not in SECRET_PARAMS
+    )
+    return hashlib.sha256(json.dumps([endpoint.rstrip('/'), normalized]).encode()).hexdigest()
+
+
+class ProviderResponseCache:
+    """
+    Content store of raw response bodies, one compressed file per request.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.z")
+
+    def get(self, endpoint, params):
+        """Return the cached body (bytes) or ``None``."""
+        path = self._path(make_key(endpoint, params))
+        try:
+            with open(path, 'rb') as f:
+                payload = f.read()
+            # Mark as recently used for the eviction order
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        try:
+            return zlib.decompress(payload)
+        except zlib.error:
+            logger.warning(f"Corrupted provider cache entry {path}, ignoring it")
+            return None
+
+    def put(self, endpoint, params, body):
+        """Store ``body`` (bytes) for the request, evicting old entries if needed."""
+        path = self._path(make_key(endpoint, params))
+        payload = zlib.compress(body, 6)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(payload)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        for root, _dirs, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.z'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, path
+
+    def _scan_size(self):
+        return sum(size for _mtime, size, _path in self._entries())
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        size = sum(size for _mtime, size, _path in entries)
+        target = self.max_bytes * EVICTION_TARGET
+        evicted = 0
+        for _mtime, entry_size, path in entries:
+            if size <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+            evicted += 1
+        self._size = size
+        logger.info(f"Evicted {evicted} provider responses from {self.directory} ({size} bytes left)")
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_provider_cache():
+    """Return the configured cache, or ``None`` when PROVIDER_RESPONSE_CACHE_DIR is not set."""
+    directory = getattr(settings, 'PROVIDER_RESPONSE_CACHE_DIR', None)
+    if not directory:
+        return None
+    max_bytes = getattr(settings, 'PROVIDER_RESPONSE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+    with _caches_lock:
+        cache = _caches.get((directory, max_bytes))
+        if cache is None:
+            cache = _caches[(directory, max_bytes)] = ProviderResponseCache(directory, max_bytes)
+        return cache
+
+
+def is_offline():
+    return getattr(settings, 'PROVIDER_RESPONSE_CACHE_OFFLINE', False)
+
+
+def read_through(endpoint, params, fetch, store=True, offline=None):
+    """
+    Return the raw body for a provider request, from the cache if possible.
+
+    ``fetch`` is called on a miss and returns the body (bytes) or ``None``
+    for responses that must not be cached (errors). ``store=False`` skips
+    caching, e.g. for data that may still change.
+    """
+    cache = get_provider_cache()
+    if cache is not None:
+        body = cache.get(endpoint, params)
+        if body is not None:
+            return body
+    if is_offline() if offline is None else offline:
+        raise OfflineCacheMiss(f"{endpoint} {make_key(endpoint, params)} is not cached")
+    body = fetch()
+    if body is not None and store and cache is not None:
+        cache.put(endpoint, params, body)
+    return body
+
+
+async def aread_through(endpoint, params, fetch, store=True, offline=None):
+    """Async ``read_through``: ``fetch`` is a coroutine function, disk access runs in a thread."""
+    cache = get_provider_cache()
+    if cache is not None:
+        body = await asyncio.to_thread(cache.get, endpoint, params)
+        if body is not None:
+            return body
+    if is_offline() if offline is None else offline:
+        raise OfflineCacheMiss(f"{endpoint} {make_key(endpoint, params)} is not cached")
+    body = await fetch()
+    if body is not None and store and cache is not None:
+        await asyncio.to_thread(cache.put, endpoint, params, body)
+    return body
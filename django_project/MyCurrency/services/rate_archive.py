@@ -0,0 +1,334 @@
+"""
+Compact, chunked binary archive of the rate history.
+
+Used to bootstrap environments (``export_rates`` / ``import_rates``) and by
+the retention engine to archive old rows. Rows are streamed from the
+database, so memory stays bounded whatever the table size.
+
+File layout (little-endian)::
+
+    MAGIC, FORMAT_VERSION                         (HEAD_FORMAT)
+    chunk*                                        zlib(ROW_FORMAT * rows)
+    footer                                        JSON: currencies, providers, chunk index
+    footer length, MAGIC                          (TAIL_FORMAT)
+
+Each chunk holds rows of a single partition (calendar month) and is listed
+in the footer with its offset, size, row count and SHA-256, so chunks can be
+verified and imported independently and in parallel.
+"""
+import hashlib
+import io
+import json
+import logging
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+from django.db.models import BigIntegerField, F
+from django.db.models.functions import Cast, Round
+from django.utils import timezone
+
+from ..models import Currency, CurrencyExchangeRate, Provider
+from ..signals import notify_rates_written, notify_registry_changed
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'MCRA'
+FORMAT_VERSION = 1
+HEAD_FORMAT = '<4sH'
+TAIL_FORMAT = '<Q4s'
+# source code, target code, date ordinal, rate * 10**RATE_SCALE, provider index, is_active
+ROW_FORMAT = '<3s3siqH?'
+ROW_SIZE = struct.calcsize(ROW_FORMAT)
+RATE_SCALE = 6
+DEFAULT_CHUNK_ROWS = 50000
+DEFAULT_INSERT_BATCH_SIZE = 5000
+
+
+class ArchiveError(Exception):
+    """Raised when an archive is malformed or fails checksum verification."""
+
+
+def _partition(valuation_date):
+    return f"{valuation_date.year:04d}-{valuation_date.month:02d}"
+
+
+class RateArchiveWriter:
+    """
+    Write rows to an archive file, one compressed chunk per partition (or
+    every ``chunk_rows`` rows).
+    """
+
+    def __init__(self, fileobj, chunk_rows=DEFAULT_CHUNK_ROWS):
+        self._file = fileobj
+        self._chunk_rows = chunk_rows
+        self._providers = {}
+        self._chunks = []
+        self._buffer = []
+        self._partition = None
+        self._currencies = []
+        self._provider_rows = []
+        self._file.write(struct.pack(HEAD_FORMAT, MAGIC, FORMAT_VERSION))
+
+    def set_registry(self, currencies, providers):
+        """Record the Currency / Provider rows (lists of dicts) in the footer."""
+        self._currencies = currencies
+        for provider in providers:
+            self._providers.setdefault(provider['name'], len(self._providers))
+        self._provider_rows = providers
+
+    def write(self, source_code, target_code, valuation_date, scaled_rate, provider, is_active=True):
+        partition = _partition(valuation_date)
+        if self._partition is not None and (partition != self._partition or len(self._buffer) >= self._chunk_rows):
+            self._flush()
+        self._partition = partition
+        provider_index = self._providers.setdefault(provider, len(self._providers))
+        self._buffer.append(struct.pack(
+            ROW_FORMAT, source_code.encode('ascii'), target_code.encode('ascii'),
+            valuation_date.toordinal(), scaled_rate, provider_index, is_active
+        ))
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        payload = zlib.compress(b''.join(self._buffer), 6)
+        self._chunks.append({
+            'partition': self._partition,
+            'offset': self._file.tell(),
+            'size': len(payload),
+            'rows': len(self._buffer),
+            'sha256': hashlib.sha256(payload).hexdigest(),
+        })
+        self._file.write(payload)
+        self._buffer = []
+
+    def close(self):
+        self._flush()
+        footer = json.dumps({
+            'rate_scale': RATE_SCALE,
+            'created_at': timezone.now().isoformat(),
+            'currencies': self._currencies,
+            'providers': self._provider_rows,
+            'provider_names': list(self._providers),
+            'chunks': self._chunks,
+        }).encode()
+        self._file.write(footer)
+        self._file.write(struct.pack(TAIL_FORMAT, len(footer), MAGIC))
+        return self._chunks
+
+
+class RateArchiveReader:
+    """
+    Random-access reader over an archive file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version = struct.unpack(HEAD_FORMAT, f.read(struct.calcsize(HEAD_FORMAT)))
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise ArchiveError(f"{path} is not a rate archive (version {FORMAT_VERSION}).")
+            tail_size = struct.calcsize(TAIL_FORMAT)
+            f.seek(-tail_size, io.SEEK_END)
+            footer_size, magic = struct.unpack(TAIL_FORMAT, f.read(tail_size))
+            if magic != MAGIC:
+                raise ArchiveError(f"{path} is truncated (missing footer).")
+            f.seek(-(tail_size + footer_size), io.SEEK_END)
+            self.footer = json.loads(f.read(footer_size))
+        self.chunks = self.footer['chunks']
+        self.provider_names = self.footer['provider_names']
+
+    @property
+    def partitions(self):
+        return sorted({chunk['partition'] for chunk in self.chunks})
+
+    def read_chunk(self, chunk):
+        """Return the decoded rows of ``chunk`` after verifying its checksum."""
+        with open(self.path, 'rb') as f:
+            f.seek(chunk['offset'])
+            payload = f.read(chunk['size'])
+        if hashlib.sha256(payload).hexdigest() != chunk['sha256']:
+            raise ArchiveError(f"Checksum mismatch in chunk at offset {chunk['offset']} ({chunk['partition']}).")
+        data = zlib.decompress(payload)
+        if len(data) != chunk['rows'] * ROW_SIZE:
+            raise ArchiveError(f"Unexpected size for chunk at offset {chunk['offset']} ({chunk['partition']}).")
+        return [
+            (source.decode('ascii'), target.decode('ascii'), date.fromordinal(ordinal), scaled,
+             self.provider_names[provider_index], is_active)
+            for source, target, ordinal, scaled, provider_index, is_active in struct.iter_unpack(ROW_FORMAT, data)
+        ]
+
+    def verify(self):
+        """Verify every chunk; returns the total number of rows."""
+        return sum(len(self.read_chunk(chunk)) for chunk in self.chunks)
+
+
+def export_rates(path, date_from=None, date_to=None, chunk_rows=DEFAULT_CHUNK_ROWS, queryset=None):
+    """
+    Stream ``CurrencyExchangeRate`` rows (plus the Currency and Provider
+    registries) into an archive at ``path``. Returns the chunk index.
+    """
+    rates = queryset if queryset is not None else CurrencyExchangeRate.objects.all()
+    if date_from:
+        rates = rates.filter(valuation_date__gte=date_from)
+    if date_to:
+        rates = rates.filter(valuation_date__lte=date_to)
+    rows = rates.annotate(
+        scaled_rate=Cast(Round(F('rate_value') * 10 ** RATE_SCALE), BigIntegerField())
+    ).order_by('valuation_date', 'id').values_list(
+        'source_code', 'target_code', 'valuation_date', 'scaled_rate', 'provider', 'is_active'
+    )
+
+    with open(path, 'wb') as f:
+        writer = RateArchiveWriter(f, chunk_rows=chunk_rows)
+        writer.set_registry(
+            list(Currency.objects.order_by('code').values('code', 'name', 'symbol', 'is_active')),
+            list(Provider.objects.order_by('priority', 'created_at').values('name', 'priority', 'is_active')),
+        )
+        for row in rows.iterator(chunk_size=chunk_rows):
+            writer.write(*row)
+        chunks = writer.close()
+
+    logger.info(f"Exported {sum(c['rows'] for c in chunks)} rates in {len(chunks)} chunks to {path}")
+    return chunks
+
+
+def _import_registry(reader):
+    """Create missing currencies and providers; returns code -> currency id."""
+    codes = set(Currency.objects.values_list('code', flat=True))
+    names = set(Provider.objects.values_list('name', flat=True))
+    currencies = [Currency(**row) for row in reader.footer['currencies'] if row['code'] not in codes]
+    providers = [Provider(**row) for row in reader.footer['providers'] if row['name'] not in names]
+    Currency.objects.bulk_create(currencies, ignore_conflicts=True)
+    Provider.objects.bulk_create(providers, ignore_conflicts=True)
+    if currencies or providers:
+        # bulk_create sends no post_save: evict the registries ourselves
+        notify_registry_changed()
+    return dict(Currency.objects.values_list('code', 'id'))
+
+
+def _supports_copy():
+    return connection.vendor == 'postgresql'
+
+
+def _insert_rows_copy(rows, currency_ids):
+    """
+    PostgreSQL: COPY into a temporary table, then one INSERT ... ON CONFLICT
+    DO NOTHING. Returns the (source, target, date) keys actually inserted.
+    """
+    table = connection.ops.quote_name(CurrencyExchangeRate._meta.db_table)
+    now = timezone.now().isoformat()
+    buffer = io.StringIO()
+    for source, target, valuation_date, scaled, provider, is_active in rows:
+        rate = Decimal(scaled).scaleb(-RATE_SCALE)
+        buffer.write(
+            f"{currency_ids[source]}\t{currency_ids[target]}\t{source}\t{target}\t{valuation_date.isoformat()}\t"
+            f"{rate}\t{provider}\t{'t' if is_active else 'f'}\t{now}\t{now}\n"
+        )
+    columns = (
+        'source_currency_id, exchanged_currency_id, source_code, target_code, valuation_date, rate_value, '
+        'provider, is_active, created_at, updated_at'
+    )
+    copy_sql = f"COPY import_rates_tmp ({columns}) FROM STDIN"
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Only the copied columns: ``id`` is left to the real table's identity
+        cursor.execute(
+            f"CREATE TEMP TABLE import_rates_tmp ON COMMIT DROP AS SELECT {columns} FROM {table} WITH NO DATA"
+        )
+        if is_psycopg3:
+            with cursor.copy(copy_sql) as copy:
+                copy.write(buffer.getvalue())
+        else:
+            buffer.seek(0)
+            cursor.copy_expert(copy_sql, buffer)
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}) SELECT {columns} FROM import_rates_tmp "
+            f"ON CONFLICT (source_currency_id, exchanged_currency_id, valuation_date, provider) DO NOTHING "
+            f"RETURNING source_code, target_code, valuation_date"
+        )
+        return cursor.fetchall()
+
+
+def _rate_objects(rows, currency_ids):
+    return [
+        CurrencyExchangeRate(
+            source_currency_id=currency_ids[source],
+            exchanged_currency_id=currency_ids[target],
+            source_code=source,
+            target_code=target,
+            valuation_date=valuation_date,
+            rate_value=Decimal(scaled).scaleb(-RATE_SCALE),
+            provider=provider,
+            is_active=is_active,
+        )
+        for source, target, valuation_date, scaled, provider, is_active in rows
+    ]
+
+
+def _insert_rows_batched(rows, currency_ids, batch_size):
+    """bulk_create the rows not stored yet; returns the (source, target, date) keys inserted."""
+    if not rows:
+        return []
+    dates = [row[2] for row in rows]
+    with transaction.atomic():
+        existing = set(CurrencyExchangeRate.objects.filter(
+            source_code__in={row[0] for row in rows},
+            valuation_date__range=[min(dates), max(dates)],
+        ).values_list('source_code', 'target_code', 'valuation_date', 'provider'))
+        rows = [row for row in rows if row[:3] + (row[4],) not in existing]
+        CurrencyExchangeRate.objects.bulk_create(
+            _rate_objects(rows, currency_ids), batch_size=batch_size, ignore_conflicts=True
+        )
+    return [(source, target, valuation_date) for source, target, valuation_date, *_ in rows]
+
+
+def _import_chunk(reader, chunk, currency_ids, batch_size):
+    """Import one chunk; returns the number of rows inserted (rows already stored are skipped)."""
+    rows = [row for row in reader.read_chunk(chunk) if row[0] in currency_ids and row[1] in currency_ids]
+    if _supports_copy():
+        inserted = _insert_rows_copy(rows, currency_ids)
+    else:
+        inserted = _insert_rows_batched(rows, currency_ids, batch_size)
+    notify_rates_written(CurrencyExchangeRate, inserted)
+    return len(inserted)
+
+
+def _import_chunk_in_thread(reader, chunk, currency_ids, batch_size):
+    try:
+        return _import_chunk(reader, chunk, currency_ids, batch_size)
+    finally:
+        # Each worker thread opened its own connection
+        connection.close()
+
+
+def import_rates(path, partitions=None, workers=1, batch_size=DEFAULT_INSERT_BATCH_SIZE):
+    """
+    Import an archive: verify each chunk's checksum, create missing
+    currencies/providers and insert the rates (existing rows are kept).
+    ``partitions`` restricts the import to some months ("YYYY-MM");
+    ``workers`` > 1 imports chunks in parallel threads, each with its own
+    database connection. Returns a stats dict.
+    """
+    reader = RateArchiveReader(path)
+    chunks = [c for c in reader.chunks if not partitions or c['partition'] in partitions]
+    currency_ids = _import_registry(reader)
+
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            rows = sum(executor.map(
+                lambda chunk: _import_chunk_in_thread(reader, chunk, currency_ids, batch_size), chunks
+            ))
+    else:
+        rows = sum(_import_chunk(reader, chunk, currency_ids, batch_size) for chunk in chunks)
+
+    stats = {
+        'chunks': len(chunks),
+        'rows': rows,
+        'partitions': sorted({c['partition'] for c in chunks}),
+    }
+    logger.info(f"Imported {stats['rows']} rates in {stats['chunks']} chunks from {path}")
+    return stats
@@ -0,0 +1,256 @@
+"""
+Memory-mapped rate matrix snapshot.
+
+The rates of a date range are packed into a dense int64 array indexed by
+(source index, target index, day offset) and written to a versioned file.
+Every worker process maps the same file read-only, so the pages are shared
+through the OS page cache: lookups are plain array indexing and memory does
+not grow with the number of workers. Rebuilds write a new file and swap it
+in atomically with ``os.replace``; readers notice and remap.
+
+Only the rows of active providers are packed. The header records the latest
+``updated_at`` the build saw. Once rates within the snapshot's dates are
+written after it, the snapshot is ignored until the next rebuild. Writes made
+by this process are noticed at once. Other processes' writes are noticed by
+a check every RATE_SNAPSHOT_CHECK_INTERVAL seconds.
+
+File layout (little-endian):
+
+    header   HEADER_FORMAT (see below)
+    codes    n_currencies * 3 ASCII bytes
+    padding  up to an 8-byte boundary
+    data     int64[n_currencies][n_currencies][n_days], rate * 10**scale, 0 = missing
+"""
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import BigIntegerField, F, Max, Min
+from django.db.models.functions import Cast, Round
+
+from ..models import CurrencyExchangeRate
+from .registry import registry
+from .resolution import provider_rank
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'MCRS'
+FORMAT_VERSION = 2
+# magic, format version, scale, build version, last write (ns), origin ordinal, n_currencies, n_days, data offset
+HEADER_FORMAT = '<4sHHQQiIIQ'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+RATE_SCALE = 6
+ITEM_SIZE = 8
+# Seconds between checks for a newer snapshot file
+DEFAULT_CHECK_INTERVAL = 5.0
+UNIX_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class RateSnapshot:
+    """
+    Read-only view over a snapshot file.
+    """
+
+    def __init__(self, path):
+        if sys.byteorder != 'little':
+            raise RuntimeError("Rate snapshots require a little-endian platform.")
+        with open(path, 'rb') as f:
+            self._stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, format_version, scale, version, last_write, origin, n_currencies, n_days, data_offset = (
+            struct.unpack_from(HEADER_FORMAT, self._mmap, 0)
+        )
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a rate snapshot (version {FORMAT_VERSION}).")
+
+        self.path = path
+        self.version = version
+        self.last_write_ns = last_write
+        # Set once rates it does not include were written
+        self.stale = False
+        self.scale = scale
+        self.date_from = date.fromordinal(origin)
+        self.n_days = n_days
+        codes = bytes(self._mmap[HEADER_SIZE:HEADER_SIZE + 3 * n_currencies]).decode('ascii')
+        self.codes = [codes[i:i + 3] for i in range(0, len(codes), 3)]
+        self._index = {code: i for i, code in enumerate(self.codes)}
+        self._data = memoryview(self._mmap)[data_offset:].cast('q')
+
+    @property
+    def date_to(self):
+        return self.date_from + timedelta(days=self.n_days - 1)
+
+    def is_current(self):
+        """Return False once the file at ``path`` was replaced by a newer build."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return (stat.st_ino, stat.st_mtime_ns) == (self._stat.st_ino, self._stat.st_mtime_ns)
+
+    def covers(self, valuation_date):
+        return self.date_from <= valuation_date <= self.date_to
+
+    def has_newer_rates(self):
+        """True if rates within the snapshot's dates were written after it was built (one indexed query)."""
+        last_write = UNIX_EPOCH + timedelta(microseconds=self.last_write_ns // 1000)
+        return CurrencyExchangeRate.objects.filter(
+            updated_at__gt=last_write, valuation_date__range=[self.date_from, self.date_to]
+        ).exists()
+
+    def get_scaled(self, source_code, target_code, valuation_date):
+        """Return the rate scaled by ``10 ** scale`` or ``None``."""
+        source = self._index.get(source_code)
+        target = self._index.get(target_code)
+        day = (valuation_date - self.date_from).days
+        if source is None or target is None or not 0 <= day < self.n_days:
+            return None
+        n = len(self.codes)
+        value = self._data[(source * n + target) * self.n_days + day]
+        return value or None
+
+    def get_rate(self, source_code, target_code, valuation_date):
+        """Return the rate as a ``Decimal`` or ``None`` if it is not in the snapshot."""
+        scaled = self.get_scaled(source_code, target_code, valuation_date)
+        if scaled is None:
+            return None
+        return Decimal(scaled).scaleb(-self.scale)
+
+
+def build_rate_snapshot(path, date_from=None, date_to=None):
+    """
+    Build a snapshot of the stored rates between ``date_from`` and
+    ``date_to`` (defaults: the whole table) and atomically install it at
+    ``path``. Only active providers' rows are included; when several
+    stored the same cell, the highest-priority provider wins (ties: the
+    oldest row). Returns the installed ``RateSnapshot``.
+    """
+    # Read before the rows: a write racing the build counts as newer
+    last_write = CurrencyExchangeRate.objects.aggregate(last=Max('updated_at'))['last']
+    rates = CurrencyExchangeRate.objects.filter(
+        is_active=True, provider__in=[p.name for p in registry.active_providers()]
+    )
+    if date_from:
+        rates = rates.filter(valuation_date__gte=date_from)
+    if date_to:
+        rates = rates.filter(valuation_date__lte=date_to)
+
+    bounds = rates.aggregate(first=Min('valuation_date'), last=Max('valuation_date'))
+    date_from = date_from or bounds['first'] or date.today()
+    date_to = date_to or bounds['last'] or date_from
+    n_days = (date_to - date_from).days + 1
+
+    codes = sorted(
+        set(rates.values_list('source_code', flat=True).distinct())
+        | set(rates.values_list('target_code', flat=True).distinct())
+    )
+    index = {code: i for i, code in enumerate(codes)}
+    n = len(codes)
+
+    header_and_codes = HEADER_SIZE + 3 * n
+    data_offset = -(-header_and_codes // ITEM_SIZE) * ITEM_SIZE
+    size = data_offset + n * n * n_days * ITEM_SIZE
+
+    # Lowest priority (and newest row) first, so the best value overwrites the others
+    rows = rates.annotate(
+        scaled_rate=Cast(Round(F('rate_value') * 10 ** RATE_SCALE), BigIntegerField()),
+        provider_rank=provider_rank(),
+    ).order_by('-provider_rank', '-id').values_list(
+        'source_code', 'target_code', 'valuation_date', 'scaled_rate'
+    )
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.rates-', suffix='.snap', dir=directory)
+    try:
+        with os.fdopen(fd, 'r+b') as f:
+            f.truncate(max(size, data_offset + ITEM_SIZE))
+            with mmap.mmap(f.fileno(), 0) as buffer:
+                struct.pack_into(
+                    HEADER_FORMAT, buffer, 0, MAGIC, FORMAT_VERSION, RATE_SCALE, time.time_ns(),
+                    (last_write - UNIX_EPOCH) // timedelta(microseconds=1) * 1000 if last_write else 0,
+                    date_from.toordinal(), n, n_days,
+                    data_offset
+                )
+                buffer[HEADER_SIZE:header_and_codes] = ''.join(codes).encode('ascii')
+                data = memoryview(buffer)[data_offset:].cast('q')
+                for source, target, valuation_date, scaled_rate in rows.iterator(chunk_size=10000):
+                    cell = (index[source] * n + index[target]) * n_days + (valuation_date - date_from).days
+                    data[cell] = scaled_rate
+                data.release()
+                buffer.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+    logger.info(f"Rate snapshot written to {path}: {n} currencies, {n_days} days ({size} bytes)")
+    return RateSnapshot(path)
+
+
+class _SnapshotHolder:
+    """
+    Per-process handle on the configured snapshot, remapped when the file
+    is swapped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._path = None
+        self._checked_at = 0.0
+
+    def get(self):
+        path = getattr(settings, 'RATE_SNAPSHOT_PATH', None)
+        if not path:
+            return None
+        now = time.monotonic()
+        interval = getattr(settings, 'RATE_SNAPSHOT_CHECK_INTERVAL', DEFAULT_CHECK_INTERVAL)
+        snapshot = self._snapshot
+        if snapshot is not None and self._path == path and now - self._checked_at < interval:
+            return None if snapshot.stale else snapshot
+        with self._lock:
+            self._checked_at = now
+            if self._snapshot is None or self._path != path or not self._snapshot.is_current():
+                try:
+                    self._snapshot = RateSnapshot(path)
+                    self._path = path
+                except (FileNotFoundError, ValueError) as e:
+                    logger.warning(f"Rate snapshot unavailable at {path}: {e}")
+                    self._snapshot = None
+                    return None
+            snapshot = self._snapshot
+            if not snapshot.stale and snapshot.has_newer_rates():
+                logger.info(f"Rate snapshot {path} is older than the stored rates, ignored until rebuilt")
+                snapshot.stale = True
+            return None if snapshot.stale else snapshot
+
+    def rates_written(self, dates):
+        snapshot = self._snapshot
+        if snapshot is not None and not snapshot.stale and any(snapshot.covers(d) for d in dates):
+            snapshot.stale = True
+
+
+_holder = _SnapshotHolder()
+
+
+def get_rate_snapshot():
+    """Return the current ``RateSnapshot``, or ``None`` if none is configured/built or it is out of date."""
+    return _holder.get()
+
+
+def rates_written(dates):
+    """Stop using the snapshot once rates within its dates are written (by this process)."""
+    _holder.rates_written(dates)
@@ -0,0 +1,323 @@
+"""
+Live rate updates for the Server-Sent Events stream (``/api/v1/rates/stream/``).
+
+Rates are published once the transaction that wrote them commits
+(``rates_written``). ``RateBroker`` fans them out inside one process:
+subscriptions are indexed by topic (a source currency ``EUR`` or a pair
+``EUR/USD``), so a publish only touches the matching subscribers, and an
+idle subscription is a small bounded queue. Publishing from another thread
+schedules one callback per event loop, not one per subscriber.
+
+With RATE_STREAM_SOCKET_DIR set, processes exchange updates over Unix
+datagram sockets in that directory: each process binds a uniquely named
+socket there while it has subscribers (and removes it with the last one),
+and publishers send every batch to all of them, so the web processes, job
+workers and management commands reach each other's subscribers without a
+broker. Before loading any rate, publishers probe the sockets with an empty
+datagram; sockets left by dead processes refuse it and are removed.
+"""
+import asyncio
+import atexit
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+
+from ..models import CurrencyExchangeRate
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 100
+# Keeps each datagram well below the default socket buffer size
+EVENTS_PER_DATAGRAM = 100
+
+
+class Subscription:
+    """Updates for a set of topics, consumed by one stream on its event loop."""
+    __slots__ = ('topics', 'loop', 'queue', 'dropped')
+
+    def __init__(self, topics, loop, maxsize):
+        self.topics = topics
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def put(self, event):
+        if self.queue.full():
+            # Slow consumer: drop its oldest update instead of buffering without bound
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class RateBroker:
+    """In-process fan-out of rate events to subscriptions, by topic."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._topics = defaultdict(set)
+        self._loops = defaultdict(int)
+
+    def subscribe(self, topics, maxsize=None):
+        """Subscribe to ``topics``; must be called on the loop that consumes the subscription."""
+        maxsize = maxsize or getattr(settings, 'RATE_STREAM_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)
+        subscription = Subscription(frozenset(topics), asyncio.get_running_loop(), maxsize)
+        with self._lock:
+            for topic in subscription.topics:
+                self._topics[topic].add(subscription)
+            self._loops[subscription.loop] += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                subscriptions = self._topics.get(topic)
+                if subscriptions is not None:
+                    subscriptions.discard(subscription)
+                    if not subscriptions:
+                        del self._topics[topic]
+            self._loops[subscription.loop] -= 1
+            if not self._loops[subscription.loop]:
+                del self._loops[subscription.loop]
+
+    def has_subscribers(self):
+        return bool(self._topics)
+
+    def publish(self, events):
+        """Deliver ``events`` to the matching subscriptions; callable from any thread."""
+        with self._lock:
+            loops = list(self._loops)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        for loop in loops:
+            if loop is running:
+                self._dispatch(events, loop)
+                continue
+            try:
+                loop.call_soon_threadsafe(self._dispatch, events, loop)
+            except RuntimeError:
+                # Loop closed while its subscriptions were being torn down
+                pass
+
+    def _dispatch(self, events, loop):
+        with self._lock:
+            for event in events:
+                source = event['source_currency']
+                pair = f"{source}/{event['exchanged_currency']}"
+                for subscription in self._topics.get(source, set()) | self._topics.get(pair, set()):
+                    if subscription.loop is loop:
+                        subscription.put(event)
+
+
+class LocalBackend:
+    """Single-process backend: publishes straight to the broker."""
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def attach(self):
+        pass
+
+    def close(self):
+        pass
+
+    def has_subscribers(self):
+        return self.broker.has_subscribers()
+
+    def publish(self, events):
+        self.broker.publish(events)
+
+
+class UnixDatagramBackend:
+    """
+    Local pub/sub between processes of one host over Unix datagram sockets
+    in ``directory``; received batches go to this process's broker.
+    """
+
+    def __init__(self, directory, broker):
+        self.directory = directory
+        self.broker = broker
+        self._lock = threading.Lock()
+        self._socket = None
+        self._path = None
+
+    def _endpoints(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, name) for name in names if name.endswith('.sock')]
+
+    @staticmethod
+    def _prune(path):
+        logger.info(f"Removing stale rate stream socket {path}")
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def attach(self):
+        """Bind this process's socket (once) and start reading it."""
+        with self._lock:
+            if self._socket is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            # Unique across containers sharing the directory (their pids often coincide)
+            path = os.path.join(self.directory, f'{uuid.uuid4().hex}.sock')
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(path)
+            self._socket, self._path = sock, path
+            atexit.register(self.close)
+        threading.Thread(target=self._read, args=(sock,), name='rate-stream-reader', daemon=True).start()
+
+    def close(self):
+        """Remove this process's socket (when its last subscriber leaves, and at exit)."""
+        with self._lock:
+            if self._socket is None:
+                return
+            self._socket.close()
+            try:
+                os.unlink(self._path)
+            except FileNotFoundError:
+                pass
+            self._socket = self._path = None
+
+    def _read(self, sock):
+        while True:
+            try:
+                payload = sock.recv(65536)
+            except OSError:
+                return
+            if not payload:
+                # Liveness probe from a publisher
+                continue
+            try:
+                self.broker.publish(json.loads(payload))
+            except ValueError:
+                logger.warning(f"Ignoring malformed rate stream datagram ({len(payload)} bytes)")
+
+    def has_subscribers(self):
+        """True if a live socket is bound: each one is probed, those of dead processes are removed."""
+        live = False
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sender:
+            sender.setblocking(False)
+            for path in self._endpoints():
+                try:
+                    sender.sendto(b'', path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    self._prune(path)
+                    continue
+                except BlockingIOError:
+                    # Full, but bound by a live process
+                    pass
+                except OSError as e:
+                    logger.warning(f"Could not probe rate stream socket {path}: {e}")
+                    continue
+                live = True
+        return live
+
+    def publish(self, events):
+        payloads = [
+            json.dumps(events[i:i + EVENTS_PER_DATAGRAM]).encode()
+            for i in range(0, len(events), EVENTS_PER_DATAGRAM)
+        ]
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sender:
+            sender.setblocking(False)
+            for path in self._endpoints():
+                for payload in payloads:
+                    try:
+                        sender.sendto(payload, path)
+                    except (ConnectionRefusedError, FileNotFoundError):
+                        self._prune(path)
+                        break
+                    except BlockingIOError:
+                        logger.warning(f"Rate stream socket {path} is full, dropping {len(events)} updates")
+                        break
+                    except OSError as e:
+                        logger.warning(f"Could not publish rate updates to {path}: {e}")
+                        break
+
+
+broker = RateBroker()
+_backend = None
+_attach_lock = threading.Lock()
+
+
+def get_backend():
+    """The configured backend (Unix datagrams when RATE_STREAM_SOCKET_DIR is set)."""
+    global _backend
+    directory = getattr(settings, 'RATE_STREAM_SOCKET_DIR', None)
+    if directory:
+        if not isinstance(_backend, UnixDatagramBackend) or _backend.directory != directory:
+            _backend = UnixDatagramBackend(directory, broker)
+    elif not isinstance(_backend, LocalBackend):
+        _backend = LocalBackend(broker)
+    return _backend
+
+
+def subscribe(topics):
+    """Subscribe the running event loop to ``topics`` (``EUR`` or ``EUR/USD``)."""
+    with _attach_lock:
+        subscription = broker.subscribe(topics)
+        get_backend().attach()
+    return subscription
+
+
+def unsubscribe(subscription):
+    with _attach_lock:
+        broker.unsubscribe(subscription)
+        if not broker.has_subscribers():
+            # Nobody left to deliver to: stop drawing publishers' traffic
+            get_backend().close()
+
+
+def _load_events(keys):
+    """Read the active rates of (source, target, date) keys as JSON-ready events."""
+    keys = set(keys)
+    by_source = defaultdict(lambda: (set(), set()))
+    for source_code, target_code, valuation_date in keys:
+        by_source[source_code][0].add(target_code)
+        by_source[source_code][1].add(valuation_date)
+
+    events = []
+    for source_code, (target_codes, dates) in by_source.items():
+        rows = CurrencyExchangeRate.objects.filter(
+            is_active=True,
+            source_code=source_code,
+            target_code__in=target_codes,
+            valuation_date__in=dates
+        ).values_list('target_code', 'valuation_date', 'rate_value', 'provider')
+        for target_code, valuation_date, rate_value, provider in rows:
+            if (source_code, target_code, valuation_date) in keys:
+                events.append({
+                    'source_currency': source_code,
+                    'exchanged_currency': target_code,
+                    'valuation_date': valuation_date.isoformat(),
+                    'rate_value': str(rate_value),
+                    'provider': provider,
+                })
+    return events
+
+
+def publish_rates(keys):
+    """
+    Publish the current rates of the written (source, target, date) keys.
+    Skips the lookup when nobody is subscribed. Returns the number of events.
+    """
+    backend = get_backend()
+    if not backend.has_subscribers():
+        return 0
+    events = _load_events(keys)
+    if events:
+        backend.publish(events)
+    return len(events)
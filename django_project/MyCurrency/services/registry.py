@@ -0,0 +1,119 @@
+"""
+Process-local registry of currencies and active providers.
+
+Both tables are small and change rarely, so every process keeps them in memory
+and conversions resolve currencies and provider order without touching the
+database. Local copies are dropped through model signals. Other processes
+notice changes through a version stamp stored in the database
+(``ServiceState``), checked at most every REGISTRY_VERSION_CHECK_SECONDS, or
+are cleared by the invalidation bus while its listener is connected
+(``push_invalidated``), which saves the stamp checks altogether.
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+from ..models import Currency, Provider, ServiceState
+
+logger = logging.getLogger(__name__)
+
+VERSION_STATE_KEY = 'registry:version'
+DEFAULT_VERSION_CHECK_SECONDS = 1.0
+
+_Snapshot = namedtuple('_Snapshot', ['currencies', 'providers', 'version'])
+
+
+class Registry:
+    """
+    In-memory snapshot of the Currency and Provider tables.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = 0.0
+        self.push_invalidated = False
+
+    def _current_version(self):
+        return ServiceState.get_value(VERSION_STATE_KEY)
+
+    def _is_current(self, snapshot):
+        if self.push_invalidated:
+            return True
+        interval = getattr(settings, 'REGISTRY_VERSION_CHECK_SECONDS', DEFAULT_VERSION_CHECK_SECONDS)
+        if time.monotonic() - self._checked_at < interval:
+            return True
+        current = self._current_version() == snapshot.version
+        self._checked_at = time.monotonic()
+        return current
+
+    def _ensure_loaded(self):
+        """
+        Return the current snapshot, loading it if needed. Callers read only
+        from the returned snapshot: a concurrent clear() replaces the
+        registry's reference, never the snapshot itself.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and self._is_current(snapshot):
+            return snapshot
+        with self._lock:
+            if self._snapshot is not None and self._snapshot is not snapshot:
+                # Reloaded by another thread meanwhile
+                return self._snapshot
+            version = self._current_version()
+            snapshot = _Snapshot(
+                {c.code: c for c in Currency.objects.all()},
+                list(Provider.objects.all().order_by('priority', 'created_at')),
+                version
+            )
+            self._snapshot = snapshot
+            self._checked_at = time.monotonic()
+            logger.debug(
+                f"Registry loaded: {len(snapshot.currencies)} currencies, {len(snapshot.providers)} providers"
+            )
+            return snapshot
+
+    def load(self):
+        """Force a (re)load from the database."""
+        self.clear()
+        self._ensure_loaded()
+
+    def clear(self):
+        """Drop the local copy; the next access reloads it."""
+        with self._lock:
+            self._snapshot = None
+
+    def invalidate(self):
+        """Drop the local copy and bump the shared stamp so other processes reload too."""
+        self.clear()
+        ServiceState.set_value(VERSION_STATE_KEY, time.time_ns())
+
+    def get_currency(self, code):
+        """Return the Currency for ``code`` or ``None`` if it does not exist."""
+        return self._ensure_loaded().currencies.get(code)
+
+    def get_currencies(self, codes):
+        """Return a dict code -> Currency for the codes that exist."""
+        currencies = self._ensure_loaded().currencies
+        return {code: currencies[code] for code in codes if code in currencies}
+
+    def all_currencies(self):
+        """Return every Currency ordered by code."""
+        return sorted(self._ensure_loaded().currencies.values(), key=lambda c: c.code)
+
+    def all_providers(self):
+        """Return every provider (active or not) ordered by priority."""
+        return list(self._ensure_loaded().providers)
+
+    def active_providers(self, provider_name=None):
+        """Return the active providers ordered by priority, optionally only ``provider_name``."""
+        providers = [p for p in self._ensure_loaded().providers if p.is_active]
+        if provider_name:
+            providers = [p for p in providers if p.name == provider_name]
+        return providers
+
+
+registry = Registry()
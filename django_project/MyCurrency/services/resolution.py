@@ -0,0 +1,48 @@
+"""
+Best-provider resolution: one rate per (source, target, date).
+
+Several providers can store a rate for the same day. The best one is the
+active provider with the lowest ``Provider.priority`` (registry order);
+unknown or inactive providers rank last, ties go to the oldest row. The
+choice is made in SQL: ``DISTINCT ON`` on PostgreSQL, a ``ROW_NUMBER()``
+window elsewhere.
+"""
+from django.db import connections
+from django.db.models import Case, F, IntegerField, Value, When, Window
+from django.db.models.functions import RowNumber
+
+from .registry import registry
+
+RATE_KEY_FIELDS = ('source_code', 'target_code', 'valuation_date')
+
+
+def provider_rank():
+    """``CASE`` expression giving each row its provider's rank (0 = highest priority)."""
+    providers = registry.active_providers()
+    return Case(
+        *[When(provider=p.name, then=Value(i)) for i, p in enumerate(providers)],
+        default=Value(len(providers)),
+        output_field=IntegerField()
+    )
+
+
+def provider_ranking_key():
+    """The active providers in priority order, for cache keys of resolved responses."""
+    return ','.join(p.name for p in registry.active_providers())
+
+
+def best_rates(queryset):
+    """
+    Restrict a ``CurrencyExchangeRate`` queryset to its best row per
+    (source, target, date). The result can be ordered, annotated and
+    aggregated like any queryset.
+    """
+    ranked = queryset.annotate(provider_rank=provider_rank())
+    if connections[queryset.db].vendor == 'postgresql':
+        best = ranked.order_by(*RATE_KEY_FIELDS, 'provider_rank', 'id').distinct(*RATE_KEY_FIELDS)
+        return queryset.filter(pk__in=best.values('pk'))
+    return ranked.annotate(provider_row=Window(
+        RowNumber(),
+        partition_by=[F(field) for field in RATE_KEY_FIELDS],
+        order_by=[F('provider_rank').asc(), F('id').asc()]
+    )).filter(provider_row=1)
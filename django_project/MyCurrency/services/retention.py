@@ -0,0 +1,202 @@
+"""
+Retention engine for the rate history.
+
+``unique_together`` includes the provider, so every provider ever used keeps
+its own row per pair and day. RATE_RETENTION_POLICIES lists age-based
+actions, applied from the youngest to the oldest cutoff:
+
+    compact   keep only the winning row (highest-priority active provider)
+              of each pair and day older than ``after_days``
+    archive   export rows older than ``after_days`` to compressed archive
+              files (see ``rate_archive``) in RATE_RETENTION_ARCHIVE_DIR,
+              verify them and delete the rows
+
+Work is done in bounded batches, each in its own short transaction with
+deletes by primary key, so the live table is never locked for long. Runs can
+be time-boxed; compaction keeps its progress in the database (``ServiceState``,
+so it survives the process of each run) and archiving
+always resumes from the oldest remaining row, so an interrupted run picks up
+where it stopped.
+"""
+import logging
+import os
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from ..models import CurrencyExchangeRate, ServiceState
+from ..signals import notify_rates_written
+from .rate_archive import RateArchiveReader, export_rates
+from .registry import registry
+
+logger = logging.getLogger(__name__)
+
+RETENTION_ACTIONS = ('compact', 'archive')
+DEFAULT_POLICIES = [{'action': 'compact', 'after_days': 90}]
+DEFAULT_BATCH_SIZE = 5000
+# Maximum ids per DELETE statement
+DELETE_CHUNK_SIZE = 500
+COMPACT_CURSOR_KEY = 'retention:compact:cursor'
+
+
+def get_policies():
+    """Return the configured policies, validated and sorted by age."""
+    policies = getattr(settings, 'RATE_RETENTION_POLICIES', DEFAULT_POLICIES)
+    for policy in policies:
+        if policy.get('action') not in RETENTION_ACTIONS:
+            raise ImproperlyConfigured(f"Unknown retention action: {policy.get('action')}")
+        if not isinstance(policy.get('after_days'), int) or policy['after_days'] < 0:
+            raise ImproperlyConfigured(f"Retention policy needs a non-negative 'after_days': {policy}")
+    return sorted(policies, key=lambda p: p['after_days'])
+
+
+def _delete_rates(rows):
+    """
+    Delete rates by id in short transactions and announce them.
+    ``rows`` are (id, source_code, target_code, valuation_date).
+    """
+    table = connection.ops.quote_name(CurrencyExchangeRate._meta.db_table)
+    for start in range(0, len(rows), DELETE_CHUNK_SIZE):
+        chunk = rows[start:start + DELETE_CHUNK_SIZE]
+        ids = [row[0] for row in chunk]
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Raw delete: skips the per-instance collection and post_delete signals
+            cursor.execute(f"DELETE FROM {table} WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+        notify_rates_written(CurrencyExchangeRate, [(source, target, day) for _id, source, target, day in chunk])
+    return len(rows)
+
+
+def _out_of_time(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def compact_rates(before, batch_size=DEFAULT_BATCH_SIZE, deadline=None, restart=False, pause=0.0):
+    """
+    Delete, for every pair and day before ``before``, all rows but the one
+    of the highest-priority active provider (unknown or inactive providers
+    rank last, ties go to the oldest row). Processes whole days, about
+    ``batch_size`` rows per batch. Returns a stats dict.
+    """
+    ranks = {p.name: i for i, p in enumerate(registry.active_providers())}
+    rates = CurrencyExchangeRate.objects.filter(valuation_date__lt=before)
+    stats = {'action': 'compact', 'before': before, 'batches': 0, 'rows_deleted': 0, 'complete': False}
+
+    cursor_date = None if restart else ServiceState.get_value(COMPACT_CURSOR_KEY)
+    start = (cursor_date and date.fromisoformat(cursor_date)) or rates.aggregate(first=Min('valuation_date'))['first']
+    fields = ('id', 'source_code', 'target_code', 'valuation_date', 'provider')
+
+    while start is not None and start < before:
+        if _out_of_time(deadline):
+            return stats
+
+        rows = list(rates.filter(valuation_date__gte=start).order_by('valuation_date', 'id').values_list(*fields)[:batch_size + 1])
+        if not rows:
+            break
+        last_day = rows[-1][3]
+        if len(rows) > batch_size:
+            # The last day may be cut off: leave it for the next batch,
+            # unless it is the only one, then take the whole day
+            rows = [row for row in rows if row[3] < last_day] or list(
+                rates.filter(valuation_date=last_day).order_by('id').values_list(*fields)
+            )
+            last_day = rows[-1][3]
+
+        cells = {}
+        for row in rows:
+            cells.setdefault(row[1:4], []).append(row)
+        losers = []
+        for candidates in cells.values():
+            candidates.sort(key=lambda row: (ranks.get(row[4], len(ranks)), row[0]))
+            losers.extend(row[:4] for row in candidates[1:])
+
+        stats['rows_deleted'] += _delete_rates(losers)
+        stats['batches'] += 1
+        start = last_day + timedelta(days=1)
+        ServiceState.set_value(COMPACT_CURSOR_KEY, start.isoformat())
+        if pause:
+            time.sleep(pause)
+
+    stats['complete'] = True
+    logger.info(f"Compacted rates before {before}: {stats['rows_deleted']} rows deleted in {stats['batches']} batches")
+    return stats
+
+
+def archive_rates(before, archive_dir, batch_size=DEFAULT_BATCH_SIZE, deadline=None, pause=0.0):
+    """
+    Move the rows before ``before`` into archive files, one calendar month
+    per file (``rates-YYYY-MM-<timestamp>.mcra``), deleting them only once
+    the file is written and verified. Each month gets one pass per run:
+    rows updated while it is being exported stay in the table and go into
+    a new file on the next run. Returns a stats dict.
+    """
+    rates = CurrencyExchangeRate.objects.filter(valuation_date__lt=before)
+    stats = {'action': 'archive', 'before': before, 'batches': 0, 'rows_deleted': 0, 'archives': [], 'complete': False}
+    os.makedirs(archive_dir, exist_ok=True)
+
+    month_start = None
+    while not _out_of_time(deadline):
+        remaining = rates if month_start is None else rates.filter(valuation_date__gte=month_start)
+        first = remaining.aggregate(first=Min('valuation_date'))['first']
+        if first is None:
+            stats['complete'] = True
+            break
+        month_start = first.replace(day=1)
+        next_month = (month_start + timedelta(days=32)).replace(day=1)
+        month_rates = rates.filter(valuation_date__gte=month_start, valuation_date__lt=next_month)
+
+        started_at = timezone.now()
+        path = os.path.join(archive_dir, f"rates-{month_start:%Y-%m}-{started_at:%Y%m%d%H%M%S%f}.mcra")
+        chunks = export_rates(path, queryset=month_rates, chunk_rows=batch_size)
+        exported = sum(chunk['rows'] for chunk in chunks)
+        if RateArchiveReader(path).verify() != exported:
+            raise RuntimeError(f"Archive {path} failed verification, no rows were deleted.")
+        stats['archives'].append(path)
+
+        archived = month_rates.filter(updated_at__lte=started_at)
+        fields = ('id', 'source_code', 'target_code', 'valuation_date')
+        while True:
+            rows = list(archived.order_by('id').values_list(*fields)[:batch_size])
+            if not rows:
+                break
+            stats['rows_deleted'] += _delete_rates(rows)
+            stats['batches'] += 1
+            if pause:
+                time.sleep(pause)
+            if _out_of_time(deadline):
+                # The rest of the month is already archived; the next run archives it again
+                return stats
+        month_start = next_month
+
+    logger.info(f"Archived rates before {before}: {stats['rows_deleted']} rows into {len(stats['archives'])} files")
+    return stats
+
+
+def run_retention(today=None, policies=None, batch_size=None, max_seconds=None, restart=False, archive_dir=None):
+    """
+    Apply every retention policy. Entry point for the ``apply_retention``
+    command and for schedulers (cron, a worker loop): call it periodically,
+    optionally time-boxed with ``max_seconds``. Returns one stats dict per
+    policy; ``complete`` is False when the time box ran out first.
+    """
+    today = today or date.today()
+    policies = policies if policies is not None else get_policies()
+    batch_size = batch_size or getattr(settings, 'RATE_RETENTION_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    pause = getattr(settings, 'RATE_RETENTION_BATCH_PAUSE', 0.0)
+    archive_dir = archive_dir or getattr(settings, 'RATE_RETENTION_ARCHIVE_DIR', None)
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+
+    results = []
+    for policy in policies:
+        before = today - timedelta(days=policy['after_days'])
+        if policy['action'] == 'compact':
+            results.append(compact_rates(before, batch_size, deadline, restart=restart, pause=pause))
+        else:
+            if not archive_dir:
+                raise ImproperlyConfigured("RATE_RETENTION_ARCHIVE_DIR is required by the archive policy.")
+            results.append(archive_rates(before, archive_dir, batch_size, deadline, pause=pause))
+    return results
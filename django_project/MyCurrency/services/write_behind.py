@@ -0,0 +1,247 @@
+"""
+Write-behind buffer for rates fetched on the request path.
+
+Fetched rates are returned to the caller immediately and queued here; a
+background thread persists them with one multi-row upsert every
+RATE_WRITE_BEHIND_INTERVAL seconds, or as soon as RATE_WRITE_BEHIND_MAX_ROWS
+rows are pending. The buffer is flushed on interpreter exit (``atexit``), so
+a graceful shutdown does not lose queued rates. With
+RATE_WRITE_BEHIND_ENABLED = False rates are upserted synchronously instead.
+
+Failed flushes keep their rates queued. Rows the database rejects are
+isolated by retrying the batch in halves and dropped (logged) after
+RATE_WRITE_BEHIND_MAX_ATTEMPTS rejections. At most
+RATE_WRITE_BEHIND_MAX_PENDING rates are held; beyond that the oldest go.
+"""
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, connection, transaction
+
+from ..models import CurrencyExchangeRate
+from ..signals import notify_rates_written
+from ..tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Default seconds between flushes and pending rows that trigger an early flush
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_MAX_ROWS = 500
+# Failed writes of one rate before it is dropped, and pending rates kept at most
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_MAX_PENDING = 50000
+
+UNIQUE_FIELDS = ['source_currency', 'exchanged_currency', 'valuation_date', 'provider']
+
+
+def upsert_rates(rates):
+    """
+    Insert or update ``CurrencyExchangeRate`` instances in one statement
+    and announce them through ``rates_written``.
+    """
+    if not rates:
+        return 0
+    with span('rates.upsert', rows=len(rates)):
+        CurrencyExchangeRate.objects.bulk_create(
+            rates,
+            update_conflicts=True,
+            unique_fields=UNIQUE_FIELDS,
+            update_fields=['rate_value', 'updated_at']
+        )
+    notify_rates_written(CurrencyExchangeRate, [
+        (rate.source_currency.code, rate.exchanged_currency.code, rate.valuation_date) for rate in rates
+    ])
+    return len(rates)
+
+
+def _rate(key, value):
+    _source_code, _target_code, valuation_date, provider = key
+    source_currency, exchanged_currency, rate_value = value
+    return CurrencyExchangeRate(
+        source_currency=source_currency,
+        exchanged_currency=exchanged_currency,
+        valuation_date=valuation_date,
+        rate_value=rate_value,
+        provider=provider
+    )
+
+
+class WriteBehindBuffer:
+    """
+    Thread-safe queue of pending rates, keyed by (source, target, date,
+    provider) so a newer fetch of the same row replaces the queued one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending = {}
+        # Rows taken by a running flush; still visible to get_pending()
+        self._flushing = {}
+        # Failed write attempts of the rates put back after a flush
+        self._attempts = {}
+        self._thread = None
+        self._stopping = False
+        self._atexit_registered = False
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def enqueue(self, source_currency, exchanged_currency, valuation_date, provider, rate_value):
+        """Queue a rate for writing; returns immediately."""
+        key = (source_currency.code, exchanged_currency.code, valuation_date, provider)
+        with self._lock:
+            self._pending[key] = (source_currency, exchanged_currency, rate_value)
+            self._attempts.pop(key, None)
+            self._trim()
+            size = len(self._pending)
+        self._ensure_thread()
+        if size >= getattr(settings, 'RATE_WRITE_BEHIND_MAX_ROWS', DEFAULT_MAX_ROWS):
+            self._wakeup.set()
+
+    def get_pending(self, source_code, target_code, valuation_date, providers=()):
+        """
+        Return a queued (not yet persisted) rate for the cell, or ``None``.
+        When ``providers`` is given, only their rates are considered, in that
+        order; otherwise any provider's.
+        """
+        with self._lock:
+            candidates = {
+                provider: value[2]
+                for rows in (self._flushing, self._pending)
+                for (source, target, day, provider), value in rows.items()
+                if (source, target, day) == (source_code, target_code, valuation_date)
+            }
+        if providers:
+            return next((candidates[provider] for provider in providers if provider in candidates), None)
+        return next(iter(candidates.values()), None)
+
+    def flush(self):
+        """Persist every pending rate with one upsert; returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                self._flushing, self._pending = self._pending, {}
+                rows = self._flushing
+            if not rows:
+                return 0
+            try:
+                written, rejected, unsent = self._write(list(rows.items()))
+            finally:
+                with self._lock:
+                    self._flushing = {}
+            self._requeue(rejected, unsent)
+            return written
+
+    def _write(self, items):
+        """
+        Upsert ``items``; returns (rows written, items rejected, items not
+        sent). A rejected batch is split in halves until the failing rows are
+        isolated, so one bad row does not hold back the others. When the
+        database cannot be reached, the whole batch is left for the next flush.
+        """
+        try:
+            with transaction.atomic():
+                return upsert_rates([_rate(key, value) for key, value in items]), [], []
+        except (OperationalError, InterfaceError) as e:
+            logger.warning(f"Write-behind flush of {len(items)} rates failed, will retry: {e}")
+            return 0, [], items
+        except Exception as e:
+            if len(items) == 1:
+                logger.warning(f"Write-behind rate {items[0][0]} rejected: {e}")
+                return 0, items, []
+        middle = len(items) // 2
+        first = self._write(items[:middle])
+        last = self._write(items[middle:])
+        return first[0] + last[0], first[1] + last[1], first[2] + last[2]
+
+    def _requeue(self, rejected, unsent):
+        """Put failed rates back, unless a newer fetch was queued meanwhile; drop rates rejected too often."""
+        max_attempts = getattr(settings, 'RATE_WRITE_BEHIND_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+        dropped = []
+        requeued = dict(unsent)
+        with self._lock:
+            for key, value in rejected:
+                attempts = self._attempts.get(key, 0) + 1
+                if attempts >= max_attempts:
+                    self._attempts.pop(key, None)
+                    dropped.append((key, value[2]))
+                else:
+                    self._attempts[key] = attempts
+                    requeued[key] = value
+            # Older than anything queued meanwhile: first in line, and first to go when full
+            self._pending = {**requeued, **self._pending}
+            self._trim()
+        for key, rate_value in dropped:
+            logger.error(f"Write-behind rate {key} = {rate_value} dropped after {max_attempts} rejected writes")
+
+    def _trim(self):
+        # Called with the lock held: beyond the cap the oldest rates are dropped
+        max_pending = getattr(settings, 'RATE_WRITE_BEHIND_MAX_PENDING', DEFAULT_MAX_PENDING)
+        overflow = len(self._pending) - max_pending
+        if overflow <= 0:
+            return
+        for key in list(self._pending)[:overflow]:
+            del self._pending[key]
+            self._attempts.pop(key, None)
+        logger.error(f"Write-behind buffer full ({max_pending} rates): dropped the {overflow} oldest")
+
+    def close(self):
+        """Stop the flusher thread and write everything still queued."""
+        self._stopping = True
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout=getattr(settings, 'RATE_WRITE_BEHIND_INTERVAL', DEFAULT_FLUSH_INTERVAL) * 5)
+        self.flush()
+        remaining = len(self)
+        if remaining:
+            logger.error(f"Write-behind buffer closed with {remaining} unwritten rates")
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='rate-write-behind', daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.close)
+                self._atexit_registered = True
+
+    def _run(self):
+        interval = getattr(settings, 'RATE_WRITE_BEHIND_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+        try:
+            while not self._stopping:
+                self._wakeup.wait(interval)
+                self._wakeup.clear()
+                if self.flush():
+                    # Do not hold a connection between flushes
+                    connection.close()
+        finally:
+            connection.close()
+
+
+write_behind = WriteBehindBuffer()
+
+
+def save_rate(source_currency, exchanged_currency, valuation_date, provider, rate_value):
+    """
+    Persist a fetched rate: queued in the write-behind buffer, or upserted
+    right away when RATE_WRITE_BEHIND_ENABLED is False.
+    """
+    if getattr(settings, 'RATE_WRITE_BEHIND_ENABLED', True):
+        write_behind.enqueue(source_currency, exchanged_currency, valuation_date, provider, rate_value)
+    else:
+        upsert_rates([CurrencyExchangeRate(
+            source_currency=source_currency,
+            exchanged_currency=exchanged_currency,
+            valuation_date=valuation_date,
+            rate_value=rate_value,
+            provider=provider
+        )])
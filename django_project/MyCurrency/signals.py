@@ -0,0 +1,128 @@
+"""
+Signal receivers that keep in-process caches in sync with the database.
+"""
+import logging
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .caching import rate_range_cache
+from .models import Currency, CurrencyExchangeRate, Provider
+from .services.invalidation import get_bus
+from .services.rate_snapshot import rates_written as snapshot_rates_written
+from .services.rate_stream import publish_rates
+from .services.registry import registry
+
+logger = logging.getLogger(__name__)
+
+# Sent after rates are written outside of Model.save() (bulk_create, upserts).
+# Receivers get ``rates``: an iterable of (source_code, target_code, valuation_date),
+# and ``committed``: False for the early send made inside a transaction.
+rates_written = Signal()
+
+
+def notify_rates_written(sender, rates):
+    """
+    Announce written rates now and, inside a transaction, again once it
+    commits, so readers that refilled a cache in between are evicted too.
+    """
+    rates = list(rates)
+    if not rates:
+        return
+    connection = transaction.get_connection()
+    in_transaction = connection.in_atomic_block
+    rates_written.send(sender=sender, rates=rates, committed=not in_transaction)
+    if in_transaction:
+        transaction.on_commit(lambda: rates_written.send(sender=sender, rates=rates, committed=True))
+
+
+def _bus_enabled():
+    return getattr(settings, 'INVALIDATION_BUS_ENABLED', True)
+
+
+def _registry_change_committed():
+    # A reader in this process may have reloaded the registry between the
+    # write and the commit, and this process ignores its own notification
+    registry.clear()
+    if _bus_enabled():
+        _broadcast_registry_change()
+
+
+def _broadcast_registry_change():
+    try:
+        get_bus().publish_registry()
+    except Exception as e:
+        logger.exception(f"Could not broadcast registry change: {e}")
+
+
+@receiver(request_started)
+def start_invalidation_listener(sender, **kwargs):
+    # Serving processes evict what other processes write; started lazily so
+    # management commands (migrate, workers) never hold a listener
+    if _bus_enabled():
+        get_bus().start()
+
+
+def notify_registry_changed():
+    """
+    Evict the registry here now and, once the write commits, again here and
+    in the other processes (for writes that send no model signal, e.g.
+    bulk_create).
+    """
+    registry.invalidate()
+    transaction.on_commit(_registry_change_committed)
+
+
+@receiver(post_save, sender=Currency)
+@receiver(post_delete, sender=Currency)
+@receiver(post_save, sender=Provider)
+@receiver(post_delete, sender=Provider)
+def invalidate_registry(sender, **kwargs):
+    notify_registry_changed()
+
+
+@receiver(post_save, sender=CurrencyExchangeRate)
+@receiver(post_delete, sender=CurrencyExchangeRate)
+def rate_saved(sender, instance, **kwargs):
+    notify_rates_written(sender, [
+        (instance.source_code, instance.target_code, instance.valuation_date)
+    ])
+
+
+@receiver(rates_written)
+def invalidate_rate_ranges(sender, rates, **kwargs):
+    dates_by_source = {}
+    for source_code, _target_code, valuation_date in rates:
+        dates_by_source.setdefault(source_code, set()).add(valuation_date)
+    for source_code, dates in dates_by_source.items():
+        rate_range_cache.invalidate(source_code, dates)
+
+
+@receiver(rates_written)
+def invalidate_rate_snapshot(sender, rates, **kwargs):
+    snapshot_rates_written({valuation_date for _source_code, _target_code, valuation_date in rates})
+
+
+@receiver(rates_written)
+def publish_rate_updates(sender, rates, committed=True, **kwargs):
+    # Only committed rates are pushed to the stream subscribers
+    if not committed:
+        return
+    try:
+        publish_rates(rates)
+    except Exception as e:
+        logger.exception(f"Could not publish rate updates: {e}")
+
+
+@receiver(rates_written)
+def broadcast_rate_invalidation(sender, rates, committed=True, **kwargs):
+    # Other processes evict once the rates are visible to them
+    if not committed or not _bus_enabled():
+        return
+    try:
+        get_bus().publish_rates(rates)
+    except Exception as e:
+        logger.exception(f"Could not broadcast rate invalidation: {e}")
@@ -0,0 +1,43 @@
+"""
+Shared fixtures for the MyCurrency test suite.
+"""
+import pytest
+from django.core.cache import cache
+
+from MyCurrency.services.registry import registry
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Evita que las cachés en memoria arrastren datos entre tests (el rollback no emite señales)."""
+    cache.clear()
+    registry.clear()
+    yield
+    cache.clear()
+    registry.clear()
+
+
+@pytest.fixture(autouse=True)
+def synchronous_rate_writes(settings):
+    """Escribe las tasas obtenidas en el momento (sin buffer write-behind ni hilo en segundo plano)."""
+    settings.RATE_WRITE_BEHIND_ENABLED = False
+
+
+@pytest.fixture(autouse=True)
+def no_provider_response_cache(settings):
+    """Desactiva la caché en disco de respuestas de proveedores (los tests que la usan la activan en tmp_path)."""
+    settings.PROVIDER_RESPONSE_CACHE_DIR = None
+    settings.PROVIDER_RESPONSE_CACHE_OFFLINE = False
+
+
+@pytest.fixture(autouse=True)
+def in_process_rate_stream(settings):
+    """Entrega las actualizaciones del stream dentro del proceso (sin sockets Unix compartidos)."""
+    settings.RATE_STREAM_SOCKET_DIR = None
+
+
+@pytest.fixture(autouse=True)
+def no_tracing(settings):
+    """No muestrea trazas (los tests de tracing las activan con un exportador en memoria)."""
+    settings.TRACING_SAMPLE_RATE = 0
+    settings.TRACING_EXPORTER = 'MyCurrency.tracing.InMemoryExporter'
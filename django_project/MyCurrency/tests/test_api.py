@@ -1,12 +1,24 @@
 """
 Tests for REST API endpoints.
 """
+import asyncio
+import json
 import pytest
 from decimal import Decimal
-from datetime import date
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncClient
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 
+from MyCurrency.admin_changelist import IndexedDatesQuerySet
+from MyCurrency import tracing
+from MyCurrency.caching import rate_range_cache
 from MyCurrency.models import Currency, CurrencyExchangeRate, Provider
+from MyCurrency.services.rate_stream import broker
+from MyCurrency.services.registry import registry
 
 
 @pytest.fixture
@@ -93,6 +105,26 @@ class TestExchangeRateAPI:
         assert response.status_code == 200
         assert len(response.json()) >= 1
 
+    
+    def test_request_continues_incoming_trace(self, api_client, settings, currencies, exchange_rate):
+        """Verifica que la petición continúa la traza de traceparent y nombra el span por su ruta."""
+        exporter = tracing.get_exporter()
+        exporter.spans.clear()
+        trace_id, parent_id = '4bf92f3577b34da6a3ce929d0e0e4736', '00f067aa0ba902b7'
+        today = date.today().isoformat()
+        
+        response = api_client.get(
+            f'/api/v1/rates/?source_currency=EUR&date_from={today}&date_to={today}',
+            HTTP_TRACEPARENT=f'00-{trace_id}-{parent_id}-01'
+        )
+        
+        assert response['X-Trace-Id'] == trace_id
+        server_span = next(s for s in exporter.spans if s.kind == 'server')
+        assert server_span.parent_id == parent_id
+        assert server_span.name == 'GET /api/v1/rates/'
+        assert server_span.attributes['http.status_code'] == 200
+        assert any(s.name == 'db.query' and s.parent_id == server_span.span_id for s in exporter.spans)
+
 
 class TestConvertAPI:
     """Tests para el endpoint /api/v1/convert/"""
@@ -114,3 +146,676 @@ class TestConvertAPI:
         
         assert response.status_code == 200
         assert 'converted_amount' in response.json()
+
+
+class TestConditionalRequests:
+    """Tests para las cabeceras ETag / Last-Modified y las respuestas 304."""
+    
+    def test_rates_returns_304_when_etag_matches(self, api_client, currencies, exchange_rate):
+        """Verifica que un If-None-Match válido devuelve 304 sin cuerpo."""
+        today = date.today().isoformat()
+        url = f'/api/v1/rates/?source_currency=EUR&date_from={today}&date_to={today}'
+        first = api_client.get(url)
+        
+        second = api_client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        
+        assert first.status_code == 200
+        assert second.status_code == 304
+        assert second.content == b''
+    
+    def test_rates_etag_changes_when_a_rate_is_written(self, api_client, currencies, exchange_rate):
+        """Verifica que el ETag cambia cuando se añade una tasa al rango."""
+        today = date.today().isoformat()
+        url = f'/api/v1/rates/?source_currency=EUR&date_from={today}&date_to={today}'
+        etag = api_client.get(url)['ETag']
+        CurrencyExchangeRate.objects.create(
+            source_currency=currencies['EUR'],
+            exchanged_currency=currencies['USD'],
+            valuation_date=date.today(),
+            rate_value=Decimal('1.090'),
+            provider='currency_beacon'
+        )
+        
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        
+        assert response.status_code == 200
+        assert len(response.json()) == 2
+    
+    def test_closed_range_is_cacheable_for_longer(self, api_client, currencies, exchange_rate):
+        """Verifica que un rango histórico cerrado tiene un max-age mayor que uno abierto."""
+        today = date.today().isoformat()
+        closed = api_client.get('/api/v1/rates/?source_currency=EUR&date_from=2024-01-01&date_to=2024-01-31')
+        open_ = api_client.get(f'/api/v1/rates/?source_currency=EUR&date_from=2024-01-01&date_to={today}')
+        
+        assert 'max-age=86400' in closed['Cache-Control']
+        assert 'must-revalidate' in open_['Cache-Control']
+    
+    def test_currency_list_returns_304_when_etag_matches(self, api_client, currencies):
+        """Verifica que el listado de monedas admite peticiones condicionales."""
+        etag = api_client.get('/api/v1/currencies/')['ETag']
+        
+        response = api_client.get('/api/v1/currencies/', HTTP_IF_NONE_MATCH=etag)
+        
+        assert response.status_code == 304
+
+
+class TestRateRangeCache:
+    """Tests para la caché de respuestas del listado de tasas."""
+    
+    def test_repeated_window_is_served_without_queries(self, api_client, currencies, exchange_rate,
+                                                       django_assert_num_queries):
+        """Verifica que una ventana repetida se sirve desde caché sin consultar la DB."""
+        url = '/api/v1/rates/?source_currency=EUR&date_from=2024-01-01&date_to=2024-01-31'
+        first = api_client.get(url, HTTP_ACCEPT='application/json')
+        
+        with django_assert_num_queries(0):
+            second = api_client.get(url, HTTP_ACCEPT='application/json')
+        
+        assert second.status_code == 200
+        assert second.content == first.content
+    
+    def test_write_only_invalidates_covering_ranges(self, api_client, currencies, exchange_rate):
+        """Verifica que escribir una tasa solo invalida los rangos que contienen su fecha."""
+        january = '/api/v1/rates/?source_currency=EUR&date_from=2024-01-01&date_to=2024-01-31'
+        february = '/api/v1/rates/?source_currency=EUR&date_from=2024-02-01&date_to=2024-02-29'
+        api_client.get(january, HTTP_ACCEPT='application/json')
+        api_client.get(february, HTTP_ACCEPT='application/json')
+        
+        CurrencyExchangeRate.objects.create(
+            source_currency=currencies['EUR'],
+            exchanged_currency=currencies['USD'],
+            valuation_date=date(2024, 1, 15),
+            rate_value=Decimal('1.1'),
+            provider='mock'
+        )
+        
+        key_january = rate_range_cache.make_key('EUR', date(2024, 1, 1), date(2024, 1, 31), 'json')
+        key_february = rate_range_cache.make_key('EUR', date(2024, 2, 1), date(2024, 2, 29), 'json')
+        assert cache.get(key_january) is None
+        assert cache.get(key_february) is not None
+        assert len(api_client.get(january, HTTP_ACCEPT='application/json').json()) == 1
+
+
+
+class TestRateListQueries:
+    """Tests para las consultas del listado de tasas."""
+    
+    def test_rates_are_read_without_joining_currencies(self, api_client, exchange_rate):
+        """Verifica que las tasas se filtran, ordenan y serializan desde una sola tabla."""
+        url = f'/api/v1/rates/?source_currency=EUR&date_from={date.today()}&date_to={date.today()}'
+        with CaptureQueriesContext(connection) as queries:
+            data = api_client.get(url, HTTP_ACCEPT='application/json').json()
+        
+        rate_queries = [q['sql'] for q in queries.captured_queries if 'currencyexchangerate' in q['sql']]
+        assert rate_queries and not any('JOIN' in sql for sql in rate_queries)
+        assert data[0]['source_currency_code'] == 'EUR'
+        assert data[0]['exchanged_currency_code'] == 'USD'
+
+
+class TestBestProviderResolution:
+    """Tests para resolution=best (una tasa por fecha y moneda, según la prioridad del proveedor)."""
+    
+    URL = '/api/v1/rates/?source_currency=EUR&date_from=2024-01-01&date_to=2024-01-31&resolution=best'
+    
+    @pytest.fixture
+    def two_providers(self, currencies):
+        """Fixture con tasas EUR->USD de dos proveedores para dos días (el de prioridad 2 se guarda primero)."""
+        Provider.objects.create(name='primary', priority=1, is_active=True)
+        secondary = Provider.objects.create(name='secondary', priority=2, is_active=True)
+        for day in (1, 2):
+            for name, value in (('secondary', '1.2'), ('primary', '1.1')):
+                CurrencyExchangeRate.objects.create(
+                    source_currency=currencies['EUR'], exchanged_currency=currencies['USD'],
+                    valuation_date=date(2024, 1, day), rate_value=Decimal(value), provider=name
+                )
+        return secondary
+    
+    def test_one_row_per_day_from_highest_priority(self, api_client, two_providers):
+        """Verifica que solo se devuelve la tasa del proveedor de mayor prioridad y que 'all' mantiene todas."""
+        best = api_client.get(self.URL, HTTP_ACCEPT='application/json').json()
+        every = api_client.get(self.URL.replace('best', 'all'), HTTP_ACCEPT='application/json').json()
+        
+        assert [(r['valuation_date'], r['provider']) for r in best] == [('2024-01-01', 'primary'), ('2024-01-02', 'primary')]
+        assert len(every) == 4
+    
+    def test_priority_change_is_not_served_from_cache(self, api_client, two_providers):
+        """Verifica que cambiar las prioridades cambia la respuesta cacheada."""
+        api_client.get(self.URL, HTTP_ACCEPT='application/json')
+        two_providers.priority = 0
+        two_providers.save()
+        
+        best = api_client.get(self.URL, HTTP_ACCEPT='application/json').json()
+        
+        assert {r['provider'] for r in best} == {'secondary'}
+    
+    def test_convert_uses_highest_priority(self, api_client, two_providers):
+        """Verifica que /convert/ usa la tasa del proveedor de mayor prioridad."""
+        with patch('MyCurrency.api.datetime') as mock_datetime:
+            mock_datetime.now.return_value.date.return_value = date(2024, 1, 2)
+            response = api_client.post('/api/v1/convert/', {
+                'source_currency': 'EUR', 'exchanged_currency': 'USD', 'amount': 10
+            }, format='json')
+        
+        assert response.json()['rate'] == 1.1
+    
+    def test_rejects_unknown_resolution(self, api_client, currencies):
+        """Verifica que un modo de resolución desconocido devuelve 400."""
+        response = api_client.get(self.URL.replace('best', 'any'))
+        
+        assert response.status_code == 400
+
+class TestColumnarRateFormats:
+    """Tests para los formatos columnares del listado de tasas."""
+    
+    URL = '/api/v1/rates/?source_currency=EUR&date_from=2024-01-01&date_to=2024-12-31'
+    
+    @pytest.fixture
+    def january_rates(self, currencies):
+        """Fixture que crea tasas EUR->USD para varios días."""
+        for day in (1, 2, 3):
+            CurrencyExchangeRate.objects.create(
+                source_currency=currencies['EUR'],
+                exchanged_currency=currencies['USD'],
+                valuation_date=date(2024, 1, day),
+                rate_value=Decimal('1.085') + day,
+                provider='mock'
+            )
+    
+    def test_msgpack_returns_dense_columns(self, api_client, january_rates):
+        """Verifica que msgpack devuelve columnas densas con tasas escaladas a enteros."""
+        msgpack = pytest.importorskip('msgpack')
+        response = api_client.get(self.URL, HTTP_ACCEPT='application/x-msgpack')
+        
+        payload = msgpack.unpackb(response.content)
+        
+        assert response.status_code == 200
+        assert payload['exchanged_currency_code']['dictionary'] == ['USD']
+        assert payload['rate_value'] == [2085000, 3085000, 4085000]
+        assert payload['valuation_date'][0] == (date(2024, 1, 1) - date(1970, 1, 1)).days
+    
+    def test_arrow_stream_can_be_decoded(self, api_client, january_rates):
+        """Verifica que el stream Arrow IPC se decodifica con el esquema esperado."""
+        pyarrow = pytest.importorskip('pyarrow')
+        response = api_client.get(self.URL + '&format=arrow')
+        
+        table = pyarrow.ipc.open_stream(b''.join(response.streaming_content)).read_all()
+        
+        assert response['Content-Type'] == 'application/vnd.apache.arrow.stream'
+        assert table.num_rows == 3
+        assert table.column('valuation_date').to_pylist()[0] == date(2024, 1, 1)
+        assert table.column('exchanged_currency_code').to_pylist() == ['USD', 'USD', 'USD']
+    
+    def test_arrow_is_streamed_in_record_batches(self, api_client, january_rates, currencies, settings):
+        """Verifica que el stream Arrow se envía por lotes y que los diccionarios crecen entre lotes."""
+        pyarrow = pytest.importorskip('pyarrow')
+        settings.RATES_COLUMNAR_BATCH_SIZE = 2
+        CurrencyExchangeRate.objects.create(
+            source_currency=currencies['EUR'],
+            exchanged_currency=currencies['USD'],
+            valuation_date=date(2024, 1, 3),
+            rate_value=Decimal('4.1'),
+            provider='other'
+        )
+        response = api_client.get(self.URL + '&format=arrow')
+        
+        assert response.streaming
+        reader = pyarrow.ipc.open_stream(b''.join(response.streaming_content))
+        batches = list(reader)
+        assert [batch.num_rows for batch in batches] == [2, 2]
+        assert pyarrow.Table.from_batches(batches).column('provider').to_pylist() == ['mock', 'mock', 'mock', 'other']
+    
+    @pytest.mark.django_db(transaction=True)
+    def test_arrow_is_streamed_asynchronously_under_asgi(self, january_rates):
+        """Verifica que bajo ASGI el stream Arrow se entrega con un iterador asíncrono, sin acumularse."""
+        pyarrow = pytest.importorskip('pyarrow')
+        
+        async def read():
+            response = await AsyncClient().get(self.URL + '&format=arrow')
+            assert response.is_async
+            return b''.join([chunk async for chunk in response.streaming_content])
+        
+        assert pyarrow.ipc.open_stream(asyncio.run(read())).read_all().num_rows == 3
+    
+    def test_parquet_is_streamed_in_row_groups(self, api_client, january_rates, settings):
+        """Verifica que Parquet se envía con un grupo de filas por lote y se decodifica completo."""
+        pytest.importorskip('pyarrow')
+        import io
+        import pyarrow.parquet
+        settings.RATES_COLUMNAR_BATCH_SIZE = 2
+        response = api_client.get(self.URL + '&format=parquet')
+        
+        assert response.streaming
+        parquet_file = pyarrow.parquet.ParquetFile(io.BytesIO(b''.join(response.streaming_content)))
+        assert parquet_file.metadata.num_row_groups == 2
+        assert parquet_file.read().column('rate_value').to_pylist() == [2085000, 3085000, 4085000]
+    
+    def test_streamed_response_is_cached_when_small(self, api_client, january_rates, settings):
+        """Verifica que un stream pequeño queda en la caché del servidor y uno grande no."""
+        pytest.importorskip('pyarrow')
+        body = b''.join(api_client.get(self.URL + '&format=arrow').streaming_content)
+        
+        cached = api_client.get(self.URL + '&format=arrow')
+        
+        assert not cached.streaming
+        assert cached.content == body
+        
+        settings.RATES_CACHE_MAX_STREAMED_BODY = 16
+        b''.join(api_client.get(self.URL + '&format=parquet').streaming_content)
+        assert api_client.get(self.URL + '&format=parquet').streaming
+    
+    def test_errors_are_reported_as_json(self, api_client, db):
+        """Verifica que los errores se devuelven en JSON aunque se pida un formato binario."""
+        pytest.importorskip('msgpack')
+        response = api_client.get('/api/v1/rates/', HTTP_ACCEPT='application/x-msgpack')
+        
+        assert response.status_code == 400
+        assert 'error' in response.json()
+
+
+class TestExchangeRateAggregateAPI:
+    """Tests para el endpoint /api/v1/rates/aggregate/"""
+    
+    @pytest.fixture
+    def two_weeks_of_rates(self, currencies):
+        """Fixture que crea tasas diarias EUR->USD del 1 al 14 de enero de 2024 (lunes a domingo x2)."""
+        for day in range(1, 15):
+            CurrencyExchangeRate.objects.create(
+                source_currency=currencies['EUR'],
+                exchanged_currency=currencies['USD'],
+                valuation_date=date(2024, 1, day),
+                rate_value=Decimal(day),
+                provider='mock'
+            )
+    
+    def test_weekly_ohlc(self, api_client, two_weeks_of_rates, django_assert_max_num_queries):
+        """Verifica que agrupa por semana calculando apertura, cierre, máximo, mínimo y media."""
+        # The provider ranking comes from the in-memory registry, loaded once per process
+        registry.load()
+        with django_assert_max_num_queries(2):
+            response = api_client.get(
+                '/api/v1/rates/aggregate/?source_currency=EUR&date_from=2024-01-01&date_to=2024-01-14&bucket=week'
+            )
+        
+        data = response.json()
+        assert response.status_code == 200
+        assert [row['period_start'] for row in data] == ['2024-01-01', '2024-01-08']
+        assert data[0]['open'] == '1.000000'
+        assert data[0]['close'] == '7.000000'
+        assert data[0]['high'] == '7.000000'
+        assert data[0]['low'] == '1.000000'
+        assert data[0]['mean'] == '4.000000'
+        assert data[0]['count'] == 7
+    
+    def test_only_best_provider_rates_are_aggregated(self, api_client, currencies):
+        """Verifica que cada día cuenta solo la tasa del proveedor prioritario, sin mezclar proveedores."""
+        Provider.objects.create(name='mock', priority=1, is_active=True)
+        Provider.objects.create(name='other', priority=2, is_active=True)
+        rows = [(1, 'mock', '1'), (1, 'other', '100'), (2, 'mock', '2'), (3, 'other', '100'),
+                (3, 'mock', '3'), (4, 'other', '50')]
+        for day, provider, value in rows:
+            CurrencyExchangeRate.objects.create(
+                source_currency=currencies['EUR'], exchanged_currency=currencies['USD'],
+                valuation_date=date(2024, 1, day), rate_value=Decimal(value), provider=provider
+            )
+        
+        [week] = api_client.get(
+            '/api/v1/rates/aggregate/?source_currency=EUR&date_from=2024-01-01&date_to=2024-01-07&bucket=week'
+        ).json()
+        
+        assert (week['open'], week['close']) == ('1.000000', '50.000000')
+        assert (week['high'], week['low'], week['count']) == ('50.000000', '1.000000', 4)
+    
+    def test_invalid_bucket(self, api_client, currencies):
+        """Verifica que rechaza un bucket desconocido."""
+        response = api_client.get(
+            '/api/v1/rates/aggregate/?source_currency=EUR&date_from=2024-01-01&date_to=2024-01-14&bucket=hour'
+        )
+        
+        assert response.status_code == 400
+
+
+class TestAsOfAPI:
+    """Tests para la resolución as-of y el relleno de huecos."""
+    
+    @pytest.fixture
+    def friday_and_monday_rates(self, currencies):
+        """Fixture con tasas EUR->USD el viernes 5 y el lunes 8 de enero de 2024."""
+        for day, value in ((5, '1.10'), (8, '1.20')):
+            CurrencyExchangeRate.objects.create(
+                source_currency=currencies['EUR'],
+                exchanged_currency=currencies['USD'],
+                valuation_date=date(2024, 1, day),
+                rate_value=Decimal(value),
+                provider='mock'
+            )
+    
+    def test_as_of_resolves_weekend_to_last_known_rate(self, api_client, friday_and_monday_rates,
+                                                       django_assert_max_num_queries):
+        """Verifica que un sábado se resuelve con la tasa del viernes en una sola consulta."""
+        lookups = [
+            {'source_currency': 'EUR', 'exchanged_currency': 'USD', 'date': f'2024-01-0{day}'}
+            for day in (6, 7, 8)
+        ] + [{'source_currency': 'EUR', 'exchanged_currency': 'USD', 'date': '2023-12-01'}]
+        registry.load()
+        
+        with django_assert_max_num_queries(1):
+            response = api_client.post('/api/v1/rates/as-of/', {'lookups': lookups}, format='json')
+        
+        data = response.json()
+        assert response.status_code == 200
+        assert [row['valuation_date'] for row in data] == ['2024-01-05', '2024-01-05', '2024-01-08', None]
+        assert data[0]['rate'] == '1.100000'
+    
+    def test_list_fill_gaps_carries_forward(self, api_client, friday_and_monday_rates):
+        """Verifica que fill_gaps añade las filas del fin de semana marcadas como rellenadas."""
+        response = api_client.get(
+            '/api/v1/rates/?source_currency=EUR&date_from=2024-01-05&date_to=2024-01-08&fill_gaps=true',
+            HTTP_ACCEPT='application/json'
+        )
+        
+        data = response.json()
+        assert [row['valuation_date'] for row in data] == ['2024-01-05', '2024-01-06', '2024-01-07', '2024-01-08']
+        assert [row['is_filled'] for row in data] == [False, True, True, False]
+        assert data[1]['filled_from'] == '2024-01-05'
+        assert data[1]['rate_value'] == '1.100000'
+    
+    def test_fill_gaps_cache_evicted_by_backfill_within_lookback(self, api_client, currencies,
+                                                                  friday_and_monday_rates):
+        """Verifica que una tasa escrita antes del rango, pero dentro de la ventana, invalida el relleno."""
+        url = '/api/v1/rates/?source_currency=EUR&date_from=2024-01-06&date_to=2024-01-07&fill_gaps=true'
+        assert api_client.get(url, HTTP_ACCEPT='application/json').json()[0]['rate_value'] == '1.100000'
+        
+        CurrencyExchangeRate.objects.filter(valuation_date=date(2024, 1, 5)).update(rate_value=Decimal('9'))
+        CurrencyExchangeRate.objects.create(
+            source_currency=currencies['EUR'], exchanged_currency=currencies['USD'],
+            valuation_date=date(2024, 1, 5), rate_value=Decimal('1.15'), provider='other'
+        )
+        
+        data = api_client.get(url, HTTP_ACCEPT='application/json').json()
+        assert data[0]['rate_value'] == '9.000000'
+    
+    def test_fill_gaps_honors_best_resolution(self, api_client, currencies, friday_and_monday_rates):
+        """Verifica que fill_gaps con resolution=best devuelve un único proveedor por día."""
+        Provider.objects.create(name='mock', priority=1, is_active=True)
+        CurrencyExchangeRate.objects.create(
+            source_currency=currencies['EUR'], exchanged_currency=currencies['USD'],
+            valuation_date=date(2024, 1, 5), rate_value=Decimal('1.15'), provider='other'
+        )
+        url = '/api/v1/rates/?source_currency=EUR&date_from=2024-01-05&date_to=2024-01-06&fill_gaps=true'
+        
+        everything = api_client.get(url, HTTP_ACCEPT='application/json').json()
+        best = api_client.get(f'{url}&resolution=best', HTTP_ACCEPT='application/json').json()
+        
+        assert len(everything) == 3
+        assert [(row['valuation_date'], row['provider']) for row in best] == [
+            ('2024-01-05', 'mock'), ('2024-01-06', 'mock')
+        ]
+
+
+class TestConvertStaleWhileRevalidate:
+    """Tests para la política stale-while-revalidate de /api/v1/convert/"""
+    
+    DATA = {'source_currency': 'EUR', 'exchanged_currency': 'USD', 'amount': 100}
+    
+    def test_serves_recent_rate_and_refreshes_in_background(self, api_client, currencies, provider, settings):
+        """Verifica que sirve la tasa de ayer marcada como stale y lanza el refresco en segundo plano."""
+        settings.RATES_STALE_MAX_AGE_HOURS = 48
+        yesterday = date.today() - timedelta(days=1)
+        CurrencyExchangeRate.objects.create(
+            source_currency=currencies['EUR'],
+            exchanged_currency=currencies['USD'],
+            valuation_date=yesterday,
+            rate_value=Decimal('1.085'),
+            provider='mock'
+        )
+        
+        with patch('MyCurrency.api.schedule_rate_refresh') as refresh, \
+                patch('MyCurrency.api.get_exchange_rate_data') as fetch:
+            response = api_client.post('/api/v1/convert/', self.DATA, format='json')
+        
+        data = response.json()
+        assert response.status_code == 200
+        assert data['is_stale'] is True
+        assert data['valuation_date'] == yesterday.isoformat()
+        assert data['rate'] == 1.085
+        refresh.assert_called_once_with('EUR', 'USD', date.today())
+        fetch.assert_not_called()
+    
+    def test_rate_older_than_policy_is_not_served(self, api_client, currencies, provider, settings):
+        """Verifica que una tasa más antigua que la política no se sirve y se consulta al proveedor."""
+        settings.RATES_STALE_MAX_AGE_HOURS = 24
+        CurrencyExchangeRate.objects.create(
+            source_currency=currencies['EUR'],
+            exchanged_currency=currencies['USD'],
+            valuation_date=date.today() - timedelta(days=3),
+            rate_value=Decimal('1.085'),
+            provider='mock'
+        )
+        
+        with patch('MyCurrency.api.get_exchange_rate_data', return_value=None):
+            response = api_client.post('/api/v1/convert/', self.DATA, format='json')
+        
+        assert response.status_code == 404
+    
+    @pytest.mark.parametrize('hour, served', [(5, True), (7, False)])
+    def test_policy_below_one_day_is_honored(self, api_client, currencies, provider, settings, hour, served):
+        """Verifica que una política de menos de 24 horas sirve la tasa de ayer solo dentro de esas horas."""
+        settings.RATES_STALE_MAX_AGE_HOURS = 6
+        CurrencyExchangeRate.objects.create(
+            source_currency=currencies['EUR'],
+            exchanged_currency=currencies['USD'],
+            valuation_date=date(2024, 1, 1),
+            rate_value=Decimal('1.085'),
+            provider='mock'
+        )
+        
+        class FrozenDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return cls(2024, 1, 2, hour)
+        
+        with patch('MyCurrency.api.datetime', FrozenDatetime), \
+                patch('MyCurrency.api.schedule_rate_refresh'), \
+                patch('MyCurrency.api.get_exchange_rate_data', return_value=None):
+            response = api_client.post('/api/v1/convert/', self.DATA, format='json')
+        
+        assert (response.status_code == 200) is served
+
+
+class TestCrossRateMatrixAPI:
+    """Tests para el endpoint /api/v1/rates/matrix/"""
+    
+    @pytest.fixture
+    def base_rates(self, currencies):
+        """Fixture con EUR->USD y EUR->GBP para el 2 de enero de 2024."""
+        gbp = Currency.objects.create(code='GBP', name='Pound', symbol='£')
+        for target, value in ((currencies['USD'], '1.25'), (gbp, '0.5')):
+            CurrencyExchangeRate.objects.create(
+                source_currency=currencies['EUR'], exchanged_currency=target,
+                valuation_date=date(2024, 1, 2), rate_value=Decimal(value), provider='mock'
+            )
+    
+    def test_full_matrix_from_base_vector(self, api_client, base_rates):
+        """Verifica que calcula todas las parejas a partir del vector de la moneda base."""
+        response = api_client.get('/api/v1/rates/matrix/?base=EUR&date=2024-01-02', HTTP_ACCEPT='application/json')
+        
+        data = response.json()
+        assert response.status_code == 200
+        assert data['rows'] == data['columns'] == ['EUR', 'GBP', 'USD']
+        assert data['matrix'][0] == [1.0, 0.5, 1.25]
+        assert data['matrix'][1][2] == 2.5
+        assert data['matrix'][2][1] == 0.4
+    
+    def test_matrix_subsetting(self, api_client, base_rates):
+        """Verifica que se pueden restringir filas y columnas."""
+        response = api_client.get(
+            '/api/v1/rates/matrix/?base=EUR&date=2024-01-02&rows=USD&columns=GBP,JPY', HTTP_ACCEPT='application/json'
+        )
+        
+        data = response.json()
+        assert data['matrix'] == [[0.4]]
+        assert data['missing'] == ['JPY']
+
+
+class TestHistoricalLoadJobAPI:
+    """Tests para el endpoint /api/v1/jobs/historical-loads/"""
+    
+    def test_submit_splits_long_range_into_subjobs(self, api_client, currencies, settings):
+        """Verifica que un rango largo se divide en sub-trabajos y se puede consultar su progreso."""
+        settings.JOB_MAX_DAYS_PER_SUBJOB = 31
+        response = api_client.post('/api/v1/jobs/historical-loads/', {
+            'source_currency': 'EUR', 'target_currencies': ['USD'],
+            'date_from': '2024-01-01', 'date_to': '2024-03-31'
+        }, format='json')
+        
+        assert response.status_code == 202
+        job = response.json()
+        assert job['status'] == 'split'
+        assert job['total_cells'] == 91
+        assert [sub['date_from'] for sub in job['subjobs']] == ['2024-01-01', '2024-02-01', '2024-03-03']
+        
+        detail = api_client.get(f"/api/v1/jobs/historical-loads/{job['id']}/").json()
+        assert detail['progress'] == 0.0
+        assert len(api_client.get('/api/v1/jobs/historical-loads/').json()) == 1
+    
+    def test_submit_rejects_unknown_currency(self, api_client, currencies):
+        """Verifica que no se encolan cargas con monedas desconocidas."""
+        response = api_client.post('/api/v1/jobs/historical-loads/', {
+            'source_currency': 'EUR', 'target_currencies': ['XXX'],
+            'date_from': '2024-01-01', 'date_to': '2024-01-31'
+        }, format='json')
+        
+        assert response.status_code == 400
+
+
+
+class TestExchangeRateChangesAPI:
+    """Tests para el endpoint /api/v1/rates/changes/"""
+    
+    URL = '/api/v1/rates/changes/'
+    
+    @pytest.fixture
+    def rates(self, currencies, settings):
+        """Fixture que crea tres tasas EUR->USD sin margen de seguridad."""
+        settings.CHANGE_FEED_SAFETY_LAG_SECONDS = 0
+        return [
+            CurrencyExchangeRate.objects.create(
+                source_currency=currencies['EUR'], exchanged_currency=currencies['USD'],
+                valuation_date=date(2024, 1, day), rate_value=Decimal('1.1'), provider='mock'
+            )
+            for day in (1, 2, 3)
+        ]
+    
+    def test_pages_through_changes_with_cursor(self, api_client, rates):
+        """Verifica que el cursor recorre los cambios en páginas acotadas sin repetir filas."""
+        first = api_client.get(f'{self.URL}?limit=2').json()
+        second = api_client.get(f"{self.URL}?limit=2&cursor={first['next_cursor']}").json()
+        
+        assert [c['id'] for c in first['results']] == [rates[0].pk, rates[1].pk]
+        assert first['has_more'] is True
+        assert [c['id'] for c in second['results']] == [rates[2].pk]
+        assert second['has_more'] is False
+        
+        idle = api_client.get(f"{self.URL}?cursor={second['next_cursor']}").json()
+        assert idle['results'] == []
+        assert idle['next_cursor'] == second['next_cursor']
+    
+    def test_updates_and_soft_deletes_after_cursor(self, api_client, rates):
+        """Verifica que solo se devuelven las filas modificadas y que las bajas lógicas son tombstones."""
+        cursor = api_client.get(self.URL).json()['next_cursor']
+        rates[0].rate_value = Decimal('1.2')
+        rates[0].save()
+        rates[1].is_active = False
+        rates[1].save()
+        
+        results = api_client.get(f'{self.URL}?cursor={cursor}').json()['results']
+        
+        assert [(c['id'], c['op']) for c in results] == [(rates[0].pk, 'upsert'), (rates[1].pk, 'delete')]
+        assert results[0]['rate_value'] == '1.200000'
+        assert results[1]['rate_value'] is None
+    
+    def test_safety_lag_holds_back_recent_writes(self, api_client, rates, settings):
+        """Verifica que las escrituras más recientes que el margen de seguridad no se devuelven aún."""
+        settings.CHANGE_FEED_SAFETY_LAG_SECONDS = 60
+        
+        assert api_client.get(self.URL).json()['results'] == []
+    
+    def test_rejects_invalid_cursor(self, api_client, db):
+        """Verifica que un cursor inválido devuelve 400."""
+        assert api_client.get(f'{self.URL}?cursor=not-a-cursor').status_code == 400
+
+
+class TestRateStreamAPI:
+    """Tests para el endpoint SSE /api/v1/rates/stream/"""
+    
+    def test_streams_published_rates(self):
+        """Verifica que el stream envía como eventos SSE las tasas de las parejas suscritas."""
+        event = {'source_currency': 'EUR', 'exchanged_currency': 'USD', 'valuation_date': '2024-01-02',
+                 'rate_value': '1.100000', 'provider': 'mock'}
+        
+        async def read():
+            response = await AsyncClient().get('/api/v1/rates/stream/?pairs=eur/usd')
+            assert response['Content-Type'] == 'text/event-stream'
+            chunks = aiter(response.streaming_content)
+            assert await anext(chunks) == b': subscribed\n\n'
+            broker.publish([dict(event, exchanged_currency='GBP'), event])
+            chunk = await asyncio.wait_for(anext(chunks), 1)
+            await chunks.aclose()
+            return chunk
+        
+        assert asyncio.run(read()) == f'event: rate\ndata: {json.dumps(event)}\n\n'.encode()
+        assert not broker.has_subscribers()
+    
+    def test_requires_valid_topics(self):
+        """Verifica que se exige al menos una moneda o pareja con códigos válidos."""
+        async def get(url):
+            return (await AsyncClient().get(url)).status_code
+        
+        assert asyncio.run(get('/api/v1/rates/stream/')) == 400
+        assert asyncio.run(get('/api/v1/rates/stream/?pairs=EURUSD')) == 400
+    
+    def test_rejected_under_wsgi(self, api_client):
+        """Verifica que bajo WSGI el stream se rechaza en lugar de quedarse colgado."""
+        assert api_client.get('/api/v1/rates/stream/?pairs=EUR/USD').status_code == 501
+
+class TestExchangeRateAdminChangelist:
+    """Tests para el listado de tasas del admin sobre tablas grandes."""
+    
+    URL = '/admin/MyCurrency/currencyexchangerate/'
+    
+    @pytest.fixture
+    def rates(self, currencies, provider):
+        """Fixture que crea una tasa EUR->USD por día entre el 1 de enero y el 10 de febrero de 2024."""
+        day = date(2024, 1, 1)
+        while day <= date(2024, 2, 10):
+            CurrencyExchangeRate.objects.create(
+                source_currency=currencies['EUR'], exchanged_currency=currencies['USD'],
+                valuation_date=day, rate_value=Decimal('1.1'), provider='mock'
+            )
+            day += timedelta(days=1)
+    
+    def test_changelist_queries_do_not_grow_with_rows(self, admin_client, rates, currencies):
+        """Verifica que no hay consultas por fila (códigos desnormalizados, filtros desde el registro)."""
+        admin_client.get(self.URL)
+        with CaptureQueriesContext(connection) as few:
+            assert admin_client.get(f'{self.URL}?valuation_date__year=2024&valuation_date__month=2').status_code == 200
+        with CaptureQueriesContext(connection) as many:
+            assert admin_client.get(f'{self.URL}?valuation_date__year=2024&valuation_date__month=1').status_code == 200
+        
+        assert len(many) - len(few) <= 21  # one indexed probe per extra day of the hierarchy
+        assert not any('DISTINCT' in q['sql'] for q in many.captured_queries)
+    
+    def test_date_hierarchy_probes_periods(self, rates):
+        """Verifica que dates() devuelve los periodos con filas usando MIN/MAX y sondeos."""
+        queryset = IndexedDatesQuerySet(CurrencyExchangeRate)
+        
+        assert queryset.dates('valuation_date', 'month') == [date(2024, 1, 1), date(2024, 2, 1)]
+        assert queryset.filter(valuation_date__gte=date(2024, 2, 1)).dates('valuation_date', 'day')[-1] == date(2024, 2, 10)
+    
+    def test_provider_filter_uses_registry(self, admin_client, rates):
+        """Verifica que el filtro de proveedor ofrece los proveedores registrados y filtra."""
+        response = admin_client.get(f'{self.URL}?provider=mock')
+        
+        assert response.status_code == 200
+        assert '?provider=mock' in response.content.decode()
+        assert response.context['cl'].result_count == 41
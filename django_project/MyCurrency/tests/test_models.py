@@ -78,6 +78,25 @@ class TestCurrencyExchangeRateModel:
         )
         
         assert 'currency_beacon' in str(rate)
+    
+    def test_currency_codes_are_denormalized(self, currency_eur, currency_usd, django_assert_num_queries):
+        """Verifica que los códigos de moneda se copian al guardar, también con bulk_create y con solo los ids."""
+        CurrencyExchangeRate.objects.create(
+            source_currency=currency_eur, exchanged_currency=currency_usd,
+            valuation_date=date(2024, 1, 15), rate_value=Decimal('1.085'), provider='mock'
+        )
+        CurrencyExchangeRate.objects.bulk_create([CurrencyExchangeRate(
+            source_currency=currency_usd, exchanged_currency=currency_eur,
+            valuation_date=date(2024, 1, 15), rate_value=Decimal('0.92'), provider='mock'
+        )])
+        with django_assert_num_queries(3):  # both currencies, then the insert
+            CurrencyExchangeRate.objects.create(
+                source_currency_id=currency_eur.pk, exchanged_currency_id=currency_usd.pk,
+                valuation_date=date(2024, 1, 16), rate_value=Decimal('1.09'), provider='mock'
+            )
+        
+        codes = CurrencyExchangeRate.objects.order_by('id').values_list('source_code', 'target_code')
+        assert list(codes) == [('EUR', 'USD'), ('USD', 'EUR'), ('EUR', 'USD')]
 
 
 class TestProviderModel:
@@ -2,14 +2,39 @@
 Tests para los servicios (adapters y exchange_rates).
 Ejecutar con: pytest MyCurrency/tests/test_services.py -v
 """
+import asyncio
+import socket
+import time
 import pytest
-from decimal import Decimal
-from datetime import date
-from unittest.mock import patch, MagicMock
+from decimal import Decimal, ROUND_HALF_EVEN
+from datetime import date, datetime
+from unittest.mock import AsyncMock, patch, MagicMock
 
-from MyCurrency.models import Currency, Provider
-from MyCurrency.services.adapters import MockProvider, PROVIDERS
-from MyCurrency.services.exchange_rates import get_exchange_rate_data
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import OperationalError, connection
+
+from MyCurrency.db_router import ReadReplicaRouter, replica_reads
+from MyCurrency import tracing
+from MyCurrency.caching import Validators, rate_range_cache
+from MyCurrency.models import Currency, CurrencyExchangeRate, HistoricalLoadJob, Provider
+from MyCurrency.services.adapters import BaseCurrencyProvider, CurrencyBeaconProvider, MockProvider, PROVIDERS
+from MyCurrency.services.async_historical_loader import load_historical_rates
+from MyCurrency.services import cross_rates
+from MyCurrency.services.job_queue import claim_job, requeue_stale_jobs, run_job, submit_historical_load
+from MyCurrency.services import ledger
+from MyCurrency.services.ledger import convert_ledger
+from MyCurrency.services.provider_cache import OfflineCacheMiss, ProviderResponseCache, make_key, read_through
+from MyCurrency.services.invalidation import InvalidationBus, LocalBackend, encode_rates, encode_registry
+from MyCurrency.services.exchange_rates import get_exchange_rate_data, get_exchange_rates_bulk
+from MyCurrency.services.rate_archive import ArchiveError, RateArchiveReader, export_rates, import_rates
+from MyCurrency.services.rate_stream import (
+    RateBroker, UnixDatagramBackend, broker, publish_rates, subscribe, unsubscribe
+)
+from MyCurrency.services.rate_snapshot import build_rate_snapshot, get_rate_snapshot
+from MyCurrency.services.registry import Registry, registry
+from MyCurrency.services.retention import run_retention
+from MyCurrency.services.write_behind import WriteBehindBuffer, upsert_rates, write_behind
 
 
 class TestMockProvider:
@@ -75,3 +100,1028 @@ class TestGetExchangeRateData:
         
         # Sin proveedores activos, debería devolver None
         assert rate is None
+
+
+class TestGetExchangeRatesBulk:
+    """Tests para la resolución de varias monedas destino en bloque."""
+    
+    @pytest.fixture
+    def setup_currencies_and_provider(self, db):
+        """Fixture que prepara EUR, USD, GBP y un proveedor mock."""
+        currencies = {
+            code: Currency.objects.create(code=code, name=code, symbol=code)
+            for code in ('EUR', 'USD', 'GBP')
+        }
+        Provider.objects.create(name='mock', priority=1, is_active=True)
+        return currencies
+    
+    def test_bulk_uses_stored_rates_and_fetches_misses(self, setup_currencies_and_provider):
+        """Verifica que usa la tasa guardada y obtiene (y persiste) las que faltan."""
+        currencies = setup_currencies_and_provider
+        CurrencyExchangeRate.objects.create(
+            source_currency=currencies['EUR'],
+            exchanged_currency=currencies['USD'],
+            valuation_date=date.today(),
+            rate_value=Decimal('1.085'),
+            provider='mock'
+        )
+        
+        rates, missing = get_exchange_rates_bulk('EUR', ['USD', 'GBP'], date.today())
+        
+        assert rates['USD'] == Decimal('1.085')
+        assert isinstance(rates['GBP'], Decimal)
+        assert missing == []
+        assert CurrencyExchangeRate.objects.filter(exchanged_currency__code='GBP').exists()
+    
+    def test_bulk_returns_partial_results_when_budget_is_exhausted(self, setup_currencies_and_provider):
+        """Verifica que devuelve resultados parciales si se agota el tiempo."""
+        def slow_fetch(providers, source, target, valuation_date):
+            if target == 'GBP':
+                time.sleep(0.5)
+            return Decimal('1.5'), 'mock'
+        
+        with patch('MyCurrency.services.exchange_rates._fetch_from_providers', side_effect=slow_fetch):
+            rates, missing = get_exchange_rates_bulk('EUR', ['USD', 'GBP'], date.today(), time_budget=0.1)
+        
+        assert rates == {'USD': Decimal('1.5')}
+        assert missing == ['GBP']
+
+
+class TestRegistry:
+    """Tests para el registro en memoria de monedas y proveedores."""
+    
+    def test_registry_serves_lookups_without_queries(self, db, django_assert_num_queries):
+        """Verifica que, una vez cargado, el registro no consulta la base de datos."""
+        Currency.objects.create(code='EUR', name='Euro', symbol='€')
+        Provider.objects.create(name='mock', priority=1, is_active=True)
+        registry.load()
+        
+        with django_assert_num_queries(0):
+            assert registry.get_currency('EUR').code == 'EUR'
+            assert registry.get_currency('XXX') is None
+            assert [p.name for p in registry.active_providers()] == ['mock']
+    
+    def test_registry_is_invalidated_on_save(self, db):
+        """Verifica que los cambios en Provider invalidan el registro."""
+        provider = Provider.objects.create(name='mock', priority=1, is_active=True)
+        Provider.objects.create(name='currency_beacon', priority=2, is_active=True)
+        assert [p.name for p in registry.active_providers()] == ['mock', 'currency_beacon']
+        
+        provider.priority = 3
+        provider.save()
+        
+        assert [p.name for p in registry.active_providers()] == ['currency_beacon', 'mock']
+    
+    def test_other_processes_reload_from_database_stamp(self, db, settings):
+        """Verifica que otro proceso detecta el cambio por la marca de versión guardada en la base de datos."""
+        settings.REGISTRY_VERSION_CHECK_SECONDS = 0
+        other_process = Registry()
+        Currency.objects.create(code='EUR', name='Euro', symbol='€')
+        assert other_process.get_currency('USD') is None
+        
+        Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+        
+        assert other_process.get_currency('USD') is not None
+    
+    def test_reload_before_commit_is_dropped_on_commit(self, db, django_capture_on_commit_callbacks):
+        """Verifica que una recarga hecha entre la escritura y el commit se descarta al confirmar."""
+        registry.push_invalidated = True
+        try:
+            with django_capture_on_commit_callbacks(execute=True):
+                Currency.objects.create(code='EUR', name='Euro', symbol='€')
+                # A reader of this process reloads before the commit
+                registry.load()
+                assert registry._snapshot is not None
+            
+            assert registry._snapshot is None
+        finally:
+            registry.push_invalidated = False
+    
+    def test_lookups_survive_concurrent_clear(self, db):
+        """Verifica que un clear() concurrente no rompe una consulta ya en curso."""
+        Currency.objects.create(code='EUR', name='Euro', symbol='€')
+        registry.load()
+        
+        with patch.object(registry, '_is_current', side_effect=lambda snapshot: registry.clear() or True):
+            assert registry.get_currency('EUR').code == 'EUR'
+            assert list(registry.get_currencies(['EUR'])) == ['EUR']
+
+
+class TestRateSnapshot:
+    """Tests para el snapshot mmap de la matriz de tasas."""
+    
+    @pytest.fixture
+    def stored_rates(self, db):
+        """Fixture con tasas EUR->USD de dos proveedores y EUR->GBP."""
+        eur = Currency.objects.create(code='EUR', name='Euro', symbol='€')
+        usd = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+        gbp = Currency.objects.create(code='GBP', name='Pound', symbol='£')
+        Provider.objects.create(name='currency_beacon', priority=1, is_active=True)
+        Provider.objects.create(name='mock', priority=2, is_active=True)
+        for target, provider, value in ((usd, 'mock', '1.5'), (usd, 'currency_beacon', '1.085'), (gbp, 'mock', '0.85')):
+            CurrencyExchangeRate.objects.create(
+                source_currency=eur, exchanged_currency=target, valuation_date=date(2024, 1, 2),
+                rate_value=Decimal(value), provider=provider
+            )
+    
+    def test_snapshot_lookup_prefers_highest_priority(self, stored_rates, tmp_path):
+        """Verifica que el snapshot guarda la tasa del proveedor más prioritario."""
+        snapshot = build_rate_snapshot(str(tmp_path / 'rates.snap'))
+        
+        assert snapshot.get_rate('EUR', 'USD', date(2024, 1, 2)) == Decimal('1.085')
+        assert snapshot.get_rate('EUR', 'GBP', date(2024, 1, 2)) == Decimal('0.85')
+        assert snapshot.get_rate('USD', 'EUR', date(2024, 1, 2)) is None
+        assert snapshot.get_rate('EUR', 'USD', date(2024, 1, 3)) is None
+    
+    def test_rebuild_swaps_the_file_atomically(self, stored_rates, tmp_path, settings):
+        """Verifica que los lectores detectan un snapshot reconstruido."""
+        settings.RATE_SNAPSHOT_PATH = str(tmp_path / 'rates.snap')
+        settings.RATE_SNAPSHOT_CHECK_INTERVAL = 0
+        build_rate_snapshot(settings.RATE_SNAPSHOT_PATH)
+        first = get_rate_snapshot()
+        
+        CurrencyExchangeRate.objects.filter(provider='currency_beacon').update(rate_value=Decimal('1.1'))
+        build_rate_snapshot(settings.RATE_SNAPSHOT_PATH)
+        
+        assert first.is_current() is False
+        assert get_rate_snapshot().get_rate('EUR', 'USD', date(2024, 1, 2)) == Decimal('1.1')
+    
+    def test_inactive_providers_are_left_out(self, stored_rates, tmp_path):
+        """Verifica que las tasas de proveedores inactivos no entran en el snapshot."""
+        Provider.objects.filter(name='currency_beacon').update(is_active=False)
+        registry.clear()
+        
+        snapshot = build_rate_snapshot(str(tmp_path / 'rates.snap'))
+        
+        assert snapshot.get_rate('EUR', 'USD', date(2024, 1, 2)) == Decimal('1.5')
+    
+    def test_snapshot_is_ignored_once_newer_rates_exist(self, stored_rates, tmp_path, settings):
+        """Verifica que el snapshot deja de usarse cuando se escriben tasas posteriores dentro de sus fechas."""
+        settings.RATE_SNAPSHOT_PATH = str(tmp_path / 'rates.snap')
+        settings.RATE_SNAPSHOT_CHECK_INTERVAL = 0
+        build_rate_snapshot(settings.RATE_SNAPSHOT_PATH)
+        assert get_rate_snapshot() is not None
+        
+        # Written by another process: no signal here, found by the periodic check
+        CurrencyExchangeRate.objects.bulk_create([CurrencyExchangeRate(
+            source_currency=Currency.objects.get(code='USD'), exchanged_currency=Currency.objects.get(code='EUR'),
+            valuation_date=date(2024, 1, 2), rate_value=Decimal('0.92'), provider='mock'
+        )])
+        assert get_rate_snapshot() is None
+        
+        build_rate_snapshot(settings.RATE_SNAPSHOT_PATH)
+        assert get_rate_snapshot().get_rate('USD', 'EUR', date(2024, 1, 2)) == Decimal('0.92')
+    
+    def test_local_write_stops_snapshot_use_at_once(self, stored_rates, tmp_path, settings):
+        """Verifica que una escritura de este proceso invalida el snapshot sin esperar a la comprobación."""
+        settings.RATE_SNAPSHOT_PATH = str(tmp_path / 'rates.snap')
+        settings.RATE_SNAPSHOT_CHECK_INTERVAL = 3600
+        build_rate_snapshot(settings.RATE_SNAPSHOT_PATH)
+        assert get_rate_snapshot() is not None
+        
+        CurrencyExchangeRate.objects.filter(provider='mock', target_code='GBP').get().save()
+        
+        assert get_rate_snapshot() is None
+
+
+class TestRateArchive:
+    """Tests para la exportación/importación binaria del histórico."""
+    
+    @pytest.fixture
+    def two_months_of_rates(self, db):
+        """Fixture con tasas EUR->USD en enero y febrero de 2024."""
+        eur = Currency.objects.create(code='EUR', name='Euro', symbol='€')
+        usd = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+        Provider.objects.create(name='mock', priority=1, is_active=True)
+        for month, value in ((1, '1.085'), (2, '1.123456')):
+            CurrencyExchangeRate.objects.create(
+                source_currency=eur, exchanged_currency=usd, valuation_date=date(2024, month, 1),
+                rate_value=Decimal(value), provider='mock'
+            )
+    
+    def test_export_import_round_trip(self, two_months_of_rates, tmp_path):
+        """Verifica que exportar, vaciar e importar restaura tasas, monedas y proveedores."""
+        path = str(tmp_path / 'rates.mcra')
+        chunks = export_rates(path)
+        CurrencyExchangeRate.objects.all().delete()
+        Currency.objects.all().delete()
+        Provider.objects.all().delete()
+        
+        stats = import_rates(path)
+        
+        assert [c['partition'] for c in chunks] == ['2024-01', '2024-02']
+        assert stats['rows'] == 2
+        assert Provider.objects.filter(name='mock').exists()
+        assert CurrencyExchangeRate.objects.get(valuation_date=date(2024, 2, 1)).rate_value == Decimal('1.123456')
+    
+    def test_import_single_partition(self, two_months_of_rates, tmp_path):
+        """Verifica que se puede importar solo una partición."""
+        path = str(tmp_path / 'rates.mcra')
+        export_rates(path)
+        CurrencyExchangeRate.objects.all().delete()
+        
+        import_rates(path, partitions=['2024-02'])
+        
+        assert list(CurrencyExchangeRate.objects.values_list('valuation_date', flat=True)) == [date(2024, 2, 1)]
+    
+    @pytest.mark.skipif(connection.vendor != 'postgresql', reason='COPY import path needs PostgreSQL')
+    def test_copy_import_on_postgresql(self, two_months_of_rates, tmp_path):
+        """Verifica que la importación con COPY (PostgreSQL) inserta las filas y solo cuenta las nuevas."""
+        path = str(tmp_path / 'rates.mcra')
+        export_rates(path)
+        CurrencyExchangeRate.objects.filter(valuation_date=date(2024, 2, 1)).delete()
+        
+        assert import_rates(path)['rows'] == 1
+        assert CurrencyExchangeRate.objects.get(valuation_date=date(2024, 2, 1)).rate_value == Decimal('1.123456')
+        assert import_rates(path)['rows'] == 0
+    
+    def test_import_reports_only_inserted_rows(self, two_months_of_rates, tmp_path):
+        """Verifica que las filas ya existentes no se cuentan ni se notifican como importadas."""
+        path = str(tmp_path / 'rates.mcra')
+        export_rates(path)
+        CurrencyExchangeRate.objects.filter(valuation_date=date(2024, 2, 1)).delete()
+        written = []
+        
+        with patch('MyCurrency.services.rate_archive.notify_rates_written',
+                   side_effect=lambda sender, rates: written.extend(rates)):
+            stats = import_rates(path)
+        
+        assert stats['rows'] == 1
+        assert written == [('EUR', 'USD', date(2024, 2, 1))]
+        assert import_rates(path)['rows'] == 0
+    
+    def test_import_invalidates_and_broadcasts_registry(
+            self, two_months_of_rates, tmp_path, django_capture_on_commit_callbacks):
+        """Verifica que crear monedas y proveedores al importar recarga el registro y lo publica en el bus."""
+        path = str(tmp_path / 'rates.mcra')
+        export_rates(path)
+        CurrencyExchangeRate.objects.all().delete()
+        Currency.objects.all().delete()
+        Provider.objects.all().delete()
+        assert registry.get_currency('EUR') is None
+        backend = LocalBackend()
+        received = []
+        backend.listen(received.append, None)
+        
+        with patch('MyCurrency.signals.get_bus', return_value=InvalidationBus(backend, origin='importer')):
+            with django_capture_on_commit_callbacks(execute=True):
+                import_rates(path)
+        
+        assert registry.get_currency('EUR') is not None
+        assert received.count(encode_registry('importer')) == 1
+    
+    def test_corrupted_chunk_fails_verification(self, two_months_of_rates, tmp_path):
+        """Verifica que un bloque corrupto se detecta por checksum."""
+        path = tmp_path / 'rates.mcra'
+        chunks = export_rates(str(path))
+        data = bytearray(path.read_bytes())
+        data[chunks[0]['offset']] ^= 0xFF
+        path.write_bytes(bytes(data))
+        
+        with pytest.raises(ArchiveError):
+            RateArchiveReader(str(path)).verify()
+
+
+class TestReadReplicaRouter:
+    """Tests para el router de réplicas de lectura."""
+    
+    @pytest.fixture
+    def replica(self, settings):
+        """Configura una réplica sana (sin retraso)."""
+        settings.REPLICA_DATABASES = ['replica_1']
+        with patch('MyCurrency.db_router.replica_lag', return_value=0.0):
+            yield
+    
+    def test_reads_use_primary_outside_replica_context(self, replica):
+        """Verifica que fuera de replica_reads() las lecturas van al primario."""
+        assert ReadReplicaRouter().db_for_read(CurrencyExchangeRate) == 'default'
+    
+    def test_reads_use_replica_in_replica_context(self, replica):
+        """Verifica que dentro de replica_reads() las lecturas van a la réplica."""
+        with replica_reads():
+            assert ReadReplicaRouter().db_for_read(CurrencyExchangeRate) == 'replica_1'
+    
+    def test_reads_after_write_stay_on_primary(self, replica):
+        """Verifica que tras una escritura las lecturas vuelven al primario (read-after-write)."""
+        router = ReadReplicaRouter()
+        with replica_reads():
+            assert router.db_for_write(CurrencyExchangeRate) == 'default'
+            assert router.db_for_read(CurrencyExchangeRate) == 'default'
+        with replica_reads():
+            assert router.db_for_read(CurrencyExchangeRate) == 'replica_1'
+    
+    def test_lagging_replica_is_skipped(self, settings):
+        """Verifica que una réplica con demasiado retraso no se usa."""
+        settings.REPLICA_DATABASES = ['replica_1']
+        settings.REPLICA_MAX_LAG_SECONDS = 5
+        with patch('MyCurrency.db_router.replica_lag', return_value=30.0), replica_reads():
+            assert ReadReplicaRouter().db_for_read(CurrencyExchangeRate) == 'default'
+
+
+class TestWriteBehindBuffer:
+    """Tests para el buffer write-behind de tasas obtenidas en la petición."""
+    
+    @pytest.fixture
+    def currencies(self, db):
+        """Fixture que prepara EUR, USD y un proveedor mock."""
+        Provider.objects.create(name='mock', priority=1, is_active=True)
+        return {
+            code: Currency.objects.create(code=code, name=code, symbol=code)
+            for code in ('EUR', 'USD')
+        }
+    
+    @pytest.fixture
+    def no_flusher(self):
+        """Evita el hilo de vaciado: los tests vacían el buffer explícitamente."""
+        with patch.object(WriteBehindBuffer, '_ensure_thread'):
+            yield
+        write_behind.flush()
+    
+    def test_flush_upserts_pending_rates_in_one_batch(self, currencies, no_flusher):
+        """Verifica que las tasas encoladas se escriben al vaciar y que la última gana."""
+        buffer = WriteBehindBuffer()
+        today = date.today()
+        CurrencyExchangeRate.objects.create(
+            source_currency=currencies['EUR'], exchanged_currency=currencies['USD'],
+            valuation_date=today, rate_value=Decimal('1.0'), provider='mock'
+        )
+        buffer.enqueue(currencies['EUR'], currencies['USD'], today, 'mock', Decimal('1.1'))
+        buffer.enqueue(currencies['EUR'], currencies['USD'], today, 'mock', Decimal('1.2'))
+        
+        assert len(buffer) == 1
+        assert buffer.get_pending('EUR', 'USD', today) == Decimal('1.2')
+        assert buffer.flush() == 1
+        assert len(buffer) == 0
+        assert CurrencyExchangeRate.objects.get(provider='mock').rate_value == Decimal('1.2')
+    
+    def test_get_rate_returns_before_write_and_reuses_pending(self, currencies, no_flusher, settings):
+        """Verifica que la tasa se devuelve sin escribir y que una segunda petición no llama al proveedor."""
+        settings.RATE_WRITE_BEHIND_ENABLED = True
+        today = date.today()
+        
+        rate = get_exchange_rate_data('EUR', 'USD', today)
+        assert not CurrencyExchangeRate.objects.exists()
+        
+        with patch('MyCurrency.services.exchange_rates._fetch_from_providers') as fetch:
+            assert get_exchange_rate_data('EUR', 'USD', today) == rate
+        fetch.assert_not_called()
+        
+        write_behind.flush()
+        assert CurrencyExchangeRate.objects.get().rate_value == rate
+    
+    def test_pending_rate_of_other_provider_is_not_returned(self, currencies, no_flusher):
+        """Verifica que con proveedores restringidos no se devuelve la tasa encolada de otro proveedor."""
+        buffer = WriteBehindBuffer()
+        today = date.today()
+        buffer.enqueue(currencies['EUR'], currencies['USD'], today, 'currency_beacon', Decimal('1.3'))
+        
+        assert buffer.get_pending('EUR', 'USD', today, ['mock']) is None
+        assert buffer.get_pending('EUR', 'USD', today, ['mock', 'currency_beacon']) == Decimal('1.3')
+    
+    def test_failed_flush_keeps_rows_on_any_error(self, currencies, no_flusher):
+        """Verifica que si el vaciado falla por cualquier error las filas vuelven al buffer."""
+        buffer = WriteBehindBuffer()
+        buffer.enqueue(currencies['EUR'], currencies['USD'], date.today(), 'mock', Decimal('1.1'))
+        
+        with patch('MyCurrency.services.write_behind.upsert_rates', side_effect=ValueError('boom')):
+            assert buffer.flush() == 0
+        
+        assert len(buffer) == 1
+        assert buffer.flush() == 1
+    
+    def test_rejected_row_is_isolated_and_dropped(self, currencies, no_flusher, settings):
+        """Verifica que una fila rechazada no bloquea las demás y se descarta tras varios intentos."""
+        settings.RATE_WRITE_BEHIND_MAX_ATTEMPTS = 2
+        buffer = WriteBehindBuffer()
+        for day in (1, 2, 3, 4):
+            buffer.enqueue(currencies['EUR'], currencies['USD'], date(2024, 1, day), 'mock', Decimal(day))
+        real_upsert = upsert_rates
+        
+        def reject_day_three(rates):
+            if any(rate.valuation_date == date(2024, 1, 3) for rate in rates):
+                raise ValueError('out of range')
+            return real_upsert(rates)
+        
+        with patch('MyCurrency.services.write_behind.upsert_rates', side_effect=reject_day_three):
+            assert buffer.flush() == 3
+            assert len(buffer) == 1
+            assert buffer.flush() == 0
+        
+        assert len(buffer) == 0
+        assert CurrencyExchangeRate.objects.count() == 3
+    
+    def test_unreachable_database_keeps_rows_without_counting_attempts(self, currencies, no_flusher, settings):
+        """Verifica que un fallo de conexión conserva las filas sin agotar sus intentos."""
+        settings.RATE_WRITE_BEHIND_MAX_ATTEMPTS = 1
+        buffer = WriteBehindBuffer()
+        buffer.enqueue(currencies['EUR'], currencies['USD'], date(2024, 1, 1), 'mock', Decimal('1.1'))
+        
+        with patch('MyCurrency.services.write_behind.upsert_rates', side_effect=OperationalError('down')):
+            assert buffer.flush() == 0
+            assert buffer.flush() == 0
+        
+        assert len(buffer) == 1
+    
+    def test_buffer_is_capped(self, currencies, no_flusher, settings):
+        """Verifica que por encima del máximo se descartan las tasas más antiguas."""
+        settings.RATE_WRITE_BEHIND_MAX_PENDING = 2
+        buffer = WriteBehindBuffer()
+        for day in (1, 2, 3):
+            buffer.enqueue(currencies['EUR'], currencies['USD'], date(2024, 1, day), 'mock', Decimal(day))
+        
+        assert len(buffer) == 2
+        assert buffer.get_pending('EUR', 'USD', date(2024, 1, 1)) is None
+        assert buffer.get_pending('EUR', 'USD', date(2024, 1, 3)) == Decimal(3)
+
+
+class TestRetention:
+    """Tests para la compactación y el archivado de tasas antiguas."""
+    
+    @pytest.fixture
+    def rates_from_two_providers(self, db):
+        """Fixture con tasas EUR->USD de dos proveedores en cuatro días (dos antiguos, dos recientes)."""
+        eur = Currency.objects.create(code='EUR', name='Euro', symbol='€')
+        usd = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+        Provider.objects.create(name='mock', priority=1, is_active=True)
+        Provider.objects.create(name='currency_beacon', priority=2, is_active=True)
+        for day in (date(2024, 1, 1), date(2024, 1, 2), date(2024, 6, 1), date(2024, 6, 2)):
+            for provider in ('currency_beacon', 'mock'):
+                CurrencyExchangeRate.objects.create(
+                    source_currency=eur, exchanged_currency=usd, valuation_date=day,
+                    rate_value=Decimal('1.1'), provider=provider
+                )
+    
+    def test_compact_keeps_best_provider_for_old_days(self, rates_from_two_providers):
+        """Verifica que los días antiguos se quedan solo con el proveedor prioritario y los recientes intactos."""
+        policies = [{'action': 'compact', 'after_days': 90}]
+        
+        [stats] = run_retention(today=date(2024, 6, 2), policies=policies, batch_size=3)
+        
+        assert stats['complete'] and stats['rows_deleted'] == 2
+        old = CurrencyExchangeRate.objects.filter(valuation_date__lt=date(2024, 6, 1))
+        assert set(old.values_list('provider', flat=True)) == {'mock'}
+        assert CurrencyExchangeRate.objects.filter(valuation_date__gte=date(2024, 6, 1)).count() == 4
+    
+    def test_compact_resumes_from_saved_progress(self, rates_from_two_providers):
+        """Verifica que una segunda ejecución continúa donde terminó la anterior."""
+        policies = [{'action': 'compact', 'after_days': 90}]
+        run_retention(today=date(2024, 6, 2), policies=policies)
+        # Every run is a new process: nothing survives in the local cache
+        cache.clear()
+        
+        [stats] = run_retention(today=date(2024, 6, 2), policies=policies)
+        
+        assert stats['complete'] and stats['batches'] == 0
+    
+    def test_archive_moves_old_rows_to_files(self, rates_from_two_providers, tmp_path):
+        """Verifica que las tasas antiguas se archivan, se borran y pueden reimportarse."""
+        policies = [{'action': 'archive', 'after_days': 90}]
+        
+        [stats] = run_retention(today=date(2024, 6, 2), policies=policies, archive_dir=str(tmp_path))
+        
+        assert stats['complete'] and stats['rows_deleted'] == 4
+        assert not CurrencyExchangeRate.objects.filter(valuation_date__lt=date(2024, 6, 1)).exists()
+        assert import_rates(stats['archives'][0])['rows'] == 4
+        assert CurrencyExchangeRate.objects.count() == 8
+    
+    def test_archive_keeps_rows_updated_during_export_for_next_run(self, rates_from_two_providers, tmp_path):
+        """Verifica que una fila modificada durante la exportación no se borra ni se archiva dos veces en la misma ejecución."""
+        policies = [{'action': 'archive', 'after_days': 90}]
+        updated = CurrencyExchangeRate.objects.filter(valuation_date=date(2024, 1, 1)).first()
+        
+        def export_then_update(*args, **kwargs):
+            chunks = export_rates(*args, **kwargs)
+            updated.rate_value = Decimal('1.2')
+            updated.save()
+            return chunks
+        
+        with patch('MyCurrency.services.retention.export_rates', side_effect=export_then_update), \
+                patch('MyCurrency.services.retention.notify_rates_written') as notify:
+            [stats] = run_retention(today=date(2024, 6, 2), policies=policies, archive_dir=str(tmp_path))
+        
+        assert stats['complete'] and stats['rows_deleted'] == 3
+        assert len(stats['archives']) == 1
+        assert list(CurrencyExchangeRate.objects.filter(valuation_date__lt=date(2024, 6, 1))) == [updated]
+        deleted = [key for call in notify.call_args_list for key in call.args[1]]
+        assert len(deleted) == 3 and ('EUR', 'USD', date(2024, 1, 2)) in deleted
+        
+        [stats] = run_retention(today=date(2024, 6, 2), policies=policies, archive_dir=str(tmp_path))
+        
+        assert stats['rows_deleted'] == 1
+        assert import_rates(stats['archives'][0])['rows'] == 1
+
+
+class TestProviderResponseCache:
+    """Tests para la caché en disco de respuestas crudas de proveedores."""
+    
+    BODY = b'{"response": {"rates": {"USD": 1.0854}}}'
+    
+    def test_key_ignores_credentials_and_param_order(self):
+        """Verifica que la clave no depende de la API key ni del orden de los parámetros."""
+        assert make_key('https://api/x', {'api_key': 'a', 'base': 'EUR', 'date': '2024-01-01'}) == \
+            make_key('https://api/x/', {'date': '2024-01-01', 'base': 'EUR', 'api_key': 'b'})
+    
+    def test_put_get_round_trip_and_eviction(self, tmp_path):
+        """Verifica que guarda comprimido y que expulsa las entradas más antiguas al superar el tamaño."""
+        cache = ProviderResponseCache(str(tmp_path), max_bytes=10 ** 6)
+        cache.put('https://api/x', {'date': '2024-01-01'}, self.BODY)
+        assert cache.get('https://api/x', {'date': '2024-01-01'}) == self.BODY
+        
+        small = ProviderResponseCache(str(tmp_path / 'small'), max_bytes=1)
+        small.put('https://api/x', {'date': '2024-01-01'}, self.BODY)
+        assert small.get('https://api/x', {'date': '2024-01-01'}) is None
+    
+    def test_default_bulk_fetch_makes_no_calls_offline(self):
+        """Verifica que en modo offline un proveedor sin caché propia no llama a get_rate."""
+        class LiveOnlyProvider(BaseCurrencyProvider):
+            get_rate = MagicMock(return_value=Decimal('1.1'))
+        
+        with pytest.raises(OfflineCacheMiss):
+            asyncio.run(LiveOnlyProvider().aget_rates(None, 'EUR', ['USD'], date(2024, 1, 1), None, offline=True))
+        LiveOnlyProvider.get_rate.assert_not_called()
+    
+    def test_offline_miss_raises(self, settings, tmp_path):
+        """Verifica que en modo offline un fallo de caché no llama al proveedor."""
+        settings.PROVIDER_RESPONSE_CACHE_DIR = str(tmp_path)
+        fetch = MagicMock()
+        
+        with pytest.raises(OfflineCacheMiss):
+            read_through('https://api/x', {'date': '2024-01-01'}, fetch, offline=True)
+        fetch.assert_not_called()
+    
+    def test_currency_beacon_replays_cached_response(self, settings, tmp_path):
+        """Verifica que el adapter solo llama a la API una vez y después funciona offline."""
+        settings.PROVIDER_RESPONSE_CACHE_DIR = str(tmp_path)
+        settings.CURRENCY_BEACON_API_KEY = 'secret'
+        response = MagicMock(content=self.BODY)
+        
+        with patch('MyCurrency.services.adapters.requests.get', return_value=response) as get:
+            assert CurrencyBeaconProvider().get_rate('EUR', 'USD', date(2024, 1, 1)) == Decimal('1.0854')
+            settings.CURRENCY_BEACON_API_KEY = ''
+            settings.PROVIDER_RESPONSE_CACHE_OFFLINE = True
+            assert CurrencyBeaconProvider().get_rate('EUR', 'USD', date(2024, 1, 1)) == Decimal('1.0854')
+        
+        assert get.call_count == 1
+
+
+class TestAsyncHistoricalLoader:
+    """Tests para la carga histórica asíncrona a través del registro de adapters."""
+    
+    @pytest.fixture
+    def two_providers(self, db, settings):
+        """Fixture con EUR, USD, GBP, currency_beacon (prioridad 1) y mock (prioridad 2)."""
+        settings.CURRENCY_BEACON_API_KEY = 'secret'
+        for code in ('EUR', 'USD', 'GBP'):
+            Currency.objects.create(code=code, name=code, symbol=code)
+        Provider.objects.create(name='currency_beacon', priority=1, is_active=True)
+        Provider.objects.create(name='mock', priority=2, is_active=True)
+    
+    def test_falls_back_per_cell_to_next_provider(self, two_providers):
+        """Verifica que las celdas que no sirve el primer proveedor se piden al siguiente."""
+        beacon = AsyncMock(return_value={'USD': Decimal('1.1')})
+        
+        with patch.object(CurrencyBeaconProvider, 'aget_rates', beacon):
+            stats = async_to_sync(load_historical_rates)('EUR', ['USD', 'GBP'], date(2024, 1, 1), date(2024, 1, 2))
+        
+        assert stats['successful'] == 4
+        assert stats['by_provider'] == {'currency_beacon': 2, 'mock': 2}
+        assert beacon.await_count == 2
+        assert set(CurrencyExchangeRate.objects.filter(exchanged_currency__code='GBP').values_list('provider', flat=True)) == {'mock'}
+    
+    def test_spread_distributes_days_across_providers(self, two_providers):
+        """Verifica que en modo spread cada día empieza por un proveedor distinto."""
+        beacon = AsyncMock(side_effect=lambda session, source, targets, *args, **kwargs: {t: Decimal('1.1') for t in targets})
+        
+        with patch.object(CurrencyBeaconProvider, 'aget_rates', beacon):
+            stats = async_to_sync(load_historical_rates)(
+                'EUR', ['USD'], date(2024, 1, 1), date(2024, 1, 4), spread=True
+            )
+        
+        assert stats['by_provider'] == {'currency_beacon': 2, 'mock': 2}
+    
+    def test_unavailable_provider_is_skipped(self, two_providers, settings):
+        """Verifica que un proveedor sin credenciales no se usa."""
+        settings.CURRENCY_BEACON_API_KEY = ''
+        
+        stats = async_to_sync(load_historical_rates)('EUR', ['USD'], date(2024, 1, 1), date(2024, 1, 1))
+        
+        assert stats['by_provider'] == {'mock': 1}
+
+
+class TestHistoricalLoadJobQueue:
+    """Tests para la cola de trabajos de carga histórica."""
+    
+    @pytest.fixture
+    def mock_provider(self, db, settings):
+        """Fixture con EUR, USD y el proveedor mock; sub-trabajos de 10 días."""
+        settings.JOB_MAX_DAYS_PER_SUBJOB = 10
+        for code in ('EUR', 'USD'):
+            Currency.objects.create(code=code, name=code, symbol=code)
+        Provider.objects.create(name='mock', priority=1, is_active=True)
+    
+    def test_workers_claim_distinct_jobs_and_parent_completes(self, mock_provider):
+        """Verifica que cada worker reclama un sub-trabajo distinto y que el padre se completa al final."""
+        parent = submit_historical_load('EUR', ['USD'], date(2024, 1, 1), date(2024, 1, 15))
+        first, second = claim_job('worker-1'), claim_job('worker-2')
+        
+        assert {first.date_from, second.date_from} == {date(2024, 1, 1), date(2024, 1, 11)}
+        assert claim_job('worker-3') is None
+        
+        run_job(first)
+        parent.refresh_from_db()
+        assert parent.status == HistoricalLoadJob.SPLIT and parent.processed_cells == first.total_cells
+        
+        run_job(second)
+        parent.refresh_from_db()
+        assert parent.status == HistoricalLoadJob.DONE
+        assert parent.successful_cells == 15
+        assert CurrencyExchangeRate.objects.count() == 15
+    
+    def test_failed_job_is_retried_then_failed(self, mock_provider):
+        """Verifica que un trabajo que falla vuelve a la cola hasta agotar los intentos."""
+        job = submit_historical_load('EUR', ['USD'], date(2024, 1, 1), date(2024, 1, 2))
+        job.max_attempts = 2
+        job.save()
+        
+        with patch('MyCurrency.services.job_queue.load_historical_rates', side_effect=RuntimeError('boom')):
+            run_job(claim_job('worker-1'))
+            job.refresh_from_db()
+            assert job.status == HistoricalLoadJob.PENDING and 'boom' in job.last_error
+            HistoricalLoadJob.objects.filter(pk=job.pk).update(run_after=None)
+            run_job(claim_job('worker-1'))
+        
+        job.refresh_from_db()
+        assert job.status == HistoricalLoadJob.FAILED and job.attempts == 2
+    
+    def test_stale_running_job_is_requeued(self, mock_provider, settings):
+        """Verifica que un trabajo sin heartbeat (worker caído) vuelve a la cola."""
+        settings.JOB_HEARTBEAT_TIMEOUT = 0
+        job = submit_historical_load('EUR', ['USD'], date(2024, 1, 1), date(2024, 1, 2))
+        claim_job('worker-1')
+        
+        assert requeue_stale_jobs() == (1, 0)
+        job.refresh_from_db()
+        assert job.status == HistoricalLoadJob.PENDING
+        assert claim_job('worker-2').pk == job.pk
+
+
+class TestCrossRates:
+    """Tests para la matriz de tipos cruzados"""
+    
+    @pytest.mark.parametrize('use_numpy', [True, False])
+    def test_non_positive_rates_give_empty_cells(self, use_numpy):
+        """Verifica que una tasa cero o negativa deja vacías sus celdas con y sin NumPy."""
+        if use_numpy and cross_rates.numpy is None:
+            pytest.skip('NumPy no está instalado')
+        vector = {'EUR': Decimal(1), 'USD': Decimal('1.25'), 'XXX': Decimal(0), 'YYY': Decimal('-2')}
+        codes = ['EUR', 'USD', 'XXX', 'YYY']
+        
+        with patch.object(cross_rates, 'numpy', cross_rates.numpy if use_numpy else None):
+            matrix = cross_rates.cross_rate_matrix(vector, codes, codes)
+        
+        assert matrix[0] == [1.0, 1.25, None, None]
+        assert matrix[1] == [0.8, 1.0, None, None]
+        assert matrix[2] == matrix[3] == [None] * 4
+
+
+class TestRateStream:
+    """Tests para la difusión de tasas en vivo (broker en proceso y sockets Unix)."""
+    
+    EVENT = {'source_currency': 'EUR', 'exchanged_currency': 'USD', 'valuation_date': '2024-01-02',
+             'rate_value': '1.100000', 'provider': 'mock'}
+    
+    def test_broker_fans_out_by_topic(self):
+        """Verifica que cada suscripción recibe solo sus monedas origen o parejas, una vez por evento."""
+        async def run():
+            local = RateBroker()
+            by_source = local.subscribe({'EUR', 'EUR/USD'})
+            other_pair = local.subscribe({'EUR/GBP'})
+            await asyncio.to_thread(local.publish, [self.EVENT])
+            received = await asyncio.wait_for(by_source.get(), 1)
+            assert by_source.queue.empty() and other_pair.queue.empty()
+            local.unsubscribe(by_source)
+            local.unsubscribe(other_pair)
+            assert not local.has_subscribers()
+            return received
+        
+        assert asyncio.run(run()) == self.EVENT
+    
+    def test_slow_subscriber_drops_oldest(self):
+        """Verifica que una suscripción llena descarta las actualizaciones más antiguas."""
+        async def run():
+            local = RateBroker()
+            subscription = local.subscribe({'EUR'}, maxsize=2)
+            local.publish([dict(self.EVENT, rate_value=str(i)) for i in range(3)])
+            return subscription.dropped, [subscription.queue.get_nowait()['rate_value'] for _ in range(2)]
+        
+        assert asyncio.run(run()) == (1, ['1', '2'])
+    
+    def test_unix_datagram_backend_between_processes(self, tmp_path):
+        """Verifica que los sockets Unix entregan las actualizaciones y eliminan los sockets huérfanos."""
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        stale.bind(str(tmp_path / 'stale.sock'))
+        stale.close()
+        
+        async def run():
+            local = RateBroker()
+            backend = UnixDatagramBackend(str(tmp_path), local)
+            subscription = local.subscribe({'EUR/USD'})
+            backend.attach()
+            try:
+                await asyncio.to_thread(backend.publish, [self.EVENT])
+                return await asyncio.wait_for(subscription.get(), 2)
+            finally:
+                backend.close()
+        
+        assert asyncio.run(run()) == self.EVENT
+        assert list(tmp_path.iterdir()) == []
+    
+    def test_unix_datagram_sockets_do_not_collide(self, tmp_path):
+        """Verifica que dos procesos con el mismo pid (contenedores distintos) no se pisan el socket."""
+        first = UnixDatagramBackend(str(tmp_path), RateBroker())
+        second = UnixDatagramBackend(str(tmp_path), RateBroker())
+        first.attach()
+        second.attach()
+        try:
+            assert len(list(tmp_path.iterdir())) == 2
+        finally:
+            first.close()
+            second.close()
+    
+    def test_dead_sockets_are_not_subscribers(self, tmp_path):
+        """Verifica que los sockets de procesos caídos no cuentan como suscriptores y se eliminan."""
+        live = UnixDatagramBackend(str(tmp_path), RateBroker())
+        publisher = UnixDatagramBackend(str(tmp_path), RateBroker())
+        dead = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        dead.bind(str(tmp_path / 'crashed.sock'))
+        dead.close()
+        
+        assert publisher.has_subscribers() is False
+        assert list(tmp_path.iterdir()) == []
+        
+        live.attach()
+        try:
+            assert publisher.has_subscribers() is True
+        finally:
+            live.close()
+        assert publisher.has_subscribers() is False
+    
+    def test_socket_is_removed_with_last_subscriber(self, tmp_path, settings):
+        """Verifica que el proceso retira su socket cuando se va su último suscriptor."""
+        settings.RATE_STREAM_SOCKET_DIR = str(tmp_path)
+        
+        async def run():
+            subscription = subscribe({'EUR/USD'})
+            bound = len(list(tmp_path.iterdir()))
+            unsubscribe(subscription)
+            return bound
+        
+        assert asyncio.run(run()) == 1
+        assert list(tmp_path.iterdir()) == []
+    
+    def test_committed_rates_are_published(self, db, django_capture_on_commit_callbacks):
+        """Verifica que las tasas se publican con su valor al confirmarse la transacción."""
+        eur = Currency.objects.create(code='EUR', name='Euro', symbol='€')
+        usd = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+        loop = asyncio.new_event_loop()
+        
+        async def subscribe():
+            return broker.subscribe({'EUR/USD'})
+        
+        subscription = loop.run_until_complete(subscribe())
+        try:
+            with django_capture_on_commit_callbacks(execute=True):
+                CurrencyExchangeRate.objects.create(
+                    source_currency=eur, exchanged_currency=usd, valuation_date=date(2024, 1, 2),
+                    rate_value=Decimal('1.1'), provider='mock'
+                )
+                assert subscription.queue.empty()
+            
+            event = loop.run_until_complete(asyncio.wait_for(subscription.get(), 1))
+            assert event == self.EVENT
+            assert publish_rates([('EUR', 'USD', date(2024, 1, 3))]) == 0
+        finally:
+            broker.unsubscribe(subscription)
+            loop.close()
+
+
+
+class TestTracing:
+    """Tests para las trazas de servicios, proveedores y SQL."""
+    
+    @pytest.fixture
+    def exported(self, settings):
+        """Fixture que muestrea todas las trazas y devuelve los spans exportados."""
+        settings.TRACING_SAMPLE_RATE = 1.0
+        exporter = tracing.get_exporter()
+        exporter.spans.clear()
+        return exporter.spans
+    
+    def test_service_provider_and_sql_spans_form_one_trace(self, exported, db):
+        """Verifica que la consulta, el proveedor y el SQL cuelgan de un mismo árbol de spans."""
+        Currency.objects.create(code='EUR', name='Euro', symbol='€')
+        Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+        Provider.objects.create(name='mock', priority=1, is_active=True)
+        
+        assert get_exchange_rate_data('EUR', 'USD', date.today()) is not None
+        
+        by_name = {}
+        for finished in exported:
+            by_name.setdefault(finished.name, []).append(finished)
+        root = by_name['get_exchange_rate_data'][0]
+        provider_span = by_name['provider.get_rate'][0]
+        assert root.parent_id is None
+        assert {s.trace_id for s in exported} == {root.trace_id}
+        assert provider_span.parent_id == root.span_id
+        assert provider_span.attributes['provider'] == 'mock'
+        assert by_name['rates.upsert'][0].parent_id == root.span_id
+        assert any(s.attributes['db.statement'].startswith('INSERT') for s in by_name['db.query'])
+    
+    def test_unsampled_traces_record_nothing(self, exported, settings, db):
+        """Verifica que una traza no muestreada no exporta spans ni crea hijos."""
+        settings.TRACING_SAMPLE_RATE = 0
+        
+        with tracing.span('root') as root:
+            assert tracing.span('child') is tracing.NOOP_SPAN
+            assert not root.sampled
+            Currency.objects.count()
+        
+        assert exported == []
+    
+    def test_context_propagates_to_tasks_and_outgoing_headers(self, exported):
+        """Verifica que las tareas asyncio heredan la traza y que se propaga en traceparent."""
+        async def fetch():
+            with tracing.span('http.get', kind='client'):
+                return tracing.inject_headers()['traceparent']
+        
+        async def run():
+            with tracing.span('load') as root:
+                return root, await asyncio.gather(fetch(), fetch())
+        
+        root, headers = asyncio.run(run())
+        
+        children = [s for s in exported if s.name == 'http.get']
+        assert len(children) == 2
+        assert all(s.parent_id == root.span_id for s in children)
+        assert sorted(headers) == sorted(f'00-{root.trace_id}-{s.span_id}-01' for s in children)
+
+
+
+class TestInvalidationBus:
+    """Tests para el bus de invalidación de cachés entre procesos."""
+    
+    @pytest.fixture
+    def buses(self):
+        """Fixture con dos procesos simulados (escritor y lector) sobre el mismo backend."""
+        backend = LocalBackend()
+        reader = InvalidationBus(backend, origin='reader')
+        reader.start()
+        return InvalidationBus(backend, origin='writer'), reader
+    
+    def cache_range(self, date_from, date_to):
+        key = rate_range_cache.make_key('EUR', date_from, date_to)
+        rate_range_cache.set(key, date_to, b'[]', 'application/json', Validators('"x"', None))
+        return date_from, date_to
+    
+    def is_cached(self, cached_range):
+        return cache.get(rate_range_cache.make_key('EUR', *cached_range)) is not None
+    
+    def test_rate_notification_evicts_covering_ranges(self, buses):
+        """Verifica que otro proceso solo desaloja los rangos que cubren las fechas escritas."""
+        writer, reader = buses
+        january = self.cache_range(date(2024, 1, 1), date(2024, 1, 10))
+        february = self.cache_range(date(2024, 2, 1), date(2024, 2, 10))
+        
+        reader.publish_rates([('EUR', 'USD', date(2024, 2, 5))])
+        assert self.is_cached(february)
+        
+        writer.publish_rates([('EUR', 'USD', date(2024, 1, 5)), ('GBP', 'USD', date(2024, 2, 5))])
+        
+        assert not self.is_cached(january)
+        assert self.is_cached(february)
+    
+    def test_large_writes_are_sent_as_a_date_range(self, buses):
+        """Verifica que una carga grande se notifica como un rango compacto."""
+        writer, _reader = buses
+        days = [date.fromordinal(date(2020, 1, 1).toordinal() + i) for i in range(1000)]
+        payloads = encode_rates('writer', [('EUR', 'USD', d) for d in days])
+        june = self.cache_range(date(2021, 6, 1), date(2021, 6, 30))
+        
+        writer.publish_rates([('EUR', 'USD', d) for d in days])
+        
+        assert len(payloads) == 1 and len(payloads[0]) < 100
+        assert not self.is_cached(june)
+    
+    def test_registry_notification_reloads_push_invalidated_registry(self, buses, db):
+        """Verifica que el registro no consulta la marca de versión y se recarga con la notificación."""
+        _writer, reader = buses
+        registry.load()
+        registry.push_invalidated = True
+        try:
+            # Written without signals, as seen from another process
+            Currency.objects.bulk_create([Currency(code='EUR', name='Euro', symbol='€')])
+            with patch.object(registry, '_current_version') as current_version:
+                assert registry.get_currency('EUR') is None
+                current_version.assert_not_called()
+            
+            reader.receive(encode_registry('writer'))
+            
+            assert registry.get_currency('EUR') is not None
+        finally:
+            registry.push_invalidated = False
+    
+    def test_committed_writes_are_broadcast(self, db, django_capture_on_commit_callbacks):
+        """Verifica que las escrituras confirmadas de tasas y proveedores se publican en el bus."""
+        backend = LocalBackend()
+        received = []
+        backend.listen(received.append, None)
+        eur = Currency.objects.create(code='EUR', name='Euro', symbol='€')
+        usd = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+        
+        with patch('MyCurrency.signals.get_bus', return_value=InvalidationBus(backend, origin='writer')):
+            with django_capture_on_commit_callbacks(execute=True):
+                CurrencyExchangeRate.objects.create(
+                    source_currency=eur, exchanged_currency=usd, valuation_date=date(2024, 1, 2),
+                    rate_value=Decimal('1.1'), provider='mock'
+                )
+                Provider.objects.create(name='mock', priority=1, is_active=True)
+                assert received == []
+        
+        assert received == [
+            encode_rates('writer', [('EUR', 'USD', date(2024, 1, 2))])[0],
+            encode_registry('writer'),
+        ]
+
+
+class TestLedgerConversion:
+    """Tests para la conversión masiva de libros de transacciones (convert_ledger)."""
+    
+    @pytest.fixture
+    def rates(self, db):
+        """Fixture con USD->EUR el viernes 5 y el lunes 8 de enero de 2024."""
+        eur = Currency.objects.create(code='EUR', name='Euro', symbol='€')
+        usd = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+        for day, value in ((5, '0.912345'), (8, '0.9')):
+            CurrencyExchangeRate.objects.create(
+                source_currency=usd, exchanged_currency=eur, valuation_date=date(2024, 1, day),
+                rate_value=Decimal(value), provider='mock'
+            )
+    
+    @pytest.mark.parametrize('use_numpy', [True, False])
+    def test_fixed_point_matches_decimal_half_even(self, use_numpy, monkeypatch):
+        """Verifica que la aritmética entera redondea igual que Decimal con ROUND_HALF_EVEN (con y sin NumPy)."""
+        if not use_numpy:
+            monkeypatch.setattr(ledger, 'numpy', None)
+        amounts = ['0.005', '-0.005', '0.015', '-2.5', '1234567.891', '12', '-0.0001', '9999999.99']
+        rate = Decimal('1.234567')
+        
+        ints, scale = ledger._parse_amounts(amounts)
+        products = ledger._multiply_round(ints, [1234567] * len(ints), scale + ledger.RATE_SCALE - 2)
+        
+        expected = [(Decimal(a) * rate).quantize(Decimal('0.01'), rounding=ROUND_HALF_EVEN) for a in amounts]
+        assert [Decimal(ledger._format_fixed(p, 2)) for p in products] == expected
+    
+    def test_converts_csv_in_chunks(self, rates, tmp_path):
+        """Verifica la conversión por bloques: tasa del fin de semana arrastrada, misma moneda, sin tasa e inválidas."""
+        source = tmp_path / 'ledger.csv'
+        source.write_text(
+            'id,date,currency,amount\n'
+            '1,2024-01-05,USD,100.00\n'
+            '2,2024-01-07,USD,-10.5\n'
+            '3,2024-01-08,EUR,7\n'
+            '4,2023-01-01,USD,1\n'
+            '5,2024-01-08,USD,abc\n'
+        )
+        output = tmp_path / 'ledger_eur.csv'
+        
+        stats = convert_ledger(str(source), str(output), 'EUR', chunk_size=2)
+        
+        lines = output.read_text().splitlines()
+        assert lines[0] == 'id,date,currency,amount,rate,rate_date,converted_amount'
+        assert lines[1:] == [
+            '1,2024-01-05,USD,100.00,0.912345,2024-01-05,91.23',
+            '2,2024-01-07,USD,-10.5,0.912345,2024-01-05,-9.58',
+            '3,2024-01-08,EUR,7,1,2024-01-08,7.00',
+            '4,2023-01-01,USD,1,,,',
+            '5,2024-01-08,USD,abc,0.900000,2024-01-08,',
+        ]
+        assert (stats['rows'], stats['chunks'], stats['converted'], stats['missing_rate'], stats['invalid']) == (5, 3, 3, 1, 1)
+    
+    def test_converts_parquet_timestamp_dates(self, rates, tmp_path):
+        """Verifica que una columna de fechas Parquet de tipo timestamp se convierte a fechas."""
+        pyarrow = pytest.importorskip('pyarrow')
+        import pyarrow.parquet
+        source = str(tmp_path / 'ledger.parquet')
+        pyarrow.parquet.write_table(pyarrow.table({
+            'date': pyarrow.array([datetime(2024, 1, 7, 15, 30)], type=pyarrow.timestamp('us')),
+            'currency': ['USD'],
+            'amount': ['100'],
+        }), source)
+        output = str(tmp_path / 'ledger_eur.parquet')
+        
+        stats = convert_ledger(source, output, 'EUR')
+        
+        row = pyarrow.parquet.read_table(output).to_pylist()[0]
+        assert stats['converted'] == 1
+        assert str(row['rate_date']) == '2024-01-05'
+        assert str(row['converted_amount']) == '91.23'
@@ -0,0 +1,314 @@
+"""
+Lightweight distributed tracing.
+
+``span(name, **attributes)`` opens a span as a child of the current one,
+tracked in a context variable, so the hierarchy follows asyncio tasks,
+``asyncio.to_thread`` and ``sync_to_async`` calls without extra plumbing.
+``TracingMiddleware`` opens the server span of each request (continuing a
+W3C ``traceparent`` header), every SQL statement becomes a child span through
+a database execute wrapper, and ``inject_headers`` propagates the context to
+outgoing HTTP calls.
+
+Whether a trace is recorded is decided once at its root: with probability
+TRACING_SAMPLE_RATE, or as the incoming ``traceparent`` says. Spans of an
+unsampled trace are a shared no-op object, so tracing costs one context
+variable lookup per span. Finished spans are buffered and handed to the
+exporter (TRACING_EXPORTER) when their local root ends; the default
+``JsonLinesExporter`` appends OTLP/JSON-style lines to TRACING_EXPORT_PATH,
+so no collector is needed.
+"""
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_RATE = 0.01
+DEFAULT_EXPORTER = 'MyCurrency.tracing.JsonLinesExporter'
+# Spans buffered before a flush even if their trace is still open
+MAX_BUFFERED_SPANS = 512
+MAX_STATEMENT_LENGTH = 1000
+
+TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+_current_span = ContextVar('mycurrency_current_span', default=None)
+
+
+class Span:
+    """A timed operation; use as a context manager."""
+    __slots__ = (
+        'name', 'kind', 'trace_id', 'span_id', 'parent_id', 'sampled', 'attributes', 'status',
+        'start_ns', 'end_ns', 'is_local_root', '_token'
+    )
+
+    def __init__(self, name, trace_id, parent_id, sampled, kind='internal', attributes=None, is_local_root=False):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = attributes or {}
+        self.status = 'ok'
+        self.start_ns = self.end_ns = None
+        self.is_local_root = is_local_root
+
+    def set_attribute(self, key, value):
+        if self.sampled:
+            self.attributes[key] = value
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        if self.sampled:
+            self.start_ns = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self._token)
+        if self.sampled:
+            self.end_ns = time.time_ns()
+            if exc_type is not None:
+                self.status = 'error'
+                self.attributes['exception.type'] = exc_type.__name__
+                self.attributes['exception.message'] = str(exc)[:MAX_STATEMENT_LENGTH]
+            _processor.on_end(self)
+        return False
+
+    def to_dict(self):
+        """OTLP/JSON field names, attributes flattened to a mapping."""
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id or '',
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': self.start_ns,
+            'endTimeUnixNano': self.end_ns,
+            'durationMs': round((self.end_ns - self.start_ns) / 1e6, 3),
+            'attributes': self.attributes,
+            'status': self.status,
+        }
+
+
+class _NoopSpan:
+    """Child of an unsampled trace: records nothing and leaves the context alone."""
+    sampled = False
+
+    def set_attribute(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _should_sample():
+    rate = getattr(settings, 'TRACING_SAMPLE_RATE', DEFAULT_SAMPLE_RATE)
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def span(name, kind='internal', **attributes):
+    """Open a child span of the current one (a new trace when there is none)."""
+    parent = _current_span.get()
+    if parent is None:
+        return Span(name, os.urandom(16).hex(), None, _should_sample(), kind, attributes, is_local_root=True)
+    if not parent.sampled:
+        return NOOP_SPAN
+    return Span(name, parent.trace_id, parent.span_id, True, kind, attributes)
+
+
+def start_remote_span(name, traceparent, kind='server', **attributes):
+    """Open a local root span continuing a W3C ``traceparent``, or a new trace if it is missing or invalid."""
+    match = TRACEPARENT_RE.match((traceparent or '').strip().lower())
+    if match is None or _current_span.get() is not None:
+        return span(name, kind, **attributes)
+    trace_id, parent_id, flags = match.groups()
+    return Span(name, trace_id, parent_id, bool(int(flags, 16) & 1), kind, attributes, is_local_root=True)
+
+
+def inject_headers(headers=None):
+    """Return ``headers`` with the ``traceparent`` of the current span (for outgoing requests)."""
+    headers = dict(headers or {})
+    current = _current_span.get()
+    if isinstance(current, Span):
+        headers['traceparent'] = f"00-{current.trace_id}-{current.span_id}-{'01' if current.sampled else '00'}"
+    return headers
+
+
+def traced(name=None, **attributes):
+    """Decorator running a sync or async function inside a span."""
+    def decorator(func):
+        span_name = name or f'{func.__module__}.{func.__qualname__}'
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, **attributes):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class SpanExporter:
+    """Receives batches of finished, sampled spans."""
+
+    def export(self, spans):
+        raise NotImplementedError
+
+
+class JsonLinesExporter(SpanExporter):
+    """Append one JSON object per span to ``path`` (TRACING_EXPORT_PATH)."""
+
+    def __init__(self, path=None):
+        self.path = path or getattr(settings, 'TRACING_EXPORT_PATH', None) or os.path.join(settings.BASE_DIR, 'traces', 'spans.jsonl')
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        lines = ''.join(json.dumps(s.to_dict(), default=str) + '\n' for s in spans)
+        with self._lock:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+
+
+class InMemoryExporter(SpanExporter):
+    """Keep the exported spans in ``spans`` (tests, debugging)."""
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+
+class _SpanProcessor:
+    """Buffers finished spans and exports them when a local root ends."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._exporter = None
+        self._exporter_path = None
+
+    def get_exporter(self):
+        path = getattr(settings, 'TRACING_EXPORTER', DEFAULT_EXPORTER)
+        if self._exporter is None or self._exporter_path != path:
+            self._exporter = import_string(path)()
+            self._exporter_path = path
+        return self._exporter
+
+    def on_end(self, finished):
+        with self._lock:
+            self._buffer.append(finished)
+            if not finished.is_local_root and len(self._buffer) < MAX_BUFFERED_SPANS:
+                return
+            batch, self._buffer = self._buffer, []
+        try:
+            self.get_exporter().export(batch)
+        except Exception as e:
+            logger.warning(f"Could not export {len(batch)} spans: {e}")
+
+
+_processor = _SpanProcessor()
+
+
+def get_exporter():
+    return _processor.get_exporter()
+
+
+def _db_span(execute, sql, params, many, context):
+    if not getattr(_current_span.get(), 'sampled', False):
+        return execute(sql, params, many, context)
+    connection = context['connection']
+    with span('db.query', kind='client', **{
+        'db.system': connection.vendor,
+        'db.name': connection.alias,
+        'db.statement': sql[:MAX_STATEMENT_LENGTH],
+        'db.executemany': many,
+    }):
+        return execute(sql, params, many, context)
+
+
+def _install_db_span(sender, connection, **kwargs):
+    if _db_span not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_span)
+
+
+def install():
+    """Trace the SQL statements of every database connection."""
+    connection_created.connect(_install_db_span, dispatch_uid='mycurrency_tracing_db')
+    from django.db import connections
+    for connection in connections.all(initialized_only=True):
+        _install_db_span(None, connection)
+
+
+class TracingMiddleware:
+    """
+    Server span around each request (continuing an incoming ``traceparent``)
+    with the route, view and status; the trace id is returned in
+    ``X-Trace-Id`` for sampled traces.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def _open(self, request):
+        return start_remote_span(
+            f'{request.method} {request.path}', request.headers.get('traceparent'),
+            **{'http.method': request.method, 'http.target': request.get_full_path()}
+        )
+
+    @staticmethod
+    def _close(request_span, request, response):
+        match = getattr(request, 'resolver_match', None)
+        if match is not None and request_span.sampled:
+            # Name by route, not path, so spans of one endpoint group together
+            request_span.name = f'{request.method} /{match.route}'
+            request_span.set_attribute('http.route', match.route)
+            request_span.set_attribute('view', match.view_name)
+        request_span.set_attribute('http.status_code', response.status_code)
+        if request_span.sampled:
+            response['X-Trace-Id'] = request_span.trace_id
+        return response
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with self._open(request) as request_span:
+            return self._close(request_span, request, self.get_response(request))
+
+    async def __acall__(self, request):
+        with self._open(request) as request_span:
+            return self._close(request_span, request, await self.get_response(request))
@@ -1,18 +1,34 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .api import CurrencyViewSet, ExchangeRateListView, ConvertAmountView
+from .views import rate_stream
+from .api import (
+    CurrencyViewSet, ExchangeRateListView, ExchangeRateAggregateView, ExchangeRateAsOfView,
+    CrossRateMatrixView, ConvertAmountView, HistoricalLoadJobViewSet, ExchangeRateChangesView
+)
 
 router = DefaultRouter()
 router.register(r'currencies', CurrencyViewSet)
+router.register(r'jobs/historical-loads', HistoricalLoadJobViewSet, basename='historical-load-job')
 
 # Namespace for API versioning. This allows:
 # - /api/v1/currencies/
 # - /api/v1/rates/
+# - /api/v1/rates/aggregate/
+# - /api/v1/rates/as-of/
+# - /api/v1/rates/matrix/
+# - /api/v1/rates/changes/
+# - /api/v1/rates/stream/
 # - /api/v1/convert/
+# - /api/v1/jobs/historical-loads/
 app_name = 'v1'
 
 urlpatterns = [
     path('', include(router.urls)),
     path('rates/', ExchangeRateListView.as_view(), name='exchange-rate-list'),
+    path('rates/aggregate/', ExchangeRateAggregateView.as_view(), name='exchange-rate-aggregate'),
+    path('rates/as-of/', ExchangeRateAsOfView.as_view(), name='exchange-rate-as-of'),
+    path('rates/matrix/', CrossRateMatrixView.as_view(), name='cross-rate-matrix'),
+    path('rates/changes/', ExchangeRateChangesView.as_view(), name='exchange-rate-changes'),
+    path('rates/stream/', rate_stream, name='exchange-rate-stream'),
     path('convert/', ConvertAmountView.as_view(), name='convert-amount'),
 ]
@@ -1,3 +1,77 @@
-from django.shortcuts import render
+"""
+Async Django views (outside DRF, whose views are synchronous).
+"""
+import asyncio
+import json
+import re
 
-# Create your views here.
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+
+from .services.rate_stream import subscribe, unsubscribe
+
+DEFAULT_HEARTBEAT_SECONDS = 15
+CODE_RE = re.compile(r'^[A-Z]{3}$')
+
+
+def _parse_topics(request):
+    """Topics from ``sources=EUR,GBP`` and ``pairs=EUR/USD``; None if a code is malformed."""
+    topics = set()
+    for source_code in filter(None, request.GET.get('sources', '').upper().split(',')):
+        if not CODE_RE.match(source_code):
+            return None
+        topics.add(source_code)
+    for pair in filter(None, request.GET.get('pairs', '').upper().split(',')):
+        source_code, _, target_code = pair.partition('/')
+        if not (CODE_RE.match(source_code) and CODE_RE.match(target_code)):
+            return None
+        topics.add(f'{source_code}/{target_code}')
+    return topics
+
+
+async def rate_stream(request):
+    """
+    Server-Sent Events stream of the rates written for the subscribed
+    source currencies and pairs. Idle connections get a comment line every
+    RATE_STREAM_HEARTBEAT_SECONDS; when updates had to be dropped for a slow
+    client an ``overflow`` event tells it to resync (e.g. from the change feed).
+    Only served under ASGI: a WSGI server reads an async stream to the end
+    before sending it, so it would never deliver an event.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {"error": "The rate stream needs an ASGI server (e.g. uvicorn config.asgi:application)."},
+            status=501
+        )
+    topics = _parse_topics(request)
+    if not topics:
+        return JsonResponse(
+            {"error": "Provide sources=EUR,... and/or pairs=EUR/USD,... with 3-letter currency codes."},
+            status=400
+        )
+    heartbeat = getattr(settings, 'RATE_STREAM_HEARTBEAT_SECONDS', DEFAULT_HEARTBEAT_SECONDS)
+
+    async def events():
+        subscription = subscribe(topics)
+        dropped = 0
+        try:
+            yield ': subscribed\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                if subscription.dropped != dropped:
+                    yield f'event: overflow\ndata: {json.dumps({"dropped": subscription.dropped - dropped})}\n\n'
+                    dropped = subscription.dropped
+                yield f'event: rate\ndata: {json.dumps(event)}\n\n'
+        finally:
+            unsubscribe(subscription)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Disable proxy buffering (nginx) so updates are delivered immediately
+    response['X-Accel-Buffering'] = 'no'
+    return response
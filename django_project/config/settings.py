@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -38,6 +39,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'MyCurrency.tracing.TracingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,6 +83,40 @@ DATABASES = {
     }
 }
 
+# Read replicas: DATABASE_REPLICA_HOSTS="replica1,replica2" adds one alias per host
+# (same credentials as the primary). Read-only endpoints are routed to them.
+REPLICA_DATABASES = []
+for index, host in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_HOSTS', '').split(',')), start=1):
+    alias = f'replica_{index}'
+    DATABASES[alias] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['MyCurrency.db_router.ReadReplicaRouter']
+
+# Replicas lagging behind the primary by more than this (seconds) are not used
+REPLICA_MAX_LAG_SECONDS = 10
+REPLICA_LAG_CHECK_INTERVAL = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory by default; set REDIS_URL to share the cache between processes.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'mycurrency',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -138,5 +174,103 @@ SPECTACULAR_SETTINGS = {
 }
 
 # Currency Beacon API Key
-import os
 CURRENCY_BEACON_API_KEY = os.environ.get('CURRENCY_BEACON_API_KEY', '')
+
+# On-disk cache of raw provider responses (past dates only), so reloads replay
+# downloaded data. Offline mode never calls the providers.
+PROVIDER_RESPONSE_CACHE_DIR = os.environ.get('PROVIDER_RESPONSE_CACHE_DIR') or str(BASE_DIR / '.provider_cache')
+PROVIDER_RESPONSE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+PROVIDER_RESPONSE_CACHE_OFFLINE = os.environ.get('PROVIDER_RESPONSE_CACHE_OFFLINE', '0') == '1'
+
+# Per-provider limits for bulk loads (load_historical); unset values use the adapter defaults
+PROVIDER_LOADER_LIMITS = {
+    'currency_beacon': {'max_concurrency': 10, 'requests_per_second': 10},
+}
+
+# Time budget (seconds) for resolving several target currencies at once (admin converter)
+EXCHANGE_RATE_BULK_TIME_BUDGET = float(os.environ.get('EXCHANGE_RATE_BULK_TIME_BUDGET', '8'))
+
+# Background historical load jobs (`manage.py run_job_worker`): ranges longer
+# than JOB_MAX_DAYS_PER_SUBJOB are split; jobs without a heartbeat for
+# JOB_HEARTBEAT_TIMEOUT seconds are re-queued (JOB_RETRY_BACKOFF * attempt)
+JOB_MAX_DAYS_PER_SUBJOB = 31
+JOB_HEARTBEAT_INTERVAL = 10
+JOB_HEARTBEAT_TIMEOUT = 60
+JOB_RETRY_BACKOFF = 30
+
+# Admin changelists of large tables: planner estimates above this many rows
+# replace COUNT(*); the unfiltered total is only counted when enabled
+ADMIN_EXACT_COUNT_THRESHOLD = 10000
+ADMIN_SHOW_FULL_RESULT_COUNT = False
+
+# HTTP caching (Cache-Control max-age, seconds) for the read endpoints
+RATES_CLOSED_RANGE_MAX_AGE = 60 * 60 * 24
+RATES_OPEN_RANGE_MAX_AGE = 60
+CURRENCIES_MAX_AGE = 60 * 5
+
+# Server-side cache of rate range responses (timeouts in seconds). Writes
+# invalidate entries by generation, stale ones are only dropped by expiry
+RATES_CACHE_ALIAS = 'default'
+RATES_CACHE_CLOSED_RANGE_TIMEOUT = 60 * 60 * 24 * 7
+RATES_CACHE_OPEN_RANGE_TIMEOUT = 60
+# Streamed (Arrow / Parquet) responses larger than this (bytes) are not cached
+RATES_CACHE_MAX_STREAMED_BODY = 8 * 1024 * 1024
+# Rows per Arrow record batch / Parquet row group in streamed responses
+RATES_COLUMNAR_BATCH_SIZE = 64 * 1024
+
+# Seconds between checks of the registry version stamp (in the database) for
+# changes made by other processes; not polled while the invalidation bus listens
+REGISTRY_VERSION_CHECK_SECONDS = 1.0
+
+# Maximum number of days a rate is carried forward by as-of lookups and gap filling
+RATES_AS_OF_MAX_LOOKBACK_DAYS = 31
+
+# Change feed (/rates/changes/): page size cap, and how many seconds recent
+# writes are held back so transactions still committing are not skipped
+CHANGE_FEED_MAX_PAGE_SIZE = 10000
+CHANGE_FEED_SAFETY_LAG_SECONDS = 5
+
+# Live rate stream (/rates/stream/): per-client queue size, idle keep-alive
+# interval, and the directory of the Unix datagram sockets that connect the
+# processes of one host (unset: in-process delivery only)
+RATE_STREAM_QUEUE_SIZE = 100
+RATE_STREAM_HEARTBEAT_SECONDS = 15
+RATE_STREAM_SOCKET_DIR = os.environ.get('RATE_STREAM_SOCKET_DIR') or None
+
+# Cross-process cache invalidation (LISTEN/NOTIFY on PostgreSQL): written rates,
+# currencies and providers are evicted from the caches of every web process
+INVALIDATION_BUS_ENABLED = os.environ.get('INVALIDATION_BUS', '1') != '0'
+INVALIDATION_BUS_CHANNEL = 'mycurrency_invalidation'
+
+# Tracing: share of new traces recorded (incoming traceparent headers decide
+# for themselves), the exporter class and the JSON lines file it writes
+TRACING_SAMPLE_RATE = float(os.environ.get('TRACING_SAMPLE_RATE', '0.01'))
+TRACING_EXPORTER = os.environ.get('TRACING_EXPORTER', 'MyCurrency.tracing.JsonLinesExporter')
+TRACING_EXPORT_PATH = os.environ.get('TRACING_EXPORT_PATH') or os.path.join(BASE_DIR, 'traces', 'spans.jsonl')
+
+# Stale-while-revalidate for /convert/: serve a stored rate up to this age while today's is fetched
+RATES_STALE_MAX_AGE_HOURS = int(os.environ.get('RATES_STALE_MAX_AGE_HOURS', '72'))
+
+# Memory-mapped rate matrix shared by all workers (built with `manage.py build_rate_snapshot`)
+RATE_SNAPSHOT_PATH = os.environ.get('RATE_SNAPSHOT_PATH') or None
+
+# Write-behind buffer for rates fetched on the request path (flushed every
+# RATE_WRITE_BEHIND_INTERVAL seconds, at RATE_WRITE_BEHIND_MAX_ROWS rows and at exit)
+RATE_WRITE_BEHIND_ENABLED = os.environ.get('RATE_WRITE_BEHIND', '1') != '0'
+RATE_WRITE_BEHIND_INTERVAL = 1.0
+RATE_WRITE_BEHIND_MAX_ROWS = 500
+# Rejected writes of one rate before it is dropped, and rates held at most
+RATE_WRITE_BEHIND_MAX_ATTEMPTS = 5
+RATE_WRITE_BEHIND_MAX_PENDING = 50000
+
+# Retention of the rate history (`manage.py apply_retention`): per-age policies,
+# 'compact' keeps only the best provider's row per pair and day, 'archive'
+# moves rows to compressed files in RATE_RETENTION_ARCHIVE_DIR and deletes them
+RATE_RETENTION_POLICIES = [
+    {'action': 'compact', 'after_days': 90},
+    {'action': 'archive', 'after_days': 365 * 5},
+]
+RATE_RETENTION_ARCHIVE_DIR = os.environ.get('RATE_RETENTION_ARCHIVE_DIR') or str(BASE_DIR / 'rate_archive')
+RATE_RETENTION_BATCH_SIZE = 5000
+# Seconds to sleep between batches, to leave room for live traffic
+RATE_RETENTION_BATCH_PAUSE = 0.05